@@ -31,6 +31,50 @@ class AdviceAgent:
         except Exception as e:
             return f"An error occurred while getting advice from the LLM: {e}"
 
+    def _analyze_paragraph_request(self, target_paragraph: str, context_paragraphs: List[str] = None) -> Dict[str, Any]:
+        # 准备上下文信息
+        context = ""
+        if context_paragraphs and len(context_paragraphs) > 0:
+            context = "段落上下文:\n" + "\n".join([f"[段落 {i+1}] {para}" for i, para in enumerate(context_paragraphs)])
+
+        # 构建提示词
+        prompt = f"""请分析以下目标段落，并提供具体的修改建议。返回JSON格式的结果，包含以下字段：
+        - suggestions: 修改建议列表，每条建议包含issue(问题)和solution(解决方案)
+        - improved_version: 根据建议修改后的完整段落内容
+
+        目标段落:
+        {target_paragraph}
+
+        {context}
+        """
+
+        return dict(
+            model=self.model,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": "你是一个专业的学术写作顾问，擅长分析文本并提供具体、有建设性的修改建议。"},
+                {"role": "user", "content": prompt}
+            ]
+        )
+
+    @staticmethod
+    def _parse_advice_response(response, target_paragraph: str) -> Dict[str, Any]:
+        # 解析结果
+        result = response.choices[0].message.content
+        advice = eval(result.replace('null', 'None').replace('true', 'True').replace('false', 'False'))
+        advice["original"] = target_paragraph
+
+        return advice
+
+    @staticmethod
+    def _advice_error(target_paragraph: str, error: Exception) -> Dict[str, Any]:
+        print(f"Error analyzing paragraph: {error}")
+        return {
+            "original": target_paragraph,
+            "suggestions": [{"issue": "处理错误", "solution": f"发生错误: {str(error)}"}],
+            "improved_version": target_paragraph
+        }
+
     def analyze_paragraph(self, target_paragraph: str, context_paragraphs: List[str] = None) -> Dict[str, Any]:
         """
         分析目标段落内容并基于上下文给出修改建议
@@ -51,46 +95,31 @@ class AdviceAgent:
             }
 
         try:
-            # 准备上下文信息
-            context = ""
-            if context_paragraphs and len(context_paragraphs) > 0:
-                context = "段落上下文:\n" + "\n".join([f"[段落 {i+1}] {para}" for i, para in enumerate(context_paragraphs)])
-
-            # 构建提示词
-            prompt = f"""请分析以下目标段落，并提供具体的修改建议。返回JSON格式的结果，包含以下字段：
-            - suggestions: 修改建议列表，每条建议包含issue(问题)和solution(解决方案)
-            - improved_version: 根据建议修改后的完整段落内容
-
-            目标段落:
-            {target_paragraph}
-
-            {context}
-            """
-
             response = self.client.chat.completions.create(
-                model=self.model,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "你是一个专业的学术写作顾问，擅长分析文本并提供具体、有建设性的修改建议。"},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-
-            # 解析结果
-            result = response.choices[0].message.content
-            advice = eval(result.replace('null', 'None').replace('true', 'True').replace('false', 'False'))
-            advice["original"] = target_paragraph
-
-            return advice
+                **self._analyze_paragraph_request(target_paragraph, context_paragraphs))
+            return self._parse_advice_response(response, target_paragraph)
 
         except Exception as e:
-            print(f"Error analyzing paragraph: {e}")
+            return self._advice_error(target_paragraph, e)
+
+    async def aanalyze_paragraph(self, target_paragraph: str, context_paragraphs: List[str] = None) -> Dict[str, Any]:
+        """analyze_paragraph 的异步版本"""
+        if self.client is None:
             return {
                 "original": target_paragraph,
-                "suggestions": [{"issue": "处理错误", "solution": f"发生错误: {str(e)}"}],
-                "improved_version": target_paragraph
+                "suggestions": [],
+                "improved_version": target_paragraph,
+                "error": "LLM客户端未初始化"
             }
 
+        try:
+            response = await self.llm.acreate(
+                **self._analyze_paragraph_request(target_paragraph, context_paragraphs))
+            return self._parse_advice_response(response, target_paragraph)
+
+        except Exception as e:
+            return self._advice_error(target_paragraph, e)
+
     def analyze_para_info(self, para_info: ParaInfo, context_paras: List[ParaInfo] = None) -> Dict[str, Any]:
         """
         分析段落信息对象并给出修改建议
@@ -118,6 +147,13 @@ class AdviceAgent:
 
         return result
 
+    async def aanalyze_para_info(self, para_info: ParaInfo, context_paras: List[ParaInfo] = None) -> Dict[str, Any]:
+        """analyze_para_info 的异步版本"""
+        context_paragraphs = [para.content for para in context_paras] if context_paras else None
+        result = await self.aanalyze_paragraph(para_info.content, context_paragraphs)
+        result["para_type"] = para_info.type.value
+        return result
+
     def analyze_paragraph_manager(self, para_manager: ParagraphManager, para_index: int, context_range: int = 2) -> Dict[str, Any]:
         """
         分析段落管理器中的指定段落
@@ -0,0 +1,110 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+# 异步执行器：在一个后台线程中常驻事件循环，同步代码（Flask 请求、检查流水线）
+# 通过它一次性提交成百上千个大模型请求，由单个线程完成调度
+
+# 同一批次中同时在途的协程上限，超出的条目等待空位后才创建协程（背压）
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+async def gather_bounded(func: Callable[[Any], Awaitable[Any]], items: Iterable[Any],
+                         max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, return_exceptions: bool = True) -> List[Any]:
+    """
+    并发执行 func(item)，同时在途的协程不超过 max_in_flight
+
+    固定数量的工作协程从同一个迭代器中取条目，条目只在有空位时才转换为协程，
+    输入再长也不会一次性创建全部任务
+
+    Args:
+        func: 异步函数
+        items: 输入条目
+        max_in_flight: 在途协程上限
+        return_exceptions: 为 True 时异常作为对应位置的结果返回，否则取消其余任务并抛出
+
+    Returns:
+        List[Any]: 与输入顺序一致的结果列表
+    """
+    items = list(items)
+    results: List[Any] = [None] * len(items)
+    if not items:
+        return results
+    pending = iter(enumerate(items))
+
+    async def worker():
+        for index, item in pending:
+            try:
+                results[index] = await func(item)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[index] = e
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(min(max(1, max_in_flight), len(items)))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+    return results
+
+
+class AsyncRunner:
+    """常驻后台线程的事件循环，供同步代码提交协程"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='llm-async-runner', daemon=True)
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+            return self._loop
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """提交协程，返回可在任意线程等待的 Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """提交协程并阻塞等待结果，不能在执行器自身的线程中调用"""
+        if self._thread is not None and threading.current_thread() is self._thread:
+            raise RuntimeError("不能在异步执行器线程中同步等待协程")
+        return self.submit(coro).result(timeout)
+
+    def map(self, func: Callable[[Any], Awaitable[Any]], items: Iterable[Any],
+            max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, return_exceptions: bool = True) -> List[Any]:
+        """
+        在事件循环中并发执行 func(item) 并等待全部完成
+
+        Args:
+            func: 异步函数
+            items: 输入条目
+            max_in_flight: 在途协程上限，各服务商的并发上限另由 keys.json 中的 max_concurrency 约束
+            return_exceptions: 为 True 时异常作为对应位置的结果返回
+
+        Returns:
+            List[Any]: 与输入顺序一致的结果列表
+        """
+        return self.run(gather_bounded(func, items, max_in_flight, return_exceptions))
+
+
+_RUNNER: Optional[AsyncRunner] = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def get_runner() -> AsyncRunner:
+    """获取进程共享的异步执行器"""
+    global _RUNNER
+    with _RUNNER_LOCK:
+        if _RUNNER is None:
+            _RUNNER = AsyncRunner()
+        return _RUNNER
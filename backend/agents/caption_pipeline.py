@@ -0,0 +1,257 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from backend.agents.async_runner import get_runner
+from backend.preparation.para_type import ParagraphManager, ParsedParaType
+
+# 批量题注生成：收集缺少题注的图、表，在有界线程池中并发请求，
+# 按模型限速，并按内容哈希缓存题注
+
+# 题注缓存的条目上限，超过时淘汰最久未使用的题注
+DEFAULT_CAPTION_CACHE_SIZE = 1024
+
+# 题注缓存：(模型, 内容哈希) -> 题注，只保存模型实际生成的题注
+_CAPTION_CACHE: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+# 模型名 -> 限速器，同一模型的所有调用方共享
+_RATE_LIMITERS: Dict[str, "RateLimiter"] = {}
+_LIMITER_LOCK = threading.Lock()
+
+
+class CaptionUnavailableError(Exception):
+    """没有得到模型生成的题注（客户端未初始化、请求失败或返回为空）"""
+
+
+class RateLimiter:
+    """按每分钟请求数限速，保证相邻两次请求的间隔不小于 60/rpm 秒"""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        # 预约下一个请求时间，返回需要等待的秒数
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        return wait
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self) -> None:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def get_rate_limiter(model: str, requests_per_minute: Optional[float] = None) -> RateLimiter:
+    """获取模型共享的限速器，首次创建时使用给定的限额"""
+    with _LIMITER_LOCK:
+        limiter = _RATE_LIMITERS.get(model)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute)
+            _RATE_LIMITERS[model] = limiter
+        return limiter
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_cached_caption(model: str, digest: str) -> Optional[str]:
+    with _CACHE_LOCK:
+        caption = _CAPTION_CACHE.get((model, digest))
+        if caption is not None:
+            _CAPTION_CACHE.move_to_end((model, digest))
+        return caption
+
+
+def set_cached_caption(model: str, digest: str, caption: str, max_entries: int = DEFAULT_CAPTION_CACHE_SIZE) -> None:
+    with _CACHE_LOCK:
+        _CAPTION_CACHE[(model, digest)] = caption
+        _CAPTION_CACHE.move_to_end((model, digest))
+        while len(_CAPTION_CACHE) > max_entries:
+            _CAPTION_CACHE.popitem(last=False)
+
+
+def table_to_text(table_data) -> str:
+    """把表格数据转换为按行排列的文本"""
+    if not isinstance(table_data, list):
+        return str(table_data)
+    lines = []
+    for row in table_data:
+        cells = row if isinstance(row, list) else [row]
+        lines.append(' | '.join(str(cell) for cell in cells))
+    return '\n'.join(lines)
+
+
+@dataclass
+class CaptionRequest:
+    """一个待生成题注的图或表"""
+    key: Hashable
+    kind: str
+    image_path: Optional[str] = None
+    table_content: Optional[str] = None
+
+
+class CaptionPipeline:
+    """
+    批量题注生成管线
+
+    相同内容的图、表只请求一次，请求受模型限速器约束；提供异步生成函数时
+    由异步执行器在单个线程中并发发出，否则在有界线程池中执行。
+    生成函数在没有得到题注时应抛出异常，失败的请求不写入题注缓存
+    """
+
+    def __init__(self, caption_image: Optional[Callable[[str], str]] = None,
+                 caption_table: Optional[Callable[[str], str]] = None,
+                 model: str = 'default', max_workers: int = 4,
+                 requests_per_minute: Optional[float] = None,
+                 acaption_image: Optional[Callable[[str], Awaitable[str]]] = None,
+                 acaption_table: Optional[Callable[[str], Awaitable[str]]] = None):
+        self.caption_image = caption_image
+        self.caption_table = caption_table
+        self.acaption_image = acaption_image
+        self.acaption_table = acaption_table
+        self.model = model
+        self.max_workers = max_workers
+        self.limiter = get_rate_limiter(model, requests_per_minute)
+
+    def collect(self, para_manager: ParagraphManager) -> List[CaptionRequest]:
+        """
+        收集段落管理器中缺少题注的图、表
+
+        Args:
+            para_manager: 段落管理器
+
+        Returns:
+            List[CaptionRequest]: 以段落下标为键的请求列表
+        """
+        requests = []
+        for index, para in enumerate(para_manager.paragraphs):
+            if para.content.strip() or not para.meta:
+                continue
+            if para.type == ParsedParaType.FIGURES and para.meta.get('image_path') and (self.caption_image or self.acaption_image):
+                requests.append(CaptionRequest(index, 'figure', image_path=para.meta['image_path']))
+            elif para.type == ParsedParaType.TABLES and para.meta.get('table_data') and (self.caption_table or self.acaption_table):
+                requests.append(CaptionRequest(index, 'table', table_content=table_to_text(para.meta['table_data'])))
+        return requests
+
+    def _digest(self, request: CaptionRequest) -> Optional[str]:
+        try:
+            if request.kind == 'figure':
+                with open(request.image_path, 'rb') as f:
+                    return content_hash(f.read())
+            return content_hash(request.table_content.encode('utf-8'))
+        except Exception as e:
+            print(f"读取题注内容失败: {str(e)}")
+            return None
+
+    def _generate(self, request: CaptionRequest) -> str:
+        self.limiter.acquire()
+        if request.kind == 'figure':
+            return self.caption_image(request.image_path)
+        return self.caption_table(request.table_content)
+
+    async def _agenerate(self, request: CaptionRequest) -> str:
+        await self.limiter.aacquire()
+        if request.kind == 'figure':
+            if self.acaption_image:
+                return await self.acaption_image(request.image_path)
+            caption, argument = self.caption_image, request.image_path
+        else:
+            if self.acaption_table:
+                return await self.acaption_table(request.table_content)
+            caption, argument = self.caption_table, request.table_content
+        # 只有同步生成函数时在线程池中执行
+        return await asyncio.get_running_loop().run_in_executor(None, caption, argument)
+
+    def _run_jobs(self, jobs: List[Tuple[Optional[str], CaptionRequest]]) -> List[object]:
+        """执行请求，返回与 jobs 顺序一致的题注或异常"""
+        if self.acaption_image or self.acaption_table:
+            return get_runner().map(lambda job: self._agenerate(job[1]), jobs, max_in_flight=self.max_workers)
+
+        results: List[object] = [None] * len(jobs)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+            futures = {executor.submit(self._generate, request): i for i, (_, request) in enumerate(jobs)}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+        return results
+
+    def run(self, requests: List[CaptionRequest]) -> Dict[Hashable, str]:
+        """
+        并发生成题注
+
+        Args:
+            requests: 请求列表
+
+        Returns:
+            Dict[Hashable, str]: 请求键 -> 题注
+        """
+        captions = {}
+        # 内容哈希 -> 共享该内容的请求，相同图片只请求一次
+        pending: Dict[str, List[CaptionRequest]] = {}
+        uncached = []
+
+        for request in requests:
+            digest = self._digest(request)
+            if digest is None:
+                uncached.append(request)
+                continue
+            cached = get_cached_caption(self.model, digest)
+            if cached is not None:
+                captions[request.key] = cached
+                continue
+            pending.setdefault(digest, []).append(request)
+
+        jobs = [(digest, group[0]) for digest, group in pending.items()] + [(None, request) for request in uncached]
+        if not jobs:
+            return captions
+
+        for (digest, request), caption in zip(jobs, self._run_jobs(jobs)):
+            if isinstance(caption, Exception):
+                print(f"生成题注失败: {str(caption)}")
+                continue
+            if not caption:
+                print("生成题注失败: 模型返回为空")
+                continue
+            if digest is None:
+                captions[request.key] = caption
+                continue
+            set_cached_caption(self.model, digest, caption)
+            for grouped in pending[digest]:
+                captions[grouped.key] = caption
+
+        return captions
+
+    def fill_missing_captions(self, para_manager: ParagraphManager) -> Dict[int, str]:
+        """
+        为缺少题注的图、表生成题注并写回段落内容
+
+        Args:
+            para_manager: 段落管理器
+
+        Returns:
+            Dict[int, str]: 段落下标 -> 生成的题注
+        """
+        captions = self.run(self.collect(para_manager))
+        for index, caption in captions.items():
+            para_manager.update_para(index, content=caption)
+        return captions
@@ -0,0 +1,156 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from backend.agents.scheduler import ProviderUnavailableError, track_usage
+from backend.preparation.para_type import ParsedParaType
+
+# 分级路由：段落分类先交给小而快的模型，置信度低于阈值或与规则判断不一致时
+# 才升级到更大的模型，并统计每一级的耗时、用量、费用和升级率
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+
+# 预测函数：接收代理对象，返回 (段落类型, 置信度)
+PredictFn = Callable[[Any], Tuple[ParsedParaType, float]]
+
+
+@dataclass
+class TierStats:
+    calls: int = 0
+    settled: int = 0
+    escalated: int = 0
+    latency: float = 0.0
+    requests: int = 0
+    tokens: int = 0
+
+
+class CascadeRouter:
+    """
+    段落分类的分级路由
+
+    tiers 按从快到慢排列，每一级是 (名称, FormatAgent)；
+    只有一级时等价于直接调用该代理
+    """
+
+    def __init__(self, tiers: List[Tuple[str, Any]], threshold: float = DEFAULT_CONFIDENCE_THRESHOLD):
+        if not tiers:
+            raise ValueError("分级路由至少需要一个模型")
+        self.tiers = tiers
+        self.threshold = threshold
+        self.stats: Dict[str, TierStats] = {name: TierStats() for name, _ in tiers}
+        self._lock = threading.Lock()
+
+    @property
+    def fast_agent(self):
+        """第一级（最便宜）的代理，用于大批量的验证请求"""
+        return self.tiers[0][1]
+
+    @property
+    def strong_agent(self):
+        return self.tiers[-1][1]
+
+    def record(self, tier: str, latency: float, requests: int = 0, tokens: int = 0,
+               settled: bool = True) -> None:
+        """记录一次调用的耗时和用量"""
+        with self._lock:
+            stats = self.stats[tier]
+            stats.calls += 1
+            stats.latency += latency
+            stats.requests += requests
+            stats.tokens += tokens
+            if settled:
+                stats.settled += 1
+            else:
+                stats.escalated += 1
+
+    def _accept(self, para_type: ParsedParaType, confidence: float, rule_type: Optional[ParsedParaType]) -> bool:
+        if confidence < self.threshold:
+            return False
+        return rule_type is None or para_type == rule_type
+
+    def predict(self, predict: PredictFn, rule_type: Optional[ParsedParaType] = None) -> Tuple[ParsedParaType, float, str]:
+        """
+        逐级预测段落类型，置信度足够且与规则判断一致时停止
+
+        Args:
+            predict: 预测函数，接收代理对象
+            rule_type: 规则引擎给出的类型（可选），不一致时升级
+
+        Returns:
+            Tuple[ParsedParaType, float, str]: 段落类型、置信度、给出结果的级别名称
+        """
+        result = None
+        for level, (name, agent) in enumerate(self.tiers):
+            last = level == len(self.tiers) - 1
+            start = time.monotonic()
+            with track_usage() as usage:
+                try:
+                    para_type, confidence = predict(agent)
+                except ProviderUnavailableError:
+                    # 低级别模型不可用时直接升级
+                    if last:
+                        raise
+                    self.record(name, time.monotonic() - start, usage.requests, usage.tokens, settled=False)
+                    continue
+            settled = last or self._accept(para_type, confidence, rule_type)
+            self.record(name, time.monotonic() - start, usage.requests, usage.tokens, settled)
+            result = (para_type, confidence, name)
+            if settled:
+                break
+        return result
+
+    async def timed(self, tier: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """在异步任务中执行某一级的调用并记录耗时和用量"""
+        start = time.monotonic()
+        with track_usage() as usage:
+            result = await call()
+        self.record(tier, time.monotonic() - start, usage.requests, usage.tokens)
+        return result
+
+    def _cost_per_1k(self, agent) -> float:
+        llm = getattr(agent, 'llm', None)
+        if llm is None or not llm.current_model:
+            return 0.0
+        return float(llm.models_config.get(llm.current_model, {}).get('cost_per_1k_tokens', 0.0))
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """每一级的调用次数、平均耗时、用量、费用（keys.json 中的 cost_per_1k_tokens）和升级率"""
+        report = {}
+        with self._lock:
+            for name, agent in self.tiers:
+                stats = self.stats[name]
+                report[name] = {
+                    'calls': stats.calls,
+                    'settled': stats.settled,
+                    'escalated': stats.escalated,
+                    'escalation_rate': round(stats.escalated / stats.calls, 3) if stats.calls else 0.0,
+                    'avg_latency': round(stats.latency / stats.calls, 3) if stats.calls else 0.0,
+                    'requests': stats.requests,
+                    'tokens': stats.tokens,
+                    'cost': round(stats.tokens / 1000 * self._cost_per_1k(agent), 4),
+                }
+        return report
+
+
+def build_cascade_router(strong_agent, fast_model: Optional[str] = None,
+                         threshold: float = DEFAULT_CONFIDENCE_THRESHOLD) -> CascadeRouter:
+    """
+    以 strong_agent 为最后一级创建分级路由，快速模型无法加载时只使用一级
+
+    Args:
+        strong_agent: 大模型的 FormatAgent
+        fast_model: keys.json 中快速模型的名称（可选）
+        threshold: 升级的置信度阈值
+
+    Returns:
+        CascadeRouter: 分级路由
+    """
+    tiers = []
+    if fast_model and fast_model != strong_agent.model:
+        from backend.agents.format_agent import FormatAgent
+        try:
+            tiers.append((fast_model, FormatAgent(fast_model)))
+        except ValueError as e:
+            print(f"快速模型 {fast_model} 不可用，段落分类只使用 {strong_agent.model}: {e}")
+    tiers.append((strong_agent.model, strong_agent))
+    return CascadeRouter(tiers, threshold)
@@ -4,12 +4,15 @@ from agents.setting import LLMs
 from agents.format_agent import FormatAgent
 from agents.editor_agent import EditorAgent
 from agents.advice_agent import AdviceAgent
+from agents.intent_classifier import IntentClassifier
+from backend.agents.conversation_state import ConversationState
 from preparation.para_type import ParagraphManager
-from utils.utils import parse_llm_json_response
+from backend.agents.structured_output import StructuredOutputError, structured_completion, intent_schema
 
 class CommunicateAgent:
     def __init__(self, model_name='qwen-plus'):
-        # 初始化基本LLM客户端
+        # 初始化基本LLM客户端，客户端来自进程级注册表，子代理复用同一连接池
+        self.model_name = model_name
         self.llm = LLMs()
         try:
             self.llm.set_model(model_name)
@@ -26,6 +29,24 @@ class CommunicateAgent:
         self.editor_agent = None
         self.advice_agent = None
 
+        # 本地意图分类器，常见指令不经过大模型
+        self.intent_classifier = IntentClassifier()
+
+    def route_intent(self, user_message: str) -> Dict:
+        """
+        确定处理请求的代理：先在本地按关键词规则和示例语句判断，不能确定时再调用大模型分析
+
+        Args:
+            user_message: 用户消息内容
+
+        Returns:
+            Dict: 包含意图分析结果
+        """
+        intent = self.intent_classifier.classify(user_message)
+        if intent is not None:
+            return intent
+        return self.analyze_intent(user_message)
+
     def analyze_intent(self, user_message: str) -> Dict:
         """
         分析用户意图，确定应该使用哪个代理来处理请求
@@ -59,45 +80,49 @@ class CommunicateAgent:
                     4. 当用户提到"优化文档格式"或"下载格式化后的文档"时，应返回 {"agent": "format", "function": "optimize_document_format"}
                     """
 
-            # 如果是doubao系列模型，添加额外的JSON格式要求
-            if hasattr(self.llm, 'is_doubao_model') and self.llm.is_doubao_model:
-                system_content += "\n请确保你的回复是有效的JSON格式，例如: {\"agent\": \"format\", \"function\": \"check_format\", \"reason\": \"用户请求检查文档格式\"}"
-
             # 准备消息列表
             messages = [
                 {"role": "system", "content": system_content},
                 {"role": "user", "content": user_message}
             ]
 
-            # 根据模型类型决定是否使用response_format参数
-            if hasattr(self.llm, 'supports_json_response_format') and self.llm.supports_json_response_format():
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    response_format={"type": "json_object"},
-                    messages=messages
-                )
-            else:
-                # 对于不支持response_format的模型（如doubao系列），不使用该参数
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages
-                )
-
-            # 使用parse_llm_json_response函数解析大模型返回的内容
-            result = parse_llm_json_response(response.choices[0].message.content)
-
-            # 检查解析结果是否包含必要的字段
-            if not isinstance(result, dict) or 'agent' not in result or 'function' not in result:
-                print(f"解析结果缺少必要字段: {result}")
+            # 输出方式由结构化输出层按模型能力决定，结果按意图 Schema 校验
+            try:
+                return structured_completion(self.llm, dict(model=self.model, messages=messages), intent_schema(), 'user_intent')
+            except StructuredOutputError as e:
+                print(f"意图分析结果无效: {e}")
                 return {"agent": "communicate", "function": "chat", "reason": "解析结果缺少必要字段，默认使用对话功能"}
 
-            return result
-
         except Exception as e:
             print(f"Error analyzing intent: {e}")
             return {"agent": "communicate", "function": "chat", "reason": f"发生错误，默认使用对话功能: {str(e)}"}
 
-    def get_response(self, user_message: str, doc_content: str, para_manager: Optional[ParagraphManager] = None, config_path: Optional[str] = None, doc_path: Optional[str] = None) -> str:
+    def _check_document(self, doc_path: str, config_path: str, state: Optional[ConversationState] = None):
+        """完整检查文档格式，会话中同一文档和配置已检查过时直接复用结果"""
+        if state is not None:
+            cached = state.cached_check_results(doc_path, config_path)
+            if cached is not None:
+                print("复用会话中的格式检查结果")
+                return cached
+        errors, para_manager = self.format_agent.analyze_format_issues(doc_path, config_path)
+        if state is not None:
+            state.set_check_results(errors, para_manager)
+        return errors, para_manager
+
+    def _format_errors(self, doc_path: str, config_path: str, para_manager: Optional[ParagraphManager],
+                       state: Optional[ConversationState] = None):
+        """格式错误列表：优先使用会话中的检查结果，其次检查已有的段落管理器，都没有时完整检查文档"""
+        if state is not None:
+            cached = state.cached_check_results(doc_path, config_path)
+            if cached is not None:
+                print("复用会话中的格式检查结果")
+                return cached
+        if not para_manager:
+            return self._check_document(doc_path, config_path, state)
+        return self.format_agent.check_paragraph_manager(para_manager, config_path), para_manager
+
+    def get_response(self, user_message: str, doc_content: str, para_manager: Optional[ParagraphManager] = None, config_path: Optional[str] = None, doc_path: Optional[str] = None,
+                     state: Optional[ConversationState] = None) -> str:
         """
         获取对用户消息的回复
 
@@ -107,12 +132,19 @@ class CommunicateAgent:
             para_manager: 可选的段落管理器实例
             config_path: 可选的配置文件路径
             doc_path: 可选的文档路径
+            state: 可选的会话状态，提供时复用其中的检查结果、文档摘要和对话历史
 
         Returns:
             str: 回复内容
         """
+        # 提供给子代理的文档上下文：有会话时使用紧凑摘要，否则截取全文开头
+        if state is not None:
+            doc_context = f"文档摘要：\n{state.summary}"
+        else:
+            doc_context = f"文档全文：\n{doc_content[:2000]}..."
+
         # 1. 分析用户意图
-        intent = self.analyze_intent(user_message)
+        intent = self.route_intent(user_message)
         agent_type = intent.get("agent", "communicate")
         function_name = intent.get("function", "chat")
         print(f"意图分析结果: {intent}")
@@ -121,7 +153,7 @@ class CommunicateAgent:
         if agent_type == "format":
             # 初始化格式代理（如果尚未初始化）
             if self.format_agent is None:
-                self.format_agent = FormatAgent(self.model)
+                self.format_agent = FormatAgent(self.model_name)
 
             # 处理新增的格式分析和修复功能
             if function_name == "analyze_format_issues":
@@ -130,10 +162,10 @@ class CommunicateAgent:
 
                 # 初始化格式代理（如果尚未初始化）
                 if self.format_agent is None:
-                    self.format_agent = FormatAgent(self.model)
+                    self.format_agent = FormatAgent(self.model_name)
 
                 # 分析文档格式问题
-                errors, para_manager = self.format_agent.analyze_format_issues(doc_path, config_path)
+                errors, para_manager = self._check_document(doc_path, config_path, state)
 
                 # 如果没有错误
                 if not errors or len(errors) == 0:
@@ -150,14 +182,10 @@ class CommunicateAgent:
 
                 # 初始化格式代理（如果尚未初始化）
                 if self.format_agent is None:
-                    self.format_agent = FormatAgent(self.model)
+                    self.format_agent = FormatAgent(self.model_name)
 
-                # 如果没有提供错误列表，先分析文档格式问题
-                if not para_manager:
-                    errors, para_manager = self.format_agent.analyze_format_issues(doc_path, config_path)
-                else:
-                    # 使用提供的段落管理器检查格式
-                    errors = self.format_agent.check_paragraph_manager(para_manager, config_path)
+                # 复用会话中的检查结果，没有时再检查
+                errors, para_manager = self._format_errors(doc_path, config_path, para_manager, state)
 
                 # 提供修复建议
                 return self.format_agent.provide_format_fix_suggestions(errors, doc_content)
@@ -168,14 +196,10 @@ class CommunicateAgent:
 
                 # 初始化格式代理（如果尚未初始化）
                 if self.format_agent is None:
-                    self.format_agent = FormatAgent(self.model)
+                    self.format_agent = FormatAgent(self.model_name)
 
-                # 如果没有提供错误列表，先分析文档格式问题
-                if not para_manager:
-                    errors, para_manager = self.format_agent.analyze_format_issues(doc_path, config_path)
-                else:
-                    # 使用提供的段落管理器检查格式
-                    errors = self.format_agent.check_paragraph_manager(para_manager, config_path)
+                # 复用会话中的检查结果，没有时再检查
+                errors, para_manager = self._format_errors(doc_path, config_path, para_manager, state)
 
                 # 生成格式修正报告
                 result = self.format_agent.generate_format_report(doc_path, errors, para_manager)
@@ -191,14 +215,10 @@ class CommunicateAgent:
 
                 # 初始化格式代理（如果尚未初始化）
                 if self.format_agent is None:
-                    self.format_agent = FormatAgent(self.model)
+                    self.format_agent = FormatAgent(self.model_name)
 
-                # 如果没有提供段落管理器，先分析文档格式问题
-                if not para_manager:
-                    errors, para_manager = self.format_agent.analyze_format_issues(doc_path, config_path)
-                else:
-                    # 使用提供的段落管理器检查格式
-                    errors = self.format_agent.check_paragraph_manager(para_manager, config_path)
+                # 复用会话中的检查结果，没有时再检查
+                errors, para_manager = self._format_errors(doc_path, config_path, para_manager, state)
 
                 # 优化文档格式
                 result = self.format_agent.optimize_document_format(doc_path, config_path, para_manager, errors)
@@ -232,44 +252,54 @@ class CommunicateAgent:
                     return "无法解析段落索引，请提供有效的段落编号"
             else:
                 # 调用format_agent的默认处理方法，传入文档全文
-                enhanced_message = f"基于以下文档全文的上下文，请处理用户请求：\n\n文档全文：\n{doc_content[:2000]}...\n\n用户请求：\n{user_message}"
+                enhanced_message = f"基于以下文档的上下文，请处理用户请求：\n\n{doc_context}\n\n用户请求：\n{user_message}"
                 return self.format_agent.process(enhanced_message, function_name)
 
         elif agent_type == "editor":
             # 初始化编辑代理（如果尚未初始化）
             if self.editor_agent is None:
-                self.editor_agent = EditorAgent(self.model)
+                self.editor_agent = EditorAgent(self.model_name)
 
             # 根据function_name调用相应的编辑功能
             if function_name == "generate_caption":
+                # 有段落信息时为文档中缺少题注的图、表批量生成题注
+                manager = para_manager or (state.para_manager if state is not None else None)
+                if manager is not None:
+                    captions = self.editor_agent.generate_missing_captions(manager)
+                    if not captions:
+                        return "文档中没有需要生成题注的图表，或题注生成失败。"
+                    caption_text = "\n".join(f"{i+1}. {caption}" for i, caption in enumerate(captions.values()))
+                    return f"已为 {len(captions)} 个缺少题注的图表生成题注：\n\n{caption_text}"
+
                 # 为图片生成题注时，可能需要文档上下文
-                enhanced_message = f"基于以下文档全文的上下文，请为图片生成题注：\n\n文档全文：\n{doc_content[:2000]}...\n\n图片路径：\n{user_message}"
+                enhanced_message = f"基于以下文档的上下文，请为图片生成题注：\n\n{doc_context}\n\n图片路径：\n{user_message}"
                 return self.editor_agent.get_image_caption(enhanced_message)
             else:
                 # 调用editor_agent的默认处理方法，传入文档全文作为上下文
-                enhanced_content = f"基于以下文档全文的上下文，请优化内容：\n\n文档全文：\n{doc_content[:2000]}...\n\n需要优化的内容：\n{user_message}"
+                enhanced_content = f"基于以下文档的上下文，请优化内容：\n\n{doc_context}\n\n需要优化的内容：\n{user_message}"
                 return self.editor_agent.enhance_content(enhanced_content, "text")
 
         elif agent_type == "advice":
             # 初始化建议代理（如果尚未初始化）
             if self.advice_agent is None:
-                self.advice_agent = AdviceAgent(self.model)
+                self.advice_agent = AdviceAgent(self.model_name)
 
             # 调用建议功能，传入文档全文
             return self.advice_agent.provide_advice(doc_content)
 
         else:  # 默认使用communicate对话功能
-            return self.chat(user_message, doc_content)
+            return self.chat(user_message, doc_content, state)
 
 
 
-    def chat(self, user_message: str, doc_content: str = "") -> str:
+    def chat(self, user_message: str, doc_content: str = "", state: Optional[ConversationState] = None) -> str:
         """
         与用户进行简单对话
 
         Args:
             user_message: 用户消息内容
             doc_content: 文档全文内容（可选）
+            state: 可选的会话状态，提供时带上对话历史，并把文档摘要放入各轮不变的系统消息
 
         Returns:
             str: 回复内容
@@ -278,20 +308,29 @@ class CommunicateAgent:
             if self.client is None:
                 return "抱歉，我无法处理您的请求，因为LLM客户端未初始化。"
 
-            # 如果提供了文档内容，将其作为上下文添加到用户消息中
             system_content = "你是一个友好的学术写作助手，提供有关文档格式、内容编辑和写作建议的帮助。或者在用户提出任何问题时，你都可以回答。"
-            user_content = user_message
-
-            if doc_content and len(doc_content.strip()) > 0:
-                system_content += "\n请基于用户提供的文档内容回答问题或提供建议。"
-                user_content = f"文档内容：\n{doc_content[:2000]}...\n\n用户问题：\n{user_message}"
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
+            if state is not None:
+                # 文档摘要放在系统消息中，同一会话各轮的提示词前缀相同，可被服务商缓存
+                if state.summary.strip():
+                    system_content += f"\n请基于用户提供的文档内容回答问题或提供建议。\n文档摘要：\n{state.summary}"
+                messages = [self.llm.system_message(system_content)] + list(state.history) + [
+                    {"role": "user", "content": user_message}
+                ]
+            else:
+                # 如果提供了文档内容，将其作为上下文添加到用户消息中
+                user_content = user_message
+                if doc_content and len(doc_content.strip()) > 0:
+                    system_content += "\n请基于用户提供的文档内容回答问题或提供建议。"
+                    user_content = f"文档内容：\n{doc_content[:2000]}...\n\n用户问题：\n{user_message}"
+                messages = [
                     {"role": "system", "content": system_content},
                     {"role": "user", "content": user_content}
                 ]
+
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages
             )
 
             return response.choices[0].message.content
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from backend.preparation.para_type import ParagraphManager, ParsedParaType
+
+# 会话状态：按会话保存已解析的文档、最近一次检查结果、文档摘要和对话历史，
+# 多轮对话直接复用，不再每轮重新提取文档或重跑整个检查流程
+
+# 文档摘要的字符上限，摘要放在系统提示词中，同一文档各轮保持不变以便服务商缓存提示词前缀
+DEFAULT_SUMMARY_CHARS = 1500
+
+# 保留的最近对话消息数（用户和助手各算一条）
+DEFAULT_HISTORY_MESSAGES = 8
+
+# 历史中每条消息保留的字符上限，格式报告、修复建议等长回复只保留开头，避免提示词随轮次膨胀
+DEFAULT_HISTORY_MESSAGE_CHARS = 500
+
+# 会话数量上限和空闲过期时间（秒）
+DEFAULT_MAX_SESSIONS = 64
+DEFAULT_SESSION_TTL = 2 * 60 * 60
+
+# 摘要中列出的段落类型
+_OUTLINE_TYPES = (ParsedParaType.TITLE_ZH, ParsedParaType.TITLE_EN, ParsedParaType.HEADING1, ParsedParaType.HEADING2)
+
+
+def _mtime(path: Optional[str]) -> Optional[float]:
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}……（内容较长，已截断）"
+
+
+def fingerprint(data: Any) -> str:
+    """前端传来的段落数据的指纹，内容不变时指纹相同"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+def build_doc_summary(doc_content: str, para_manager: Optional[ParagraphManager] = None,
+                      limit: int = DEFAULT_SUMMARY_CHARS) -> str:
+    """
+    在本地生成紧凑的文档摘要：标题、各级章节标题和中文摘要开头，没有段落信息时取全文开头
+
+    Args:
+        doc_content: 文档全文
+        para_manager: 段落管理器（可选）
+        limit: 摘要字符上限
+
+    Returns:
+        str: 文档摘要
+    """
+    if para_manager is None or not para_manager.paragraphs:
+        return doc_content[:limit]
+
+    outline = []
+    abstract = ''
+    for para in para_manager.paragraphs:
+        text = para.content.strip()
+        if not text:
+            continue
+        if para.type in _OUTLINE_TYPES:
+            indent = '  ' if para.type == ParsedParaType.HEADING2 else ''
+            outline.append(f"{indent}{text[:60]}")
+        elif para.type == ParsedParaType.ABSTRACT_CONTENT_ZH and not abstract:
+            abstract = text[:400]
+
+    parts = [f"段落数: {len(para_manager.paragraphs)}"]
+    if abstract:
+        parts.append(f"摘要: {abstract}")
+    if outline:
+        parts.append("结构:\n" + "\n".join(outline))
+    summary = "\n".join(parts)
+    if len(summary) < limit // 3:
+        # 结构信息很少时补充全文开头
+        summary = f"{summary}\n正文开头: {doc_content[:limit - len(summary)]}"
+    return summary[:limit]
+
+
+@dataclass
+class ConversationState:
+    """单个会话的状态"""
+    session_id: str
+    doc_path: Optional[str] = None
+    doc_mtime: Optional[float] = None
+    doc_content: str = ''
+    para_manager: Optional[ParagraphManager] = None
+    para_fingerprint: Optional[str] = None
+    config_path: Optional[str] = None
+    config_mtime: Optional[float] = None
+    # 最近一次完整检查的结果：(错误列表, 检查得到的段落管理器)
+    check_results: Optional[Tuple[List[Dict], ParagraphManager]] = None
+    history: List[Dict[str, str]] = field(default_factory=list)
+    last_access: float = field(default_factory=time.monotonic)
+    _summary: Optional[str] = field(default=None, repr=False)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    def load_document(self, doc_path: str, extract: Callable[[str], str]) -> str:
+        """
+        读取文档全文，文档路径和修改时间不变时直接复用，文档变化时清空依赖它的状态
+
+        Args:
+            doc_path: 文档路径
+            extract: 提取文档全文的函数
+
+        Returns:
+            str: 文档全文
+        """
+        mtime = _mtime(doc_path)
+        if doc_path == self.doc_path and mtime == self.doc_mtime:
+            return self.doc_content
+        self.doc_path = doc_path
+        self.doc_mtime = mtime
+        self.doc_content = extract(doc_path)
+        self.para_manager = None
+        self.para_fingerprint = None
+        self.check_results = None
+        self._summary = None
+        return self.doc_content
+
+    def set_config(self, config_path: Optional[str]) -> None:
+        """配置文件路径或内容变化时，之前的检查结果失效"""
+        mtime = _mtime(config_path)
+        if config_path != self.config_path or mtime != self.config_mtime:
+            self.config_path = config_path
+            self.config_mtime = mtime
+            self.check_results = None
+
+    def set_para_manager(self, para_manager: Optional[ParagraphManager], data_fingerprint: Optional[str] = None) -> None:
+        """替换段落管理器，之前的检查结果和摘要失效"""
+        if para_manager is self.para_manager:
+            return
+        self.para_manager = para_manager
+        self.para_fingerprint = data_fingerprint
+        self.check_results = None
+        self._summary = None
+
+    def set_check_results(self, errors: List[Dict], para_manager: ParagraphManager) -> None:
+        """保存完整检查的结果，摘要改用检查后的段落类型重新生成"""
+        self.check_results = (errors, para_manager)
+        self._summary = None
+
+    def cached_check_results(self, doc_path: Optional[str], config_path: Optional[str]) -> Optional[Tuple[List[Dict], ParagraphManager]]:
+        """同一文档和配置的最近一次检查结果，没有时返回 None"""
+        if self.check_results is None or doc_path != self.doc_path or config_path != self.config_path:
+            return None
+        return self.check_results
+
+    @property
+    def summary(self) -> str:
+        """紧凑的文档摘要，同一文档和段落信息只生成一次"""
+        if self._summary is None:
+            manager = self.check_results[1] if self.check_results else self.para_manager
+            self._summary = build_doc_summary(self.doc_content, manager)
+        return self._summary
+
+    def add_turn(self, user_message: str, reply: str, max_messages: int = DEFAULT_HISTORY_MESSAGES,
+                 max_chars: int = DEFAULT_HISTORY_MESSAGE_CHARS) -> None:
+        """记录一轮对话，过长的消息截断后保存"""
+        self.history.append({"role": "user", "content": _truncate(user_message, max_chars)})
+        self.history.append({"role": "assistant", "content": _truncate(reply, max_chars)})
+        del self.history[:-max_messages]
+
+
+class ConversationStore:
+    """按会话 id 保存会话状态，超过数量上限或空闲过期的会话被移除"""
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: float = DEFAULT_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str] = None) -> ConversationState:
+        """
+        获取会话状态，不存在时创建
+
+        Args:
+            session_id: 会话 id，为空时创建新会话
+
+        Returns:
+            ConversationState: 会话状态
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, state in self._sessions.items() if now - state.last_access > self.ttl]:
+                del self._sessions[key]
+            session_id = session_id or uuid.uuid4().hex
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = ConversationState(session_id)
+                self._sessions[session_id] = state
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_access = now
+            return state
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+_STORE: Optional[ConversationStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """获取进程共享的会话状态存储"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ConversationStore()
+        return _STORE
@@ -1,8 +1,27 @@
 import os
-import base64
-from typing import Dict, List, Any
+import json
+import asyncio
+import functools
+import threading
+import concurrent.futures
+from typing import Callable, Dict, List, Any, Optional
 from agents.setting import LLMs
+from backend.agents.caption_pipeline import (
+    CaptionPipeline,
+    CaptionUnavailableError,
+    content_hash,
+    get_cached_caption,
+    set_cached_caption
+)
+from backend.preparation.image_preprocess import prepare_image, DEFAULT_MAX_EDGE, DEFAULT_FORMAT
 from backend.preparation.para_type import ParagraphManager, ParaInfo, ParsedParaType
+from backend.utils.utils import parse_llm_json_response
+
+# 并行增强时，短于该长度的文本段落合并到同一请求中
+SHORT_PARAGRAPH_CHARS = 200
+# 单个合并请求的文本总长度和段落数上限
+BATCH_MAX_CHARS = 1200
+BATCH_MAX_ITEMS = 8
 
 class EditorAgent:
     def __init__(self, model_name='qwen-plus'):
@@ -17,83 +36,242 @@ class EditorAgent:
             self.client = None
             self.model = None
 
-    def get_image_caption(self, image_path: str) -> str:
+    def _image_options(self) -> Dict[str, Any]:
+        """图片预处理参数，可在 keys.json 的模型配置中用 image_max_edge / image_format 覆盖"""
+        model_config = {}
+        if self.llm is not None and self.llm.current_model:
+            model_config = self.llm.models_config.get(self.llm.current_model, {})
+        return {
+            'max_edge': model_config.get('image_max_edge', DEFAULT_MAX_EDGE),
+            'output_format': model_config.get('image_format', DEFAULT_FORMAT),
+        }
+
+    def _image_caption_request(self, image) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "请为这张图片生成一个简短的中文学术题注，不超过20字："
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image.data_url
+                            }
+                        }
+                    ]
+                }
+            ],
+            "max_tokens": 100
+        }
+
+    @staticmethod
+    def _caption_text(response) -> str:
+        caption = (response.choices[0].message.content or '').strip()
+        if not caption:
+            raise CaptionUnavailableError("模型未返回题注")
+        return caption
+
+    def caption_image(self, image_path: str) -> str:
         """
-        使用OpenAI兼容API获取图片题注
+        生成图片题注，只缓存模型实际生成的题注
 
         Args:
             image_path: 图片路径
 
         Returns:
             str: 生成的题注
+
+        Raises:
+            CaptionUnavailableError: 客户端未初始化或模型返回为空
+            Exception: 图片读取或请求失败
         """
-        try:
-            if self.client is None:
-                return f"图 {os.path.basename(image_path)}"
-
-            # 读取图片并转为base64
-            with open(image_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
-
-            # 调用API
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "请为这张图片生成一个简短的中文学术题注，不超过20字："
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{encoded_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                "max_tokens": 100
-            }
+        if self.client is None:
+            raise CaptionUnavailableError("LLM客户端未初始化")
 
-            response = self.client.chat.completions.create(**payload)
+        # 缩小并转换图片，相同内容的图片直接使用缓存的题注
+        image = prepare_image(image_path, **self._image_options())
+        cached = get_cached_caption(self.model, image.digest)
+        if cached is not None:
+            return cached
 
-            return response.choices[0].message.content
+        # 调用API
+        response = self.client.chat.completions.create(**self._image_caption_request(image))
 
+        caption = self._caption_text(response)
+        set_cached_caption(self.model, image.digest, caption)
+        return caption
+
+    async def acaption_image(self, image_path: str) -> str:
+        """caption_image 的异步版本，图片预处理在线程池中执行"""
+        if self.client is None:
+            raise CaptionUnavailableError("LLM客户端未初始化")
+
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(None, functools.partial(prepare_image, image_path, **self._image_options()))
+        cached = get_cached_caption(self.model, image.digest)
+        if cached is not None:
+            return cached
+
+        response = await self.llm.acreate(**self._image_caption_request(image))
+
+        caption = self._caption_text(response)
+        set_cached_caption(self.model, image.digest, caption)
+        return caption
+
+    def get_image_caption(self, image_path: str) -> str:
+        """
+        使用OpenAI兼容API获取图片题注
+
+        Args:
+            image_path: 图片路径
+
+        Returns:
+            str: 生成的题注，失败时返回以文件名组成的占位题注
+        """
+        try:
+            return self.caption_image(image_path)
         except Exception as e:
             print(f"Error generating image caption: {e}")
             return f"图 {os.path.basename(image_path)}"
 
-    def get_table_caption(self, table_content: str) -> str:
+    async def aget_image_caption(self, image_path: str) -> str:
+        """get_image_caption 的异步版本"""
+        try:
+            return await self.acaption_image(image_path)
+        except Exception as e:
+            print(f"Error generating image caption: {e}")
+            return f"图 {os.path.basename(image_path)}"
+
+    def _table_caption_request(self, table_content: str) -> Dict[str, Any]:
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "你是一个专业的学术论文助手，请为表格生成简短明确的题注。"},
+                {"role": "user", "content": f"请根据以下表格内容，生成一个简短的中文学术题注，不超过20字：\n{table_content}"}
+            ]
+        )
+
+    def caption_table(self, table_content: str) -> str:
         """
-        根据表格内容生成表格题注
+        根据表格内容生成表格题注，只缓存模型实际生成的题注
 
         Args:
             table_content: 表格内容
 
         Returns:
             str: 生成的题注
+
+        Raises:
+            CaptionUnavailableError: 客户端未初始化或模型返回为空
+            Exception: 请求失败
         """
-        try:
-            if self.client is None:
-                return "表格题注"
+        if self.client is None:
+            raise CaptionUnavailableError("LLM客户端未初始化")
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一个专业的学术论文助手，请为表格生成简短明确的题注。"},
-                    {"role": "user", "content": f"请根据以下表格内容，生成一个简短的中文学术题注，不超过20字：\n{table_content}"}
-                ]
-            )
+        digest = content_hash(table_content.encode('utf-8'))
+        cached = get_cached_caption(self.model, digest)
+        if cached is not None:
+            return cached
 
-            return response.choices[0].message.content
+        response = self.client.chat.completions.create(**self._table_caption_request(table_content))
+
+        caption = self._caption_text(response)
+        set_cached_caption(self.model, digest, caption)
+        return caption
+
+    async def acaption_table(self, table_content: str) -> str:
+        """caption_table 的异步版本"""
+        if self.client is None:
+            raise CaptionUnavailableError("LLM客户端未初始化")
+
+        digest = content_hash(table_content.encode('utf-8'))
+        cached = get_cached_caption(self.model, digest)
+        if cached is not None:
+            return cached
+
+        response = await self.llm.acreate(**self._table_caption_request(table_content))
+
+        caption = self._caption_text(response)
+        set_cached_caption(self.model, digest, caption)
+        return caption
+
+    def get_table_caption(self, table_content: str) -> str:
+        """
+        根据表格内容生成表格题注
+
+        Args:
+            table_content: 表格内容
+
+        Returns:
+            str: 生成的题注，失败时返回占位题注
+        """
+        try:
+            return self.caption_table(table_content)
+        except Exception as e:
+            print(f"Error generating table caption: {e}")
+            return "表格题注"
 
+    async def aget_table_caption(self, table_content: str) -> str:
+        """get_table_caption 的异步版本"""
+        try:
+            return await self.acaption_table(table_content)
         except Exception as e:
             print(f"Error generating table caption: {e}")
             return "表格题注"
 
+    def caption_pipeline(self, max_workers: int = 4) -> CaptionPipeline:
+        """
+        创建使用当前模型的批量题注管线，rpm/tpm 限额由模型的请求调度器统一执行
+
+        Args:
+            max_workers: 最大在途请求数
+
+        Returns:
+            CaptionPipeline: 题注管线，请求通过异步执行器发出
+        """
+        # 使用失败时抛出异常的生成函数，占位题注不会被写入缓存或段落
+        return CaptionPipeline(self.caption_image, self.caption_table,
+                               model=self.model or 'default', max_workers=max_workers,
+                               acaption_image=self.acaption_image,
+                               acaption_table=self.acaption_table)
+
+    def generate_missing_captions(self, para_manager: ParagraphManager, max_workers: int = 4) -> Dict[int, str]:
+        """
+        为段落管理器中缺少题注的图、表并发生成题注并写回段落内容
+
+        Args:
+            para_manager: 段落管理器实例
+            max_workers: 最大并发请求数
+
+        Returns:
+            Dict[int, str]: 段落下标 -> 生成的题注
+        """
+        if self.client is None:
+            return {}
+        return self.caption_pipeline(max_workers).fill_missing_captions(para_manager)
+
+    def _enhance_request(self, content: str, content_type: str) -> Dict[str, Any]:
+        type_prompts = {
+            "text": "请优化以下文本段落，使其更加专业、流畅：",
+            "table": "请优化以下表格描述，使其更加清晰、专业：",
+            "figure": "请优化以下图片描述，使其更加准确、专业："
+        }
+
+        prompt = type_prompts.get(content_type, "请优化以下内容：")
+
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "你是一个专业的学术写作助手，擅长优化文本质量。"},
+                {"role": "user", "content": f"{prompt}\n{content}"}
+            ]
+        )
+
     def enhance_content(self, content: str, content_type: str) -> str:
         """
         增强内容质量
@@ -109,27 +287,74 @@ class EditorAgent:
             if self.client is None:
                 return content
 
-            type_prompts = {
-                "text": "请优化以下文本段落，使其更加专业、流畅：",
-                "table": "请优化以下表格描述，使其更加清晰、专业：",
-                "figure": "请优化以下图片描述，使其更加准确、专业："
-            }
+            response = self.client.chat.completions.create(**self._enhance_request(content, content_type))
+
+            return response.choices[0].message.content
+
+        except Exception as e:
+            print(f"Error enhancing content: {e}")
+            return content
+
+    async def aenhance_content(self, content: str, content_type: str) -> str:
+        """enhance_content 的异步版本"""
+        try:
+            if self.client is None:
+                return content
+
+            response = await self.llm.acreate(**self._enhance_request(content, content_type))
+
+            return response.choices[0].message.content
+
+        except Exception as e:
+            print(f"Error enhancing content: {e}")
+            return content
+
+    def enhance_contents_batch(self, contents: List[str]) -> List[str]:
+        """
+        在一次请求中增强多个短文本段落
+
+        Args:
+            contents: 原始文本列表
 
-            prompt = type_prompts.get(content_type, "请优化以下内容：")
+        Returns:
+            List[str]: 与输入一一对应的增强结果，解析失败时逐段增强
+        """
+        if self.client is None or not contents:
+            return list(contents)
+        if len(contents) == 1:
+            return [self.enhance_content(contents[0], "text")]
 
+        try:
+            numbered = "\n".join(json.dumps({"id": i, "text": text}, ensure_ascii=False) for i, text in enumerate(contents))
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的学术写作助手，擅长优化文本质量。"},
-                    {"role": "user", "content": f"{prompt}\n{content}"}
+                    {"role": "user", "content": (
+                        "请分别优化以下每个文本段落，使其更加专业、流畅。"
+                        "以JSON格式返回 {\"paragraphs\": [{\"id\": 编号, \"text\": 优化后的文本}]}，不要遗漏任何段落：\n"
+                        f"{numbered}")}
                 ]
             )
+            result = parse_llm_json_response(response.choices[0].message.content)
+            items = result.get("paragraphs") if isinstance(result, dict) else None
+            enhanced = {item["id"]: item["text"] for item in items or [] if isinstance(item, dict) and "id" in item and "text" in item}
+            if len(enhanced) == len(contents) and all(i in enhanced for i in range(len(contents))):
+                return [enhanced[i] for i in range(len(contents))]
+            print("批量增强结果不完整，改为逐段增强")
+        except Exception as e:
+            print(f"Error enhancing content batch: {e}")
 
-            return response.choices[0].message.content
+        return [self.enhance_content(content, "text") for content in contents]
 
-        except Exception as e:
-            print(f"Error enhancing content: {e}")
-            return content
+    @staticmethod
+    def _content_type(para_type: ParsedParaType) -> str:
+        # 根据段落类型确定内容类型
+        if para_type == ParsedParaType.TABLES:
+            return "table"
+        if para_type == ParsedParaType.FIGURES:
+            return "figure"
+        return "text"
 
     def enhance_para_info(self, para_info: ParaInfo) -> Dict[str, Any]:
         """
@@ -141,14 +366,8 @@ class EditorAgent:
         Returns:
             Dict: 包含增强后内容的字典
         """
-        # 根据段落类型确定内容类型
         para_type = para_info.type
-        content_type = "text"  # 默认为文本
-
-        if para_type == ParsedParaType.TABLES:
-            content_type = "table"
-        elif para_type == ParsedParaType.FIGURES:
-            content_type = "figure"
+        content_type = self._content_type(para_type)
 
         # 增强内容
         original_content = para_info.content
@@ -161,13 +380,54 @@ class EditorAgent:
             "meta": para_info.meta
         }
 
-    def enhance_paragraph_manager(self, para_manager: ParagraphManager, para_indices: List[int] = None) -> Dict[str, Any]:
+    def _plan_enhance_batches(self, para_manager: ParagraphManager, indices: List[int]) -> List[List[int]]:
+        """把相邻的短文本段落合并为一个批次，其余段落各自成批"""
+        batches = []
+        current, current_chars = [], 0
+        for idx in indices:
+            para_info = para_manager.paragraphs[idx]
+            length = len(para_info.content)
+            if self._content_type(para_info.type) != "text" or length >= SHORT_PARAGRAPH_CHARS:
+                batches.append([idx])
+                continue
+            if current and (current_chars + length > BATCH_MAX_CHARS or len(current) >= BATCH_MAX_ITEMS):
+                batches.append(current)
+                current, current_chars = [], 0
+            current.append(idx)
+            current_chars += length
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run_enhance_batch(self, para_manager: ParagraphManager, batch: List[int]) -> List[Dict[str, Any]]:
+        if len(batch) == 1:
+            result = self.enhance_para_info(para_manager.paragraphs[batch[0]])
+            result["index"] = batch[0]
+            return [result]
+
+        paragraphs = [para_manager.paragraphs[idx] for idx in batch]
+        enhanced = self.enhance_contents_batch([para_info.content for para_info in paragraphs])
+        return [{
+            "original": para_info.content,
+            "enhanced": text,
+            "para_type": para_info.type.value,
+            "meta": para_info.meta,
+            "index": idx
+        } for idx, para_info, text in zip(batch, paragraphs, enhanced)]
+
+    def enhance_paragraph_manager(self, para_manager: ParagraphManager, para_indices: List[int] = None,
+                                  max_workers: int = 1,
+                                  on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                  cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
         """
         增强段落管理器中的指定段落
 
         Args:
             para_manager: 段落管理器实例
             para_indices: 要增强的段落索引列表，如果为Null则增强所有段落
+            max_workers: 并发请求数，大于1时并行增强，并把相邻的短段落合并为一个请求
+            on_result: 每个段落增强完成时的回调，用于流式推送结果
+            cancel_event: 取消标志，置位后不再发起新的请求
 
         Returns:
             Dict: 包含增强结果的字典
@@ -177,22 +437,51 @@ class EditorAgent:
         # 确定要处理的段落索引
         if para_indices is None:
             # 如果没有指定索引，则处理所有段落
-            indices = range(len(para_manager.paragraphs))
+            indices = list(range(len(para_manager.paragraphs)))
         else:
             # 过滤无效的索引
             indices = [idx for idx in para_indices if 0 <= idx < len(para_manager.paragraphs)]
 
-        # 处理每个段落
-        for idx in indices:
-            para_info = para_manager.paragraphs[idx]
-            result = self.enhance_para_info(para_info)
-            result["index"] = idx  # 添加索引信息
-            results.append(result)
-
+        def cancelled() -> bool:
+            return cancel_event is not None and cancel_event.is_set()
+
+        def collect(batch_results: List[Dict[str, Any]]) -> None:
+            for result in batch_results:
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+
+        if max_workers <= 1:
+            # 处理每个段落
+            for idx in indices:
+                if cancelled():
+                    break
+                collect(self._run_enhance_batch(para_manager, [idx]))
+        else:
+            def run(batch: List[int]) -> List[Dict[str, Any]]:
+                # 排队中的批次在取消后直接跳过
+                if cancelled():
+                    return []
+                return self._run_enhance_batch(para_manager, batch)
+
+            batches = self._plan_enhance_batches(para_manager, indices)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(run, batch) for batch in batches]
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        collect(future.result())
+                    except Exception as e:
+                        print(f"增强段落批次失败: {e}")
+                    if cancelled():
+                        for pending in futures:
+                            pending.cancel()
+
+        results.sort(key=lambda result: result["index"])
         return {
             "enhanced_paragraphs": results,
             "total_paragraphs": len(para_manager.paragraphs),
-            "processed_count": len(results)
+            "processed_count": len(results),
+            "cancelled": cancelled()
         }
 
     def create_modified_paragraph_manager(self, para_manager: ParagraphManager, modifications: List[Dict]) -> ParagraphManager:
@@ -204,32 +493,17 @@ class EditorAgent:
             modifications: 修改列表，每个修改包含 index、content 和可选的 meta
 
         Returns:
-            ParagraphManager: 新的段落管理器
+            ParagraphManager: 新的段落管理器，未修改的段落与原段落管理器共享
         """
-        # 创建新的段落管理器
-        new_manager = ParagraphManager()
-
-        # 复制图片和表格信息
-        new_manager.figures = para_manager.figures.copy()
-        new_manager.tables = para_manager.tables.copy()
-
-        # 创建修改索引字典，便于快速查找
+        # 只为被修改的段落创建新的段落信息，其余段落写时复制共享
         mod_dict = {}
         for mod in modifications:
-            if "index" in mod and "content" in mod:
-                mod_dict[mod["index"]] = mod
-
-        # 复制所有段落，并应用修改
-        for i, para_info in enumerate(para_manager.paragraphs):
-            if i in mod_dict:
-                # 应用修改
-                mod = mod_dict[i]
-                content = mod["content"]
-                # 使用原来的meta，除非修改中指定了新的meta
-                meta = mod.get("meta", para_info.meta)
-                new_manager.add_para(para_info.type, content, meta)
-            else:
-                # 保持原样
-                new_manager.add_para(para_info.type, para_info.content, para_info.meta)
-
-        return new_manager
+            index = mod.get("index")
+            if "content" not in mod or not isinstance(index, int) or not 0 <= index < len(para_manager.paragraphs):
+                continue
+            para_info = para_manager.paragraphs[index]
+            # 使用原来的meta，除非修改中指定了新的meta
+            meta = mod.get("meta", para_info.meta)
+            mod_dict[index] = ParaInfo(para_info.type, mod["content"], meta)
+
+        return para_manager.derive(mod_dict)
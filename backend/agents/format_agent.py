@@ -3,7 +3,12 @@ import os
 from typing import Dict, List, Optional, Any, Tuple
 from backend.preparation.para_type import ParsedParaType, ParagraphManager, ParaInfo
 from backend.agents.setting import LLMs
-from backend.utils.utils import parse_llm_json_response
+from backend.agents.async_runner import get_runner
+from backend.agents.format_spec import spec_cache_key, get_cached_spec, set_cached_spec, chunk_requirements, merge_format_specs
+from backend.agents.structured_output import (
+    StructuredOutputError, structured_completion, astructured_completion,
+    location_schema, rule_check_schema, config_template_schema, normalize_location,
+)
 from backend.utils.config_utils import load_config
 # 移除循环导入
 # from backend.checkers.checker import check_format
@@ -17,48 +22,120 @@ class FormatAgent:
         self.llm.set_model(model)  # 设置模型名称
         self.model = model  # 添加 model 属性
         self.client = self.llm.client  # 获取 OpenAI 客户端
-
-    def parse_format(self, format_str: str, json_str: str) -> str:
-        """解析格式要求字符串，转换为JSON格式"""
-        # 字号和pt 的对应关系
-        size_mapping = [
-            {"pt": 42, "chinese_size": "初号"},
-            {"pt": 36, "chinese_size": "小初"},
-            {"pt": 26, "chinese_size": "一号"},
-            {"pt": 24, "chinese_size": "小一"},
-            {"pt": 22, "chinese_size": "二号"},
-            {"pt": 18, "chinese_size": "小二"},
-            {"pt": 16, "chinese_size": "三号"},
-            {"pt": 15, "chinese_size": "小三"},
-            {"pt": 14, "chinese_size": "四号"},
-            {"pt": 12, "chinese_size": "小四"},
-            {"pt": 10.5, "chinese_size": "五号"},
-            {"pt": 9, "chinese_size": "小五"},
-            {"pt": 7.5, "chinese_size": "六号"},
-            {"pt": 6.5, "chinese_size": "小六"},
-            {"pt": 5.5, "chinese_size": "七号"},
-            {"pt": 5, "chinese_size": "八号"}
-        ]
-        response = self.client.chat.completions.create(
+        self.router = None  # 段落分类的分级路由，未设置时只使用本模型
+
+    # 字号和pt 的对应关系
+    SIZE_MAPPING = [
+        {"pt": 42, "chinese_size": "初号"},
+        {"pt": 36, "chinese_size": "小初"},
+        {"pt": 26, "chinese_size": "一号"},
+        {"pt": 24, "chinese_size": "小一"},
+        {"pt": 22, "chinese_size": "二号"},
+        {"pt": 18, "chinese_size": "小二"},
+        {"pt": 16, "chinese_size": "三号"},
+        {"pt": 15, "chinese_size": "小三"},
+        {"pt": 14, "chinese_size": "四号"},
+        {"pt": 12, "chinese_size": "小四"},
+        {"pt": 10.5, "chinese_size": "五号"},
+        {"pt": 9, "chinese_size": "小五"},
+        {"pt": 7.5, "chinese_size": "六号"},
+        {"pt": 6.5, "chinese_size": "小六"},
+        {"pt": 5.5, "chinese_size": "七号"},
+        {"pt": 5, "chinese_size": "八号"}
+    ]
+
+    def _parse_format_request(self, format_str: str, json_str: str, part: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+        user_content = f"请分析这个文档内的docx文档格式要求:\n{format_str}"
+        if part:
+            user_content = f"以下是格式要求文档的第 {part[0]}/{part[1]} 部分，只提取这部分涉及的格式，未提及的字段不要输出:\n{format_str}"
+        return dict(
             model=self.model,
             messages=[
                 {"role": "system", "content": "用户将提供给你一段文档格式内容，请你分析文档格式要求，并提取其中的所有信息，以 JSON 的形式输出，"
                  "1.输出的 JSON 需遵守以下的格式 " + json_str + " "
-                 "2.字号和PT的对应关系如下" + json.dumps(size_mapping)},
-                {"role": "user",
-                 "content": f"请分析这个文档内的docx文档格式要求:\n{format_str}"}
+                 "2.字号和PT的对应关系如下" + json.dumps(self.SIZE_MAPPING)},
+                {"role": "user", "content": user_content}
             ]
         )
-        return response.choices[0].message.content
 
-    def predict_location(self, doc_content, fragment_str: str, para_meta=None, prev_para_type=None, next_para_type=None) -> dict:
-        """预测段落位置信息（使用文档全文）"""
-        example_data = {
-            "location": "title_zh",
-            "confidence": 0.95,
-        }
+    def _parse_format_chunks(self, chunks: List[str], json_str: str, template: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        并发解析各块格式要求，按原文顺序合并
+
+        Returns:
+            Tuple[Optional[Dict[str, Any]], bool]: 合并后的格式配置（全部失败时为 None），以及是否只有部分块解析成功
+        """
+        # 每块只覆盖部分章节，不要求包含模板的全部字段
+        schema = config_template_schema(template, top_level=False)
+
+        async def parse_chunk(item):
+            index, chunk = item
+            request = self._parse_format_request(chunk, json_str, (index + 1, len(chunks)))
+            return await astructured_completion(self.llm, request, schema, 'format_config')
+
+        parts = []
+        for index, result in enumerate(get_runner().map(parse_chunk, list(enumerate(chunks)))):
+            if isinstance(result, Exception):
+                print(f"第 {index + 1} 部分格式要求解析失败: {result}")
+                continue
+            parts.append(result)
+        if not parts:
+            return None, True
+        return merge_format_specs(parts, template), len(parts) < len(chunks)
+
+    def parse_format(self, format_str: str, json_str: str) -> str:
+        """
+        解析格式要求字符串，转换为JSON格式
+
+        相同的格式要求和模板直接返回缓存的结果；较长的格式要求按章节切分后并发解析再合并
+
+        Args:
+            format_str: 格式要求文本
+            json_str: 配置模板（JSON 字符串）
+
+        Returns:
+            str: 格式配置的 JSON 字符串，解析失败时为大模型的原始回答
+        """
+        cache_key = spec_cache_key(self.llm.model or self.model, format_str, json_str)
+        cached = get_cached_spec(cache_key)
+        if cached is not None:
+            print("格式要求命中缓存")
+            return cached
 
-        # 提取段落格式特征
+        try:
+            template = json.loads(json_str)
+        except (TypeError, json.JSONDecodeError):
+            template = {}
+        if not isinstance(template, dict):
+            template = {}
+
+        partial = False
+        chunks = chunk_requirements(format_str)
+        if len(chunks) > 1:
+            print(f"格式要求较长，分为 {len(chunks)} 部分并发解析")
+            result, partial = self._parse_format_chunks(chunks, json_str, template)
+            if result is None:
+                return json.dumps({}, ensure_ascii=False)
+        else:
+            try:
+                result = structured_completion(self.llm, self._parse_format_request(format_str, json_str),
+                                               config_template_schema(template), 'format_config')
+            except StructuredOutputError as e:
+                # 校验失败时交给调用方按原样解析，不写入缓存
+                print(f"格式要求解析结果不符合模板: {e}")
+                return e.raw
+
+        spec = json.dumps(result, ensure_ascii=False)
+        if partial:
+            # 部分块解析失败时结果不完整，不写入缓存，再次上传时重新解析
+            print("部分格式要求解析失败，结果不写入缓存")
+        else:
+            set_cached_spec(cache_key, spec)
+        return spec
+
+    @staticmethod
+    def _format_features(para_meta) -> Dict[str, Any]:
+        """提取段落格式特征"""
         format_features = {}
         if para_meta:
             # 提取段落格式信息
@@ -84,23 +161,51 @@ class FormatAgent:
                     format_features["bold"] = True in fonts["bold"]
                 if "italic" in fonts and fonts["italic"]:
                     format_features["italic"] = True in fonts["italic"]
+        return format_features
 
-        # 构建上下文信息
-        context_info = ""
-        if next_para_type:
-            context_info += f"下一段落类型: {next_para_type.value}\n"
-
+    @staticmethod
+    def _format_info(format_features: Dict[str, Any]) -> str:
         # 构建格式特征信息
         format_info = ""
         if format_features:
             format_info = "段落格式特征:\n"
             for key, value in format_features.items():
                 format_info += f"- {key}: {value}\n"
+        return format_info
 
+    def _structured_location(self, request: Dict[str, Any]) -> dict:
+        try:
+            result = structured_completion(self.llm, request, location_schema(), 'paragraph_location', normalize_location)
+            print(f"LLM预测结果: {result}")
+            return result
+        except StructuredOutputError as e:
+            print(f"段落位置预测结果无效: {e}, 原始字符串: {e.raw}")
+            return {"location": "body", "confidence": 0.5}
 
-        response = self.client.chat.completions.create(
+    async def _astructured_location(self, request: Dict[str, Any]) -> dict:
+        try:
+            result = await astructured_completion(self.llm, request, location_schema(), 'paragraph_location', normalize_location)
+            print(f"LLM预测结果: {result}")
+            return result
+        except StructuredOutputError as e:
+            print(f"段落位置预测结果无效: {e}, 原始字符串: {e.raw}")
+            return {"location": "body", "confidence": 0.5}
+
+    def _location_request(self, doc_content, fragment_str: str, para_meta=None, next_para_type=None) -> Dict[str, Any]:
+        example_data = {
+            "location": "title_zh",
+            "confidence": 0.95,
+        }
+
+        # 构建上下文信息
+        context_info = ""
+        if next_para_type:
+            context_info += f"下一段落类型: {next_para_type.value}\n"
+
+        format_info = self._format_info(self._format_features(para_meta))
+
+        return dict(
             model=self.model,
-            response_format={"type": "json_object"},
             messages=[
                 {"role": "system", "content": f"""你是一个文档结构分析专家，请严格按照以下规则处理：
                     1. 可用位置类型仅限：{ParsedParaType.get_enum_values()}
@@ -117,68 +222,32 @@ class FormatAgent:
             ]
         )
 
-        predict_json_str = response.choices[0].message.content
+    def predict_location(self, doc_content, fragment_str: str, para_meta=None, prev_para_type=None, next_para_type=None) -> dict:
+        """预测段落位置信息（使用文档全文）"""
+        return self._structured_location(self._location_request(doc_content, fragment_str, para_meta, next_para_type))
 
-        # 解析JSON响应
-        try:
-            result = parse_llm_json_response(predict_json_str)
-            print(f"LLM预测结果: {result}")
-            return result
-        except Exception as e:
-            print(f"JSON解析错误: {e}, 原始字符串: {predict_json_str}")
-            return {"location": "body", "confidence": 0.5}
+    async def apredict_location(self, doc_content, fragment_str: str, para_meta=None, prev_para_type=None, next_para_type=None) -> dict:
+        """predict_location 的异步版本"""
+        return await self._astructured_location(self._location_request(doc_content, fragment_str, para_meta, next_para_type))
 
-    def predict_location_with_context(self, doc_content, fragment_str: str, para_meta=None, prev_para_type=None, next_para_type=None, prev_content="", next_content="") -> dict:
-        """预测段落位置信息（使用上下文段落内容而非文档全文）"""
+    def _location_with_context_request(self, fragment_str: str, para_meta=None, prev_para_type=None, prev_content="") -> Dict[str, Any]:
         example_data = {
             "location": "title_zh",
             "confidence": 0.95,
         }
-        # 提取段落格式特征
-        format_features = {}
-        if para_meta:
-            # 提取段落格式信息
-            if "paragraph_format" in para_meta:
-                para_format = para_meta["paragraph_format"]
-                if "alignment" in para_format and para_format["alignment"]:
-                    format_features["alignment"] = para_format["alignment"]
-                if "first_line_indent" in para_format and para_format["first_line_indent"]:
-                    format_features["first_line_indent"] = para_format["first_line_indent"]
-                if "line_spacing" in para_format and para_format["line_spacing"]:
-                    format_features["line_spacing"] = para_format["line_spacing"]
-
-            # 提取字体信息
-            if "fonts" in para_meta:
-                fonts = para_meta["fonts"]
-                if "zh_family" in fonts and fonts["zh_family"]:
-                    format_features["zh_font"] = list(fonts["zh_family"]) if isinstance(fonts["zh_family"], set) else fonts["zh_family"]
-                if "en_family" in fonts and fonts["en_family"]:
-                    format_features["en_font"] = list(fonts["en_family"]) if isinstance(fonts["en_family"], set) else fonts["en_family"]
-                if "size" in fonts and fonts["size"]:
-                    format_features["font_size"] = fonts["size"]
-                if "bold" in fonts and fonts["bold"]:
-                    format_features["bold"] = True in fonts["bold"]
-                if "italic" in fonts and fonts["italic"]:
-                    format_features["italic"] = True in fonts["italic"]
 
         # 构建上下文信息
         context_info = ""
         if prev_para_type:
             context_info += f"上一段落类型: {prev_para_type.value}\n"
             context_info += f"上一段落内容: {prev_content}\n"
-        # 构建格式特征信息
-        format_info = ""
-        if format_features:
-            format_info = "段落格式特征:\n"
-            for key, value in format_features.items():
-                format_info += f"- {key}: {value}\n"
+        format_info = self._format_info(self._format_features(para_meta))
         print(f"""需分析段落：{fragment_str}
                             之前的段落类型和标题内容为：{context_info}
                             这个段落的格式信息为：{format_info}
                             请按示例格式返回：{example_data}""")
-        response = self.client.chat.completions.create(
+        return dict(
             model=self.model,
-            response_format={"type": "json_object"},
             messages=[
                 {"role": "system", "content": f"""你是一个文档结构分析专家，请严格按照以下规则处理：
                     1. 可用位置类型仅限：{ParsedParaType.get_enum_values()}
@@ -194,21 +263,15 @@ class FormatAgent:
             ]
         )
 
-        predict_json_str = response.choices[0].message.content
-
+    def predict_location_with_context(self, doc_content, fragment_str: str, para_meta=None, prev_para_type=None, next_para_type=None, prev_content="", next_content="") -> dict:
+        """预测段落位置信息（使用上下文段落内容而非文档全文）"""
+        return self._structured_location(self._location_with_context_request(fragment_str, para_meta, prev_para_type, prev_content))
 
-        # 解析JSON响应
-        try:
-            result = parse_llm_json_response(predict_json_str)
-            print(f"LLM预测结果: {result}")
-            return result
-        except Exception as e:
-            print(f"JSON解析错误: {e}, 原始字符串: {predict_json_str}")
-            return {"location": "body", "confidence": 0.5}
+    async def apredict_location_with_context(self, doc_content, fragment_str: str, para_meta=None, prev_para_type=None, next_para_type=None, prev_content="", next_content="") -> dict:
+        """predict_location_with_context 的异步版本"""
+        return await self._astructured_location(self._location_with_context_request(fragment_str, para_meta, prev_para_type, prev_content))
 
-    # 检查基于规则的段落位置推理是否正确
-    def check_rule_based_prediction(self, para_string: str, para_meta: dict, prev_para_type: ParsedParaType, next_para_type: ParsedParaType) -> bool:
-        """检查基于规则的段落位置推理是否正确"""
+    def _rule_check_request(self, para_string: str, para_meta: dict, prev_para_type: ParsedParaType, next_para_type: ParsedParaType) -> Dict[str, Any]:
         example_data = {
             "is_correct": True,
             "confidence": 0.95,
@@ -221,10 +284,6 @@ class FormatAgent:
             3. 分析时要综合考虑段落内容、格式特征和上下文关系，判断段落位置推理是否正确
             """
 
-        # 如果是doubao系列模型，在system_content中添加JSON格式要求
-        if hasattr(self.llm, 'is_doubao_model') and self.llm.is_doubao_model:
-            system_content += "\n8. 你必须以有效的JSON格式返回结果，例如: {\"is_correct\": true, \"confidence\": 0.95}"
-
         user_content = f"""请检查以下段落位置推理是否正确：
             段落内容：{para_string}
             段落格式：{para_meta}
@@ -232,37 +291,26 @@ class FormatAgent:
             下一段落类型：{next_para_type.value if next_para_type else "无"}
             请按示例格式返回：{example_data}"""
 
-        messages = [
-            {"role": "system", "content": system_content},
-            {"role": "user", "content": user_content}
-        ]
-
-        # 根据模型类型决定是否使用response_format参数
-        if hasattr(self.llm, 'supports_json_response_format') and self.llm.supports_json_response_format():
-            response = self.client.chat.completions.create(
-                model=self.model,
-                response_format={"type": "json_object"},
-                messages=messages
-            )
-        else:
-            # 对于不支持response_format的模型（如doubao系列），不使用该参数
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages
-            )
+        # JSON 输出方式（response_format、工具调用或提示词）由结构化输出层按模型能力决定
+        return dict(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": user_content}
+            ]
+        )
 
-        predict_json_str = response.choices[0].message.content
+    # 检查基于规则的段落位置推理是否正确
+    def check_rule_based_prediction(self, para_string: str, para_meta: dict, prev_para_type: ParsedParaType, next_para_type: ParsedParaType) -> bool:
+        """检查基于规则的段落位置推理是否正确"""
         try:
-            result = parse_llm_json_response(predict_json_str)
-            # 检查是否包含is_correct字段
-            if "is_correct" in result:
-                return result["is_correct"]
-            else:
-                print(f"Missing 'is_correct' field in response: {result}")
-                return False  # 默认返回False，表示需要重新预测
-        except Exception as e:
+            result = structured_completion(self.llm, self._rule_check_request(para_string, para_meta, prev_para_type, next_para_type),
+                                           rule_check_schema(), 'rule_check')
+            return result["is_correct"]
+        except StructuredOutputError as e:
             print(f"Error parsing check_rule_based_prediction response: {e}")
-            return False  # 出错时返回False
+            return False  # 出错时返回False，表示需要重新预测
+
     def parse_table(self, table_str: str) -> str:
         """解析表格内容"""
         response = self.client.chat.completions.create(
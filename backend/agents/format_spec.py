@@ -0,0 +1,170 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+# 格式要求解析的辅助函数：按内容哈希缓存解析结果，把较长的格式要求文档按章节切分，
+# 并把各部分的解析结果按配置模板确定性地合并
+
+# 单次请求的格式要求文本上限（字符），超过时按章节切分后并发解析
+DEFAULT_CHUNK_CHARS = 3000
+
+FORMAT_SPEC_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'caches', 'format_specs')
+
+# 缓存键 -> 解析结果（JSON 字符串）
+_SPEC_CACHE: Dict[str, str] = {}
+_SPEC_LOCK = threading.Lock()
+
+# 章节标题：第一章、一、1. / 1.1、（一）以及常见的论文部分名称
+_SECTION_HEADING = re.compile(
+    r'^\s*(第[一二三四五六七八九十百\d]+[章节部分条]'
+    r'|[一二三四五六七八九十]+[、.．]'
+    r'|[（(][一二三四五六七八九十\d]+[）)]'
+    r'|\d+(\.\d+)*[、.．\s]'
+    r'|(封面|题目|标题|摘要|abstract|关键词|关键字|keywords|正文|目录|参考文献|致谢|附录|图|表|公式|页面|纸张|页边距|页眉|页脚)[\s:：]*)',
+    re.IGNORECASE)
+
+
+def spec_cache_key(model: str, format_str: str, json_str: str) -> str:
+    """缓存键：模型、格式要求文本和配置模板共同决定解析结果"""
+    digest = hashlib.sha256()
+    for part in (model, format_str, json_str):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def get_cached_spec(key: str, cache_dir: Optional[str] = FORMAT_SPEC_CACHE_DIR) -> Optional[str]:
+    with _SPEC_LOCK:
+        cached = _SPEC_CACHE.get(key)
+    if cached is not None or not cache_dir:
+        return cached
+    path = os.path.join(cache_dir, f"{key}.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = f.read()
+        json.loads(cached)
+    except (OSError, ValueError) as e:
+        print(f"读取格式解析缓存失败: {str(e)}")
+        return None
+    with _SPEC_LOCK:
+        _SPEC_CACHE[key] = cached
+    return cached
+
+
+def set_cached_spec(key: str, spec: str, cache_dir: Optional[str] = FORMAT_SPEC_CACHE_DIR) -> None:
+    """缓存解析结果，磁盘缓存使服务重启后再次上传同一模板也能直接返回"""
+    with _SPEC_LOCK:
+        _SPEC_CACHE[key] = spec
+    if not cache_dir:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(spec)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"写入格式解析缓存失败: {str(e)}")
+
+
+def split_sections(text: str) -> List[str]:
+    """按章节标题把格式要求文本切分为若干节，标题之前的内容单独成节"""
+    sections: List[List[str]] = [[]]
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        if _SECTION_HEADING.match(line) and sections[-1]:
+            sections.append([])
+        sections[-1].append(line)
+    return ['\n'.join(lines) for lines in sections if lines]
+
+
+def chunk_requirements(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> List[str]:
+    """
+    把格式要求文本切分为不超过 max_chars 的块，尽量在章节边界处切分
+
+    Args:
+        text: 格式要求文本
+        max_chars: 每块的字符上限
+
+    Returns:
+        List[str]: 按原文顺序排列的文本块，文本不超过上限时只有一块
+    """
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks: List[str] = []
+    current = ''
+    for section in split_sections(text):
+        # 单节超长时按行继续切分
+        pieces = [section] if len(section) <= max_chars else _split_lines(section, max_chars)
+        for piece in pieces:
+            if current and len(current) + len(piece) + 1 > max_chars:
+                chunks.append(current)
+                current = ''
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_lines(section: str, max_chars: int) -> List[str]:
+    pieces: List[str] = []
+    current = ''
+    for line in section.splitlines():
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) + 1 > max_chars:
+            pieces.append(current)
+            current = ''
+        current = f"{current}\n{line}" if current else line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def _merge_into(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+    # 嵌套对象逐层合并，同一字段以先出现（原文靠前）的非空值为准
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_into(target[key], value)
+        elif target.get(key) is None:
+            target[key] = copy.deepcopy(value)
+
+
+def _order_like(template: Any, spec: Any) -> Any:
+    # 字段顺序与模板一致，模板之外的字段按出现顺序排在后面
+    if not isinstance(template, dict) or not isinstance(spec, dict):
+        return spec
+    ordered = {key: _order_like(template[key], spec[key]) for key in template if key in spec}
+    ordered.update({key: value for key, value in spec.items() if key not in ordered})
+    return ordered
+
+
+def merge_format_specs(parts: List[Dict[str, Any]], template: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    按原文顺序合并各块的解析结果，结果与块的完成顺序无关
+
+    Args:
+        parts: 各块的解析结果（与块的顺序一致）
+        template: 配置模板（可选），用于确定字段顺序
+
+    Returns:
+        Dict[str, Any]: 合并后的格式配置
+    """
+    merged: Dict[str, Any] = {}
+    for part in parts:
+        if isinstance(part, dict):
+            _merge_into(merged, part)
+    return _order_like(template, merged) if template else merged
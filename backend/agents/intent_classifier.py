@@ -0,0 +1,179 @@
+import math
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+# 本地意图分类：常见指令先用关键词规则匹配，再用字符 n-gram TF-IDF 最近邻匹配示例语句，
+# 两者都不能确定时才交给大模型做意图分析
+
+# 超过该长度的消息通常不是简单指令，直接交给大模型
+MAX_LOCAL_CHARS = 60
+
+# 最近邻匹配的相似度下限，以及与第二名意图的最小差距
+DEFAULT_MIN_SIMILARITY = 0.6
+DEFAULT_MIN_MARGIN = 0.1
+
+# (代理, 功能)
+Intent = Tuple[str, str]
+
+# 关键词规则，按从具体到一般的顺序排列，命中的第一条规则即为结果；
+# 写作建议和内容润色排在格式修复之前，格式修复建议必须提到"格式"
+INTENT_RULES: List[Tuple[Intent, re.Pattern]] = [
+    (("format", "generate_format_report"), re.compile(r'(生成|导出|下载).{0,6}(报告|标记文档)|格式修正报告|标记文档')),
+    (("format", "optimize_document_format"), re.compile(r'(优化|调整|统一).{0,4}(文档)?格式|一键排版|自动排版|格式化后的文档|下载.{0,4}格式化')),
+    (("advice", "provide_advice"), re.compile(r'(写作|论文|修改|改进)建议|给[^格]{0,4}建议|提[^格]{0,4}建议')),
+    (("editor", "enhance_content"), re.compile(r'润色|改写|(优化|改进|修改).{0,4}(这段|内容|语句|表达|文字)')),
+    (("format", "provide_format_fix_suggestions"), re.compile(
+        r'(如何|怎么|怎样|怎么样).{0,6}(修复|修改|改正|解决).{0,6}格式'
+        r'|格式.{0,6}(如何|怎么|怎样).{0,2}(修复|修改|改正|解决|改)'
+        r'|格式.{0,4}(修复|修改|改正)建议')),
+    (("format", "analyze_format_issues"), re.compile(r'(检查|分析|检测|查看|看看).{0,6}格式|格式.{0,4}(问题|错误|对不对|是否正确|有没有问题)')),
+    (("editor", "generate_caption"), re.compile(r'(生成|添加|加上?|补充?).{0,6}(题注|图注|表注|图片标题|表格标题)')),
+]
+
+# 最近邻匹配使用的示例语句
+INTENT_EXAMPLES: Dict[Intent, List[str]] = {
+    ("format", "analyze_format_issues"): [
+        "检查格式", "检查文档格式", "请分析文档中的格式问题", "帮我看看格式有没有问题", "格式对吗", "排版有问题吗",
+    ],
+    ("format", "provide_format_fix_suggestions"): [
+        "如何修复文档中的格式错误", "这些格式错误怎么改", "给出格式修复建议", "怎么解决这些格式问题",
+    ],
+    ("format", "generate_format_report"): [
+        "生成报告", "生成格式修正报告", "下载标记文档", "导出格式错误报告",
+    ],
+    ("format", "optimize_document_format"): [
+        "优化文档格式", "帮我排版", "一键修正格式", "下载格式化后的文档", "自动调整格式",
+    ],
+    ("editor", "generate_caption"): [
+        "生成题注", "给图片加题注", "为表格生成标题", "补全图表题注",
+    ],
+    ("editor", "enhance_content"): [
+        "润色这段话", "帮我改写这段内容", "优化这段文字的表达", "让这段更通顺",
+    ],
+    ("advice", "provide_advice"): [
+        "给我一些写作建议", "论文还有什么可以改进的", "提点修改建议", "怎么提高论文质量",
+    ],
+    ("communicate", "chat"): [
+        "你好", "你是谁", "谢谢", "你能做什么", "再见",
+    ],
+}
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def _ngrams(text: str) -> Counter:
+    # 字符一元和二元组，中文指令不需要分词
+    text = _NON_WORD.sub('', text.lower())
+    grams = Counter(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+@dataclass
+class IntentMetrics:
+    rule: int = 0
+    nearest: int = 0
+    llm: int = 0
+
+
+class IntentClassifier:
+    """
+    本地意图分类器
+
+    classify 返回与大模型意图分析相同结构的字典，不能确定时返回 None
+    """
+
+    def __init__(self, rules: List[Tuple[Intent, re.Pattern]] = None,
+                 examples: Dict[Intent, List[str]] = None,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                 min_margin: float = DEFAULT_MIN_MARGIN):
+        self.rules = INTENT_RULES if rules is None else rules
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.metrics = IntentMetrics()
+        self._lock = threading.Lock()
+        self._fit(INTENT_EXAMPLES if examples is None else examples)
+
+    def _fit(self, examples: Dict[Intent, List[str]]) -> None:
+        samples = [(intent, _ngrams(text)) for intent, texts in examples.items() for text in texts]
+        document_frequency = Counter()
+        for _, grams in samples:
+            document_frequency.update(grams.keys())
+        total = len(samples)
+        self._idf = {gram: math.log((1 + total) / (1 + count)) + 1 for gram, count in document_frequency.items()}
+        self._samples = [(intent, self._vector(grams)) for intent, grams in samples]
+
+    def _vector(self, grams: Counter) -> Dict[str, float]:
+        # 示例中未出现的 n-gram 对相似度没有贡献
+        vector = {gram: count * self._idf[gram] for gram, count in grams.items() if gram in self._idf}
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {gram: value / norm for gram, value in vector.items()} if norm else {}
+
+    def match_rules(self, message: str) -> Optional[Intent]:
+        """按顺序匹配关键词规则"""
+        for intent, pattern in self.rules:
+            if pattern.search(message):
+                return intent
+        return None
+
+    def nearest(self, message: str) -> List[Tuple[Intent, float]]:
+        """
+        按与示例语句的最高余弦相似度给各意图排序
+
+        Args:
+            message: 用户消息
+
+        Returns:
+            List[Tuple[Intent, float]]: (意图, 相似度)，从高到低排列
+        """
+        vector = self._vector(_ngrams(message))
+        scores: Dict[Intent, float] = {}
+        for intent, sample in self._samples:
+            similarity = sum(value * sample.get(gram, 0.0) for gram, value in vector.items())
+            if similarity > scores.get(intent, 0.0):
+                scores[intent] = similarity
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def _count(self, route: str) -> None:
+        with self._lock:
+            setattr(self.metrics, route, getattr(self.metrics, route) + 1)
+
+    def classify(self, message: str) -> Optional[Dict[str, str]]:
+        """
+        在本地判断用户意图
+
+        Args:
+            message: 用户消息
+
+        Returns:
+            Optional[Dict[str, str]]: 包含 agent、function、reason 的意图，不能确定时返回 None
+        """
+        text = message.strip()
+        if not text or len(text) > MAX_LOCAL_CHARS:
+            self._count('llm')
+            return None
+
+        intent = self.match_rules(text)
+        if intent is not None:
+            self._count('rule')
+            return {"agent": intent[0], "function": intent[1], "reason": "关键词规则匹配"}
+
+        ranked = self.nearest(text)
+        if ranked:
+            best_intent, best = ranked[0]
+            second = ranked[1][1] if len(ranked) > 1 else 0.0
+            if best >= self.min_similarity and best - second >= self.min_margin:
+                self._count('nearest')
+                return {"agent": best_intent[0], "function": best_intent[1],
+                        "reason": f"与示例语句相似度 {best:.2f}"}
+
+        self._count('llm')
+        return None
+
+    def report(self) -> Dict[str, int]:
+        """本地规则、最近邻和大模型各自处理的消息数"""
+        with self._lock:
+            return asdict(self.metrics)
@@ -0,0 +1,416 @@
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+# 按模型部署调度大模型请求：令牌桶限制每分钟请求数和 token 数，
+# 限流和服务端错误按指数退避（带抖动）重试并遵守 Retry-After，
+# 连续失败时熔断，熔断期间直接失败，由调用方切换到备用模型
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# 估算 token 数时未指定 max_tokens 的输出预留
+DEFAULT_COMPLETION_TOKENS = 256
+
+# 需要重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class ProviderUnavailableError(Exception):
+    """模型服务不可用：熔断打开或重试次数耗尽"""
+
+    def __init__(self, message: str, cause: Optional[Exception] = None):
+        super().__init__(message)
+        self.cause = cause
+
+
+class TokenBucket:
+    """令牌桶，按每分钟容量匀速补充，允许一分钟容量内的突发"""
+
+    def __init__(self, per_minute: Optional[float] = None):
+        self.configure(per_minute)
+        self._lock = threading.Lock()
+
+    def configure(self, per_minute: Optional[float]) -> None:
+        self.per_minute = float(per_minute) if per_minute else None
+        self.capacity = self.per_minute or 0.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        预约令牌，返回需要等待的秒数；令牌不足时记为欠账，由后续请求顺延
+
+        Args:
+            amount: 需要的令牌数
+
+        Returns:
+            float: 等待秒数
+        """
+        if not self.per_minute:
+            return max(0.0, self.paused_until - time.monotonic())
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_minute / 60.0
+            self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+            self.updated = now
+            # 单次请求超过桶容量时按容量计，避免永远等不到
+            self.level -= min(amount, self.capacity)
+            wait = -self.level / rate if self.level < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量修正预约的令牌数，amount 为正时补扣，为负时退还"""
+        if not self.per_minute or not amount:
+            return
+        with self._lock:
+            self.level = min(self.capacity, self.level - amount)
+
+    def pause(self, seconds: float) -> None:
+        """服务端限流时暂停发放，所有调用方一起等待"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却时间后放行一个试探请求"""
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> Optional[str]:
+        """
+        判断是否放行一次调用（每次调用只判断一次，调用内部的重试不再经过熔断器）
+
+        Returns:
+            Optional[str]: 'closed' 正常放行，'trial' 作为半开状态的试探请求放行，None 拒绝
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return 'closed'
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return 'trial'
+            return None
+
+    def release_trial(self) -> None:
+        """试探请求结束时清除标记，未记录成功或失败就退出（如被取消）时也不会一直占用试探名额"""
+        with self._lock:
+            self.trial_running = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回熔断器是否因此打开"""
+        with self._lock:
+            self.failures += 1
+            reopened = self.trial_running
+            self.trial_running = False
+            if reopened or self.failures >= self.failure_threshold:
+                was_closed = self.opened_at is None
+                self.opened_at = time.monotonic()
+                return was_closed or reopened
+            return False
+
+
+@dataclass
+class UsageCounter:
+    """一段代码内成功请求的次数和 token 用量"""
+    requests: int = 0
+    tokens: int = 0
+
+
+# 当前上下文的用量计数器，线程和异步任务各自独立
+_USAGE: contextvars.ContextVar = contextvars.ContextVar('llm_usage', default=None)
+
+
+@contextlib.contextmanager
+def track_usage() -> Iterator[UsageCounter]:
+    """统计 with 块内（同一线程或异步任务中）发出的请求用量，缺少 usage 时按估算值计"""
+    counter = UsageCounter()
+    token = _USAGE.set(counter)
+    try:
+        yield counter
+    finally:
+        _USAGE.reset(token)
+
+
+@dataclass
+class SchedulerMetrics:
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    # 因限速和退避等待的总秒数
+    throttled_seconds: float = 0.0
+    failures: int = 0
+    rejected: int = 0
+    circuit_opens: int = 0
+    fallbacks: int = 0
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """粗略估算请求的 token 数：文本按每 2 个字符 1 个 token，加上输出预留"""
+    chars = 0
+    for message in kwargs.get('messages') or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            chars += sum(len(part.get('text', '')) for part in content if isinstance(part, dict))
+    return chars // 2 + int(kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取错误响应中的 Retry-After / retry-after-ms"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+
+def is_retryable(error: Exception) -> bool:
+    """限流、超时、连接错误和服务端错误可以重试"""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return name in ('APIConnectionError', 'APITimeoutError') or isinstance(error, (TimeoutError, ConnectionError))
+
+
+class RequestScheduler:
+    """单个模型部署的请求调度器"""
+
+    def __init__(self, name: str, config: Optional[Dict] = None):
+        self.name = name
+        self.requests = TokenBucket()
+        self.tokens = TokenBucket()
+        self.breaker = CircuitBreaker()
+        self.metrics = SchedulerMetrics()
+        self._metrics_lock = threading.Lock()
+        self._config_key = None
+        self.configure(config or {})
+
+    def configure(self, config: Dict) -> None:
+        """按 keys.json 中的模型配置更新限额，配置未变化时保持当前状态"""
+        key = (config.get('rpm'), config.get('tpm'), config.get('max_retries'),
+               config.get('failure_threshold'), config.get('reset_timeout'))
+        if key == self._config_key:
+            return
+        self._config_key = key
+        self.requests.configure(config.get('rpm'))
+        self.tokens.configure(config.get('tpm'))
+        self.max_retries = int(config.get('max_retries', DEFAULT_MAX_RETRIES))
+        self.breaker.failure_threshold = int(config.get('failure_threshold', DEFAULT_FAILURE_THRESHOLD))
+        self.breaker.reset_timeout = float(config.get('reset_timeout', DEFAULT_RESET_TIMEOUT))
+
+    def record_metrics(self, **increments) -> None:
+        with self._metrics_lock:
+            for field_name, value in increments.items():
+                setattr(self.metrics, field_name, getattr(self.metrics, field_name) + value)
+
+    def _check_circuit(self) -> str:
+        """检查熔断器，熔断打开时直接失败"""
+        admitted = self.breaker.allow()
+        if admitted is None:
+            self.record_metrics(rejected=1)
+            raise ProviderUnavailableError(f"模型 {self.name} 已熔断，暂停请求")
+        return admitted
+
+    def _admit(self, estimated: int) -> float:
+        """预约令牌，返回需要等待的秒数"""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated))
+        self.record_metrics(requests=1)
+        if wait > 0:
+            self.record_metrics(throttled_seconds=wait)
+        return wait
+
+    def _succeeded(self, response: Any, estimated: int) -> None:
+        self.breaker.record_success()
+        usage = getattr(response, 'usage', None)
+        total = getattr(usage, 'total_tokens', None)
+        if isinstance(total, int):
+            self.tokens.adjust(total - estimated)
+        counter = _USAGE.get()
+        if counter is not None:
+            counter.requests += 1
+            counter.tokens += total if isinstance(total, int) else estimated
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """失败后的处理：返回下次重试前的等待秒数，不应重试时返回 None"""
+        if not is_retryable(error):
+            # 请求本身的错误（如参数错误）不计入熔断
+            self.record_metrics(failures=1)
+            self.breaker.record_success()
+            return None
+        if attempt >= self.max_retries:
+            self.record_metrics(failures=1)
+            if self.breaker.record_failure():
+                self.record_metrics(circuit_opens=1)
+                print(f"模型 {self.name} 连续失败，熔断 {self.breaker.reset_timeout:.0f} 秒")
+            return None
+
+        delay = _retry_after(error)
+        if delay is None:
+            # 指数退避加全抖动
+            delay = random.uniform(0, min(DEFAULT_MAX_DELAY, DEFAULT_BASE_DELAY * (2 ** attempt)))
+        if _status_code(error) == 429:
+            # 服务端限流时所有调用方一起暂停
+            self.requests.pause(delay)
+            self.record_metrics(throttled=1)
+        self.record_metrics(retries=1, throttled_seconds=delay)
+        print(f"模型 {self.name} 请求失败（{type(error).__name__}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+        return delay
+
+    def _give_up(self, error: Exception) -> ProviderUnavailableError:
+        if isinstance(error, ProviderUnavailableError):
+            return error
+        return ProviderUnavailableError(f"模型 {self.name} 请求失败: {error}", error)
+
+    def call(self, func: Callable[..., Any], **kwargs) -> Any:
+        """
+        在调度器约束下同步调用 func(**kwargs)
+
+        Raises:
+            ProviderUnavailableError: 熔断打开或可重试错误耗尽重试次数
+            Exception: 不可重试的错误原样抛出
+        """
+        estimated = estimate_tokens(kwargs)
+        attempt = 0
+        admitted = self._check_circuit()
+        try:
+            while True:
+                wait = self._admit(estimated)
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    response = func(**kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        if is_retryable(e):
+                            raise self._give_up(e) from e
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self._succeeded(response, estimated)
+                return response
+        finally:
+            if admitted == 'trial':
+                self.breaker.release_trial()
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """call 的异步版本，等待期间不阻塞事件循环"""
+        estimated = estimate_tokens(kwargs)
+        attempt = 0
+        admitted = self._check_circuit()
+        try:
+            while True:
+                wait = self._admit(estimated)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    response = await func(**kwargs)
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        if is_retryable(e):
+                            raise self._give_up(e) from e
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._succeeded(response, estimated)
+                return response
+        finally:
+            if admitted == 'trial':
+                self.breaker.release_trial()
+
+
+_SCHEDULERS: Dict[str, RequestScheduler] = {}
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler(name: str, config: Optional[Dict] = None) -> RequestScheduler:
+    """
+    获取模型共享的调度器，配置变化时更新限额
+
+    Args:
+        name: keys.json 中的模型名
+        config: 该模型的配置
+
+    Returns:
+        RequestScheduler: 调度器
+    """
+    with _SCHEDULER_LOCK:
+        scheduler = _SCHEDULERS.get(name)
+        if scheduler is None:
+            scheduler = RequestScheduler(name, config)
+            _SCHEDULERS[name] = scheduler
+        elif config is not None:
+            scheduler.configure(config)
+        return scheduler
+
+
+def get_scheduler_metrics() -> Dict[str, Dict[str, Any]]:
+    """所有模型调度器的统计信息和熔断状态"""
+    with _SCHEDULER_LOCK:
+        schedulers = list(_SCHEDULERS.values())
+    result = {}
+    for scheduler in schedulers:
+        metrics = asdict(scheduler.metrics)
+        metrics['throttled_seconds'] = round(metrics['throttled_seconds'], 3)
+        metrics['circuit'] = scheduler.breaker.state
+        result[scheduler.name] = metrics
+    return result
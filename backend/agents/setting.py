@@ -1,25 +1,160 @@
 import os, json
-from openai import OpenAI
+import asyncio
+import threading
+from types import SimpleNamespace
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from backend.agents.scheduler import ProviderUnavailableError, get_scheduler
+
+# 进程级客户端注册表：keys.json 按修改时间缓存，只在文件变化时重新读取；
+# 每个 base_url 共用一个带连接池和长连接的 HTTP 客户端，
+# 相同 (base_url, api_key) 的 OpenAI 客户端在所有代理和请求之间复用
+
+DEFAULT_CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..//..//keys.json'))
+
+# 连接池参数
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY = 60.0
+REQUEST_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+# 客户端自身不重试，重试、退避和熔断统一由请求调度器处理
+CLIENT_MAX_RETRIES = 0
+
+# 异步调用时每个服务商的默认并发上限，可在 keys.json 的模型配置中用 max_concurrency 覆盖
+DEFAULT_MAX_CONCURRENCY = 8
+
+_REGISTRY_LOCK = threading.RLock()
+# 配置文件路径 -> (修改时间, 配置)
+_CONFIG_CACHE = {}
+# base_url -> 共享的 HTTP 客户端
+_HTTP_CLIENTS = {}
+# (base_url, api_key) -> OpenAI 客户端
+_CLIENTS = {}
+# 异步客户端和信号量绑定到创建它们的事件循环：键 -> (事件循环, 对象)
+_ASYNC_HTTP_CLIENTS = {}
+_ASYNC_CLIENTS = {}
+_PROVIDER_SEMAPHORES = {}
+
+
+def load_keys(config_path=DEFAULT_CONFIG_PATH):
+    """
+    读取模型配置，文件未变化时直接返回缓存
+
+    Args:
+        config_path: keys.json 路径
+
+    Returns:
+        dict: 模型名 -> 模型配置，所有调用方共享同一个字典
+    """
+    mtime = os.path.getmtime(config_path)
+    with _REGISTRY_LOCK:
+        cached = _CONFIG_CACHE.get(config_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        _CONFIG_CACHE[config_path] = (mtime, config)
+        return config
+
+
+def get_http_client(base_url):
+    """获取 base_url 对应的共享 HTTP 客户端"""
+    with _REGISTRY_LOCK:
+        http_client = _HTTP_CLIENTS.get(base_url)
+        if http_client is None:
+            http_client = httpx.Client(
+                timeout=REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                                    keepalive_expiry=KEEPALIVE_EXPIRY))
+            _HTTP_CLIENTS[base_url] = http_client
+        return http_client
+
+
+def get_client(base_url, api_key):
+    """获取 (base_url, api_key) 对应的共享 OpenAI 客户端"""
+    key = (base_url, api_key)
+    with _REGISTRY_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=get_http_client(base_url),
+                            max_retries=CLIENT_MAX_RETRIES)
+            _CLIENTS[key] = client
+        return client
+
+
+def _loop_bound(registry, key, factory):
+    # 事件循环变化后（如 asyncio.run 新建的循环）重新创建，避免跨循环复用连接
+    loop = asyncio.get_running_loop()
+    with _REGISTRY_LOCK:
+        entry = registry.get(key)
+        if entry is None or entry[0] is not loop:
+            entry = (loop, factory())
+            registry[key] = entry
+        return entry[1]
+
+
+def get_async_client(base_url, api_key):
+    """获取当前事件循环中 (base_url, api_key) 对应的共享 AsyncOpenAI 客户端，须在协程中调用"""
+    def create_http_client():
+        return httpx.AsyncClient(
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                                keepalive_expiry=KEEPALIVE_EXPIRY))
+
+    def create_client():
+        http_client = _loop_bound(_ASYNC_HTTP_CLIENTS, base_url, create_http_client)
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client,
+                           max_retries=CLIENT_MAX_RETRIES)
+
+    return _loop_bound(_ASYNC_CLIENTS, (base_url, api_key), create_client)
+
+
+def provider_concurrency(base_url, config_path=DEFAULT_CONFIG_PATH):
+    """服务商的并发上限：使用该 base_url 的模型中配置的最小 max_concurrency"""
+    limits = []
+    for config in load_keys(config_path).values():
+        if isinstance(config, dict) and config.get('base_url') == base_url and config.get('max_concurrency'):
+            limits.append(int(config['max_concurrency']))
+    return min(limits) if limits else DEFAULT_MAX_CONCURRENCY
+
+
+def provider_semaphore(base_url, config_path=DEFAULT_CONFIG_PATH):
+    """获取当前事件循环中服务商共享的并发信号量，须在协程中调用"""
+    return _loop_bound(_PROVIDER_SEMAPHORES, base_url,
+                       lambda: asyncio.Semaphore(provider_concurrency(base_url, config_path)))
+
 
 class LLMs:
-    def __init__(self, config_path=os.path.abspath(os.path.join(os.path.dirname(__file__), '..//..//keys.json'))):
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH):
         self.config_path = config_path
-        self.models_config = self.load_models_config()
         self.current_model = None
         self.client = None
         self.model = None
+        self.base_url = None
+        self.api_key = None
         self.is_doubao_model = False  # 标记是否为doubao系列模型
 
+    @property
+    def models_config(self):
+        # 每次访问都经过注册表，keys.json 变化后自动生效
+        return self.load_models_config()
+
     def load_models_config(self):
-        with open(self.config_path, 'r') as f:
-            return json.load(f)
+        return load_keys(self.config_path)
 
     def set_model(self, model_name):
-        if model_name in self.models_config:
+        models_config = self.models_config
+        if model_name in models_config:
             print(f"Setting model to '{model_name}'")
-            config = self.models_config[model_name]
+            config = models_config[model_name]
             self.current_model = model_name
-            self.client = OpenAI(api_key=config['api_key'], base_url=config['base_url'])
+            self.base_url = config['base_url']
+            self.api_key = config['api_key']
+            # 与 OpenAI 客户端接口一致，请求经过调度器并在需要时切换到备用模型
+            self.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.create)))
             self.model = config['model_name']  # 使用实例变量存储当前模型名
 
             # 检查是否为doubao系列模型
@@ -29,31 +164,124 @@ class LLMs:
         else:
             raise ValueError(f"Model '{model_name}' not found in configuration.")
 
+    @property
+    def async_client(self):
+        """当前模型的异步客户端，须在协程中访问"""
+        if self.current_model is None:
+            return None
+        return get_async_client(self.base_url, self.api_key)
+
+    def _route(self):
+        """当前模型及 keys.json 中用 fallback 依次指定的备用模型：[(模型名, 配置)]"""
+        if self.current_model is None:
+            raise ValueError("Model is not set.")
+        models_config = self.models_config
+        route = []
+        name = self.current_model
+        while name in models_config and name not in [item[0] for item in route]:
+            route.append((name, models_config[name]))
+            name = models_config[name].get('fallback')
+        return route
+
+    @staticmethod
+    def _fallback_request(kwargs, config):
+        # 备用模型使用自己的模型名
+        request = dict(kwargs)
+        request['model'] = config['model_name']
+        return request
+
+    def create(self, **kwargs):
+        """
+        同步调用 chat.completions.create：经过模型的请求调度器（限速、重试、熔断），
+        当前模型不可用时依次切换到备用模型
+        """
+        last_error = None
+        for i, (name, config) in enumerate(self._route()):
+            scheduler = get_scheduler(name, config)
+            client = get_client(config['base_url'], config['api_key'])
+            request = kwargs if i == 0 else self._fallback_request(kwargs, config)
+            try:
+                if i > 0:
+                    scheduler.record_metrics(fallbacks=1)
+                return scheduler.call(client.chat.completions.create, **request)
+            except ProviderUnavailableError as e:
+                print(f"{e}，尝试备用模型")
+                last_error = e
+        raise last_error
+
+    async def acreate(self, **kwargs):
+        """create 的异步版本，同一服务商的在途请求数另受 max_concurrency 限制"""
+        last_error = None
+        for i, (name, config) in enumerate(self._route()):
+            scheduler = get_scheduler(name, config)
+            request = kwargs if i == 0 else self._fallback_request(kwargs, config)
+            try:
+                if i > 0:
+                    scheduler.record_metrics(fallbacks=1)
+                async with provider_semaphore(config['base_url'], self.config_path):
+                    client = get_async_client(config['base_url'], config['api_key'])
+                    return await scheduler.acall(client.chat.completions.create, **request)
+            except ProviderUnavailableError as e:
+                print(f"{e}，尝试备用模型")
+                last_error = e
+        raise last_error
+
     def supports_json_response_format(self):
         """检查当前模型是否支持response_format参数"""
         return not self.is_doubao_model
 
+    def supports_prompt_cache(self):
+        """keys.json 中 prompt_cache 为 true 的模型支持显式标记可缓存的提示词前缀"""
+        return bool(self.models_config.get(self.current_model, {}).get('prompt_cache')) if self.current_model else False
+
+    def system_message(self, content):
+        """
+        构造系统消息，支持显式提示词缓存的模型为其加上 cache_control 标记；
+        其余服务商按前缀自动缓存，调用方只需保证各轮的系统消息不变
+        """
+        if self.supports_prompt_cache():
+            return {"role": "system", "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]}
+        return {"role": "system", "content": content}
+
+    def structured_output_mode(self):
+        """
+        当前模型的结构化输出方式，取 keys.json 中的 structured_output：
+        json_schema（按 Schema 约束解码）、tools（强制函数调用）、json_object 或 prompt（在提示词中给出 Schema）；
+        未配置时支持 response_format 的模型使用 json_object，其余使用 prompt
+        """
+        mode = self.models_config.get(self.current_model, {}).get('structured_output') if self.current_model else None
+        if mode in ('json_schema', 'tools', 'json_object', 'prompt'):
+            return mode
+        return 'json_object' if self.supports_json_response_format() else 'prompt'
+
     def add_model(self, model_name, base_url, api_key, model_name_param):
-        if model_name not in self.models_config:
-            self.models_config[model_name] = {
+        with _REGISTRY_LOCK:
+            models_config = dict(self.models_config)
+            if model_name in models_config:
+                raise ValueError(f"Model '{model_name}' already exists.")
+            models_config[model_name] = {
                 "base_url": base_url,
                 "api_key": api_key,
                 "model_name": model_name_param
             }
-            self.save_models_config()
-        else:
-            raise ValueError(f"Model '{model_name}' already exists.")
+            self.save_models_config(models_config)
 
     def delete_model(self, model_name):
-        if model_name in self.models_config:
-            del self.models_config[model_name]
-            self.save_models_config()
-        else:
-            raise ValueError(f"Model '{model_name}' not found.")
+        with _REGISTRY_LOCK:
+            models_config = dict(self.models_config)
+            if model_name not in models_config:
+                raise ValueError(f"Model '{model_name}' not found.")
+            del models_config[model_name]
+            self.save_models_config(models_config)
 
-    def save_models_config(self):
-        with open(self.config_path, 'w') as f:
-            json.dump(self.models_config, f, indent=4)
+    def save_models_config(self, models_config=None):
+        # 缓存的配置被多个实例共享，修改时写入副本并替换缓存
+        if models_config is None:
+            models_config = self.models_config
+        with _REGISTRY_LOCK:
+            with open(self.config_path, 'w') as f:
+                json.dump(models_config, f, indent=4)
+            _CONFIG_CACHE[self.config_path] = (os.path.getmtime(self.config_path), models_config)
 
     def get_models(self):
         models_list = []
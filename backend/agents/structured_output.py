@@ -0,0 +1,376 @@
+import json
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+from backend.preparation.para_type import ParsedParaType
+from backend.utils.utils import parse_llm_json_response
+
+# 结构化输出：按 JSON Schema 约束大模型的回答。服务商支持时使用 json_schema 或工具调用，
+# 否则使用 json_object 或在提示词中给出 Schema；返回结果在本地用编译好的校验器校验，
+# 不符合时带着具体错误重试一次
+
+# 结构化输出方式，见 LLMs.structured_output_mode
+MODE_JSON_SCHEMA = 'json_schema'
+MODE_TOOLS = 'tools'
+MODE_JSON_OBJECT = 'json_object'
+MODE_PROMPT = 'prompt'
+
+_JSON_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'null': type(None),
+}
+
+
+class StructuredOutputError(Exception):
+    """修复重试后仍无法得到符合 Schema 的结果"""
+
+    def __init__(self, message: str, raw: Optional[str] = None):
+        super().__init__(message)
+        self.raw = raw
+
+
+def _is_type(value: Any, type_name: str) -> bool:
+    if type_name == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if type_name == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    expected = _JSON_TYPES.get(type_name)
+    return expected is not None and isinstance(value, expected)
+
+
+Validator = Callable[[Any, str], List[str]]
+
+
+def compile_schema(schema: Dict) -> Validator:
+    """
+    把 JSON Schema（type/enum/properties/required/additionalProperties/items/minimum/maximum 子集）
+    编译为校验函数，Schema 只解析一次，校验时不再遍历 Schema 字典
+
+    Args:
+        schema: JSON Schema
+
+    Returns:
+        Validator: 校验函数 (值, 路径) -> 错误信息列表
+    """
+    checks: List[Validator] = []
+
+    types = schema.get('type')
+    if types:
+        type_names = [types] if isinstance(types, str) else list(types)
+
+        def check_type(value, path):
+            if any(_is_type(value, name) for name in type_names):
+                return []
+            return [f"{path} 应为 {'/'.join(type_names)}，实际为 {type(value).__name__}"]
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        allowed = list(schema['enum'])
+        allowed_set = {json.dumps(item, sort_keys=True) for item in allowed}
+
+        def check_enum(value, path):
+            if json.dumps(value, sort_keys=True) in allowed_set:
+                return []
+            return [f"{path} 的值 {value!r} 不在可选范围 {allowed} 中"]
+        checks.append(check_enum)
+
+    for keyword, compare, word in (('minimum', lambda v, b: v >= b, '不应小于'), ('maximum', lambda v, b: v <= b, '不应大于')):
+        if keyword in schema:
+            bound = schema[keyword]
+
+            def check_bound(value, path, bound=bound, compare=compare, word=word):
+                if _is_type(value, 'number') and not compare(value, bound):
+                    return [f"{path} {word} {bound}"]
+                return []
+            checks.append(check_bound)
+
+    properties = {name: compile_schema(sub) for name, sub in (schema.get('properties') or {}).items()}
+    required = list(schema.get('required') or [])
+    additional = schema.get('additionalProperties', True)
+    additional_check = compile_schema(additional) if isinstance(additional, dict) else None
+    if properties or required or additional is not True:
+        def check_object(value, path):
+            if not isinstance(value, dict):
+                return []
+            errors = [f"{path} 缺少字段 {name}" for name in required if name not in value]
+            for name, item in value.items():
+                item_path = f"{path}.{name}"
+                if name in properties:
+                    errors.extend(properties[name](item, item_path))
+                elif additional is False:
+                    errors.append(f"{path} 不允许字段 {name}")
+                elif additional_check is not None:
+                    errors.extend(additional_check(item, item_path))
+            return errors
+        checks.append(check_object)
+
+    if isinstance(schema.get('items'), dict):
+        item_check = compile_schema(schema['items'])
+
+        def check_items(value, path):
+            if not isinstance(value, list):
+                return []
+            errors = []
+            for i, item in enumerate(value):
+                errors.extend(item_check(item, f"{path}[{i}]"))
+            return errors
+        checks.append(check_items)
+
+    def validate(value, path='$'):
+        errors = []
+        for check in checks:
+            errors.extend(check(value, path))
+        return errors
+
+    return validate
+
+
+def para_type_values() -> List[str]:
+    return [member.value for member in ParsedParaType]
+
+
+def location_schema() -> Dict:
+    """段落位置预测结果"""
+    return {
+        'type': 'object',
+        'properties': {
+            'location': {'type': 'string', 'enum': para_type_values()},
+            'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1},
+        },
+        'required': ['location', 'confidence'],
+    }
+
+
+def rule_check_schema() -> Dict:
+    """规则推理验证结果"""
+    return {
+        'type': 'object',
+        'properties': {
+            'is_correct': {'type': 'boolean'},
+            'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1},
+        },
+        'required': ['is_correct', 'confidence'],
+    }
+
+
+INTENT_AGENTS = ["format", "editor", "advice", "communicate", "none"]
+INTENT_FUNCTIONS = [
+    "search_para_config", "check_format", "fix_format", "check_paragraph_manager",
+    "fix_paragraph_manager", "generate_caption", "enhance_content", "provide_advice",
+    "analyze_paragraph", "analyze_format_issues", "provide_format_fix_suggestions",
+    "generate_format_report", "optimize_document_format", "chat", "none",
+]
+
+
+def intent_schema() -> Dict:
+    """用户意图分析结果"""
+    return {
+        'type': 'object',
+        'properties': {
+            'agent': {'type': 'string', 'enum': INTENT_AGENTS},
+            'function': {'type': 'string', 'enum': INTENT_FUNCTIONS},
+            'reason': {'type': 'string'},
+        },
+        'required': ['agent', 'function'],
+    }
+
+
+def config_template_schema(template: Any, top_level: bool = True) -> Dict:
+    """
+    由配置模板（config.json 的结构）生成 Schema：对象结构与模板一致，
+    叶子值允许字符串、数字、布尔和 null；顶层段落类型为必填字段
+
+    Args:
+        template: 配置模板
+        top_level: 是否为顶层
+
+    Returns:
+        Dict: JSON Schema
+    """
+    if isinstance(template, dict):
+        schema = {
+            'type': 'object',
+            'properties': {key: config_template_schema(value, False) for key, value in template.items()},
+        }
+        if top_level and template:
+            schema['required'] = list(template.keys())
+        return schema
+    if isinstance(template, list):
+        return {'type': ['array', 'null']}
+    return {'type': ['string', 'number', 'boolean', 'null']}
+
+
+def normalize_location(result: Any) -> Any:
+    """去掉模型照抄枚举说明时附带的中文解释，如 'body (正文)' -> 'body'"""
+    if isinstance(result, dict) and isinstance(result.get('location'), str):
+        result['location'] = result['location'].split(' ')[0].strip()
+    return result
+
+
+@dataclass
+class StructuredOutputMetrics:
+    requests: int = 0
+    # 实际发出的请求数（含修复重试）
+    round_trips: int = 0
+    valid_first_try: int = 0
+    # 严格 JSON 解析失败、靠启发式规则提取成功的次数
+    salvaged: int = 0
+    parse_failures: int = 0
+    validation_failures: int = 0
+    repairs: int = 0
+    repaired: int = 0
+    failed: int = 0
+
+
+_METRICS = StructuredOutputMetrics()
+_METRICS_LOCK = threading.Lock()
+_VALIDATORS: Dict[str, Validator] = {}
+
+
+def _count(**increments) -> None:
+    with _METRICS_LOCK:
+        for field_name, value in increments.items():
+            setattr(_METRICS, field_name, getattr(_METRICS, field_name) + value)
+
+
+def get_structured_output_metrics() -> Dict[str, Any]:
+    with _METRICS_LOCK:
+        metrics = asdict(_METRICS)
+    metrics['extra_round_trip_rate'] = round((metrics['round_trips'] - metrics['requests']) / metrics['requests'], 3) if metrics['requests'] else 0.0
+    return metrics
+
+
+def _validator(schema: Dict) -> Validator:
+    key = json.dumps(schema, sort_keys=True, ensure_ascii=False)
+    validator = _VALIDATORS.get(key)
+    if validator is None:
+        validator = compile_schema(schema)
+        _VALIDATORS[key] = validator
+    return validator
+
+
+def _with_schema_prompt(messages: List[Dict], schema: Dict) -> List[Dict]:
+    instruction = f"你必须只返回一个符合以下 JSON Schema 的 JSON 对象，不要输出任何其他内容：\n{json.dumps(schema, ensure_ascii=False)}"
+    messages = list(messages)
+    if messages and messages[0].get('role') == 'system' and isinstance(messages[0].get('content'), str):
+        messages[0] = {**messages[0], 'content': f"{messages[0]['content']}\n{instruction}"}
+    else:
+        messages.insert(0, {'role': 'system', 'content': instruction})
+    return messages
+
+
+def _build_request(request: Dict, schema: Dict, name: str, mode: str) -> Dict:
+    kwargs = {key: value for key, value in request.items() if key != 'response_format'}
+    if mode == MODE_JSON_SCHEMA:
+        kwargs['response_format'] = {'type': 'json_schema', 'json_schema': {'name': name, 'schema': schema}}
+    elif mode == MODE_TOOLS:
+        kwargs['tools'] = [{'type': 'function', 'function': {'name': name, 'parameters': schema}}]
+        kwargs['tool_choice'] = {'type': 'function', 'function': {'name': name}}
+    else:
+        kwargs['messages'] = _with_schema_prompt(kwargs['messages'], schema)
+        if mode == MODE_JSON_OBJECT:
+            kwargs['response_format'] = {'type': 'json_object'}
+    return kwargs
+
+
+def _response_text(response, mode: str) -> str:
+    message = response.choices[0].message
+    if mode == MODE_TOOLS:
+        tool_calls = getattr(message, 'tool_calls', None)
+        if tool_calls:
+            return tool_calls[0].function.arguments
+    return message.content or ''
+
+
+def _check(raw: str, validator: Validator, normalize: Optional[Callable[[Any], Any]]):
+    """解析并校验，返回 (结果, 错误列表)"""
+    try:
+        result = json.loads(raw)
+    except (TypeError, json.JSONDecodeError):
+        result = parse_llm_json_response(raw)
+        if isinstance(result, dict) and 'error' in result and 'raw_text' in result:
+            _count(parse_failures=1)
+            return None, ["返回内容不是有效的 JSON"]
+        _count(salvaged=1)
+    if normalize is not None:
+        result = normalize(result)
+    errors = validator(result)
+    if errors:
+        _count(validation_failures=1)
+    return result, errors
+
+
+def _repair_request(kwargs: Dict, raw: str, errors: List[str]) -> Dict:
+    repair = dict(kwargs)
+    repair['messages'] = list(kwargs['messages']) + [
+        {'role': 'assistant', 'content': raw},
+        {'role': 'user', 'content': "上面的结果不符合要求：\n" + "\n".join(errors[:10]) + "\n请只返回修正后的完整 JSON。"},
+    ]
+    return repair
+
+
+def _finish(result, raw: str, errors: List[str], repaired: bool):
+    if not errors:
+        if repaired:
+            _count(repaired=1)
+        else:
+            _count(valid_first_try=1)
+        return result
+    _count(failed=1)
+    raise StructuredOutputError("结构化输出校验失败: " + "; ".join(errors[:5]), raw)
+
+
+def structured_completion(llm, request: Dict, schema: Dict, name: str,
+                          normalize: Optional[Callable[[Any], Any]] = None) -> Any:
+    """
+    发出结构化输出请求并校验结果，不符合 Schema 时带着错误信息重试一次
+
+    Args:
+        llm: LLMs 实例
+        request: chat.completions.create 的参数
+        schema: JSON Schema
+        name: 输出名称（用于 json_schema / 工具调用）
+        normalize: 校验前对结果的规范化处理（可选）
+
+    Returns:
+        Any: 符合 Schema 的结果
+
+    Raises:
+        StructuredOutputError: 修复重试后仍不符合 Schema
+    """
+    mode = llm.structured_output_mode()
+    validator = _validator(schema)
+    kwargs = _build_request(request, schema, name, mode)
+    _count(requests=1, round_trips=1)
+
+    raw = _response_text(llm.create(**kwargs), mode)
+    result, errors = _check(raw, validator, normalize)
+    if not errors:
+        return _finish(result, raw, errors, False)
+
+    _count(repairs=1, round_trips=1)
+    raw = _response_text(llm.create(**_repair_request(kwargs, raw, errors)), mode)
+    result, errors = _check(raw, validator, normalize)
+    return _finish(result, raw, errors, True)
+
+
+async def astructured_completion(llm, request: Dict, schema: Dict, name: str,
+                                 normalize: Optional[Callable[[Any], Any]] = None) -> Any:
+    """structured_completion 的异步版本"""
+    mode = llm.structured_output_mode()
+    validator = _validator(schema)
+    kwargs = _build_request(request, schema, name, mode)
+    _count(requests=1, round_trips=1)
+
+    raw = _response_text(await llm.acreate(**kwargs), mode)
+    result, errors = _check(raw, validator, normalize)
+    if not errors:
+        return _finish(result, raw, errors, False)
+
+    _count(repairs=1, round_trips=1)
+    raw = _response_text(await llm.acreate(**_repair_request(kwargs, raw, errors)), mode)
+    result, errors = _check(raw, validator, normalize)
+    return _finish(result, raw, errors, True)
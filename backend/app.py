@@ -1,9 +1,11 @@
 from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 from werkzeug.utils import secure_filename
 from typing import List, Dict, Optional
 import os, time, sys
+import threading
+import uuid
 import json
 import sys
 import os
@@ -12,6 +14,10 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from backend.agents.setting import LLMs
+from backend.agents.scheduler import get_scheduler_metrics
+from backend.agents.cascade_router import build_cascade_router
+from backend.agents.structured_output import get_structured_output_metrics
+from backend.agents.conversation_state import get_conversation_store, fingerprint
 from backend.editors.format_editor import generate_formatted_doc
 from backend.editors.document_marker import mark_document_errors
 from backend.preparation.para_type import ParagraphManager
@@ -29,6 +35,8 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn  # 导入qn函数，用于XML命名空间
 import tempfile
 from backend.utils.utils import parse_llm_json_response
+from backend.utils.config_utils import load_config
+from backend.utils.template_library import get_template_library, TemplateNotFoundError
 
 # 导入agents包中的功能
 import backend.agents as agents
@@ -42,6 +50,8 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # 创建一个全局的Agent中心
 agents_config = {
     "format_model": "qwen-plus",
+    # 段落分类的快速模型，置信度不足或与规则判断不一致时再交给 format_model
+    "format_fast_model": "qwen-turbo",
     "editor_model": "deepseek-r1",
     "advice_model": "deepseek-r1",
     "communicate_model": "deepseek-r1"
@@ -52,12 +62,19 @@ agents = {
     "advice": AdviceAgent(agents_config["advice_model"]),
     "communicate": CommunicateAgent(agents_config["communicate_model"])
 }
+agents["format"].router = build_cascade_router(agents["format"], agents_config["format_fast_model"])
 
 llm = LLMs()
 
 # 配置处理的ParagraphManager和文件名
 analysised_para_manager = []
 
+# 流式增强任务：任务ID -> 取消标志
+enhance_tasks: Dict[str, threading.Event] = {}
+
+# 单个增强请求的最大并发数，客户端请求的并发数不超过该值
+MAX_ENHANCE_WORKERS = 8
+
 # 配置上传文件夹
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 CACHES_FOLDER = os.path.join(os.path.dirname(__file__), 'caches')
@@ -148,6 +165,7 @@ def get_agent_models():
         # 获取当前代理配置
         config = {
             "format_model": agents["format"].model,
+            "format_fast_model": agents["format"].router.tiers[0][0] if agents["format"].router else agents["format"].model,
             "editor_model": agents["editor"].model,
             "advice_model": agents["advice"].model,
             "communicate_model": agents["communicate"].model
@@ -166,7 +184,7 @@ def set_agent_model():
     agent_type = data['agent_type']
     model_name = data['model_name']
 
-    if agent_type not in ["format", "editor", "advice", "communicate"]:
+    if agent_type not in ["format", "format_fast", "editor", "advice", "communicate"]:
         return jsonify({'error': '无效的代理类型'}), 400
 
     try:
@@ -177,6 +195,12 @@ def set_agent_model():
         # 完全重新初始化代理，使用LLMs.set_model来更新所有配置
         if agent_type == "format":
             agents[agent_type] = FormatAgent(model_name)
+            agents_config["format_model"] = model_name
+            agents["format"].router = build_cascade_router(agents["format"], agents_config["format_fast_model"])
+        elif agent_type == "format_fast":
+            # 只更换分级路由中的快速模型
+            agents_config["format_fast_model"] = model_name
+            agents["format"].router = build_cascade_router(agents["format"], model_name)
         elif agent_type == "editor":
             agents[agent_type] = EditorAgent(model_name)
         elif agent_type == "advice":
@@ -199,6 +223,20 @@ def get_models():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 获取各模型的请求调度统计（限流等待、重试、熔断状态）
+@app.route('/api/llm-metrics')
+def get_llm_metrics():
+    try:
+        router = getattr(agents["format"], 'router', None)
+        return jsonify({
+            "metrics": get_scheduler_metrics(),
+            "cascade": router.report() if router is not None else {},
+            "structured_output": get_structured_output_metrics(),
+            "intent": agents["communicate"].intent_classifier.report()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 添加新模型
 @app.route('/api/add-model', methods=['POST'])
 def add_model():
@@ -314,6 +352,16 @@ def set_config():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def load_format_template() -> str:
+    """读取 config.json 作为格式解析的模板，文件不存在时使用空对象"""
+    config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.dumps(json.load(f))
+    except FileNotFoundError:
+        print(f"Warning: Config file not found at {config_path}")
+        return "{}"
+
 # 上传格式文件
 @app.route('/api/upload-format', methods=['POST'])
 def upload_format():
@@ -344,7 +392,8 @@ def upload_format():
             uploaded_file.save(file_path)
 
             # 使用format_agent处理docx文件，提取格式信息
-            format_json = llm.parse_format(file_path, '{}')
+            doc_content = docx_parser.extract_doc_content(file_path)
+            format_json = agents["format"].parse_format(doc_content, load_format_template())
 
             # 保存提取的格式信息
             json_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename.rsplit('.', 1)[0]}_format.json")
@@ -394,20 +443,8 @@ def analyse_format_doc():
         doc_content = docx_parser.extract_doc_content(file_path)
         format_agent = agents["format"]
 
-        # 解析格式要求
-        # 正确读取config.json文件
-        config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config.json')
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config_json = json.load(f)
-            # 将配置文件传递给parse_format方法
-            format_json_str = format_agent.parse_format(doc_content, json.dumps(config_json))
-            # 处理返回的原始字符串
-
-        except FileNotFoundError:
-            # 如果文件不存在，使用空对象
-            print(f"Warning: Config file not found at {config_path}")
-            format_json_str = format_agent.parse_format(doc_content, "{}")
+        # 解析格式要求，相同文档和模板直接返回缓存结果
+        format_json_str = format_agent.parse_format(doc_content, load_format_template())
 
         # 使用新的解析函数来处理大模型返回的JSON
         format_json = parse_llm_json_response(format_json_str)
@@ -470,6 +507,62 @@ def use_default_format():
             "message": f"应用默认格式失败: {str(e)}"
         }), 500
 
+# 模板库：列出模板或保存新版本
+@app.route('/api/templates', methods=['GET', 'POST'])
+def templates():
+    library = get_template_library()
+    if request.method == 'GET':
+        return jsonify({"success": True, "templates": library.list_templates()})
+
+    try:
+        data = request.get_json()
+        if not data or 'template_id' not in data or ('config' not in data and 'config_path' not in data):
+            return jsonify({"success": False, "message": "缺少必要参数"}), 400
+
+        config = data.get('config')
+        if config is None:
+            config_path = data.get('config_path')
+            if not os.path.exists(config_path):
+                return jsonify({"success": False, "message": "配置文件不存在"}), 404
+            config = load_config(config_path)
+
+        version = library.add(data['template_id'], config, data.get('name'))
+        return jsonify({"success": True, "template_id": data['template_id'], "version": version})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"保存模板失败: {str(e)}"}), 500
+
+# 读取模板的某个版本（默认最新版本）
+@app.route('/api/templates/<template_id>', methods=['GET'])
+def get_template(template_id):
+    try:
+        template = get_template_library().get(template_id, request.args.get('version', type=int))
+        return jsonify({
+            "success": True,
+            **template.summary(),
+            "config": template.config,
+            "versions": get_template_library().versions(template_id)
+        })
+    except TemplateNotFoundError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
+
+# 比较模板的两个版本
+@app.route('/api/templates/<template_id>/diff', methods=['GET'])
+def diff_template(template_id):
+    from_version = request.args.get('from', type=int)
+    if from_version is None:
+        return jsonify({"success": False, "message": "缺少必要参数"}), 400
+    try:
+        changes = get_template_library().diff(template_id, from_version, request.args.get('to', type=int))
+        return jsonify({"success": True, "changes": changes})
+    except TemplateNotFoundError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
+
+def resolve_template(data):
+    """请求中引用了模板库的 template_id 时返回已编译的模板，否则返回 None"""
+    if not data or not data.get('template_id'):
+        return None
+    return get_template_library().get(data['template_id'], data.get('template_version'))
+
 @app.route('/api/get-advice', methods=['POST'])
 def process_file():
     try:
@@ -495,7 +588,7 @@ def start_check_format():
     try:
         data = request.get_json()
         # 修复逻辑错误，使用正确的条件判断
-        if not data or ('doc_path' not in data or 'config_path' not in data):
+        if not data or ('doc_path' not in data or ('config_path' not in data and 'template_id' not in data)):
             return jsonify({"success": False, "message": "缺少必要参数"}), 400
 
         # 获取文件路径
@@ -506,14 +599,20 @@ def start_check_format():
         if not os.path.exists(file_path):
             return jsonify({"success": False, "message": "文档文件不存在"}), 404
 
-        if not os.path.exists(config_path):
+        # 引用模板库时直接使用预先编译的配置
+        try:
+            template = resolve_template(data)
+        except TemplateNotFoundError as e:
+            return jsonify({"success": False, "message": str(e)}), 404
+
+        if template is None and not os.path.exists(config_path):
             return jsonify({"success": False, "message": "配置文件不存在"}), 404
 
         # 处理文件信息
         try:
             # 使用延迟导入避免循环依赖
             from backend.checkers.checker import check_format
-            docx_errors, para_manager = check_format(file_path, config_path, agents["format"])
+            docx_errors, para_manager = check_format(file_path, config_path, agents["format"], template=template)
 
             # 检查返回值是否有效
             if para_manager is None:
@@ -826,6 +925,7 @@ def download_marked_document():
         errors = data.get('errors', [])
         original_filename = data.get('original_filename', '')
         frontend_para_manager = data.get('para_manager', None)
+        mark_mode = data.get('mode', 'inline')
 
         # 如果没有提供原始文件名，则使用文档路径中的文件名
         if not original_filename:
@@ -876,7 +976,7 @@ def download_marked_document():
         print(f"错误数量: {len(errors)}")
 
         # 使用前端传来的错误列表标记文档
-        marked_doc_path = mark_document_errors(doc_path, errors, para_manager, marked_doc_path)
+        marked_doc_path = mark_document_errors(doc_path, errors, para_manager, marked_doc_path, mode=mark_mode)
 
         # 返回成功响应和标记文档路径信息，让前端使用GET请求下载
         return jsonify({
@@ -952,7 +1052,7 @@ def apply_format():
                 mimetype='application/json'
             )
 
-        if not data or 'doc_path' not in data or 'config_path' not in data:
+        if not data or 'doc_path' not in data or ('config_path' not in data and 'template_id' not in data):
             return Response(
                 json.dumps({"success": False, "message": "缺少必要参数"}),
                 status=400,
@@ -964,6 +1064,7 @@ def apply_format():
         errors = data.get('errors', [])
         original_filename = data.get('original_filename', '')
         frontend_para_manager = data.get('para_manager', None)
+        format_mode = data.get('mode', 'direct')
 
         # 验证文件存在
         if not os.path.exists(doc_path):
@@ -973,7 +1074,17 @@ def apply_format():
                 mimetype='application/json'
             )
 
-        if not os.path.exists(config_path):
+        # 引用模板库时直接使用预先编译的配置和格式模板
+        try:
+            template = resolve_template(data)
+        except TemplateNotFoundError as e:
+            return Response(
+                json.dumps({"success": False, "message": str(e)}),
+                status=404,
+                mimetype='application/json'
+            )
+
+        if template is None and not os.path.exists(config_path):
             return Response(
                 json.dumps({"success": False, "message": "配置文件不存在"}),
                 status=404,
@@ -984,13 +1095,18 @@ def apply_format():
         para_manager = None
         if frontend_para_manager:
             try:
-                # 创建一个新的ParagraphManager实例
-                para_manager = ParagraphManager()
+                stored_manager = next((item['para_manager'] for item in analysised_para_manager if item['doc_path'] == doc_path), None)
+                if stored_manager is not None and isinstance(frontend_para_manager, list):
+                    # 在已存储的版本上派生，只有前端修改过的段落会重新创建
+                    para_manager = stored_manager.derive_from_dicts(frontend_para_manager)
+                else:
+                    # 创建一个新的ParagraphManager实例
+                    para_manager = ParagraphManager()
 
-                # 将前端传来的数据加载到para_manager中
-                if isinstance(frontend_para_manager, list):
-                    for para_data in frontend_para_manager:
-                        para_manager.add_paragraph_from_dict(para_data)
+                    # 将前端传来的数据加载到para_manager中
+                    if isinstance(frontend_para_manager, list):
+                        for para_data in frontend_para_manager:
+                            para_manager.add_paragraph_from_dict(para_data)
 
                 # 更新或添加到analysised_para_manager中
                 for i, item in enumerate(analysised_para_manager):
@@ -1017,7 +1133,7 @@ def apply_format():
                 try:
                     # 使用延迟导入避免循环依赖
                     from backend.checkers.checker import check_format
-                    errors, para_manager = check_format(doc_path, config_path, agents["format"])
+                    errors, para_manager = check_format(doc_path, config_path, agents["format"], template=template)
                     # 存储当前的para_manager
                     analysised_para_manager.append({"doc_path": doc_path, "para_manager": para_manager})
                 except Exception as check_error:
@@ -1045,7 +1161,7 @@ def apply_format():
             try:
                 # 使用延迟导入避免循环依赖
                 from backend.checkers.checker import check_format
-                errors, para_manager = check_format(doc_path, config_path, agents["format"])
+                errors, para_manager = check_format(doc_path, config_path, agents["format"], template=template)
                 # 更新存储的para_manager
                 for i, item in enumerate(analysised_para_manager):
                     if item['doc_path'] == doc_path:
@@ -1073,7 +1189,11 @@ def apply_format():
         # 应用格式，并将错误信息传递给 generate_formatted_doc 函数
         try:
             # 传递原文档路径，使其在原文档基础上修改内容，保持所有元素的相对位置不变
-            output_path = generate_formatted_doc(config_path, para_manager, output_path, errors, doc_path=doc_path)
+            if template is not None:
+                output_path = generate_formatted_doc(template.config, para_manager, output_path, errors, doc_path=doc_path,
+                                                     mode=format_mode, engine=template.formatting_engine)
+            else:
+                output_path = generate_formatted_doc(config_path, para_manager, output_path, errors, doc_path=doc_path, mode=format_mode)
         except Exception as e:
             print(f"生成格式化文档失败: {str(e)}")
             import traceback
@@ -1219,44 +1339,51 @@ def send_message():
         message = data.get('message')
         doc_path = data.get('doc_path')
         config_path = data.get('config_path')
-        doc_content = docx_parser.extract_doc_content(doc_path)
-
-        # 获取段落管理器
-        para_manager = None
-        frontend_para_manager = data.get('para_manager', None)
-
-        # 如果前端传来了para_manager，则使用前端的para_manager
-        if frontend_para_manager:
-            try:
-                # 创建一个新的ParagraphManager实例
-                para_manager = ParagraphManager()
-
-                # 将前端传来的数据加载到para_manager中
-                if isinstance(frontend_para_manager, list):
-                    for para_data in frontend_para_manager:
-                        para_manager.add_paragraph_from_dict(para_data)
 
-                # 更新或添加到analysised_para_manager中
-                for i, item in enumerate(analysised_para_manager):
-                    if item['doc_path'] == doc_path:
-                        analysised_para_manager[i]['para_manager'] = para_manager
-                        break
-                else:
-                    # 如果没有找到对应的条目，添加新的
-                    analysised_para_manager.append({"doc_path": doc_path, "para_manager": para_manager})
-            except Exception as e:
-                print(f"加载前端传来的para_manager失败: {str(e)}")
-                para_manager = None
-
-        # 如果没有从前端获取到有效的para_manager
-        if not para_manager:
-            # 尝试从后端已存储的para_manager中获取
-            para_manager = next((item['para_manager'] for item in analysised_para_manager if item['doc_path'] == doc_path), None)
-
-        # 使用CommunicateAgent处理消息，包含意图分析和分发，同时传入文档全文和段落管理器
-        response = agents["communicate"].get_response(message, doc_content, para_manager, config_path)
-
-        return jsonify({"success": True, "message": response})
+        # 会话状态：同一会话的多轮对话复用已解析的文档、检查结果、文档摘要和对话历史
+        # 未提供 session_id 时创建新会话，会话 id 随回复返回给前端
+        state = get_conversation_store().get(data.get('session_id'))
+        with state.lock:
+            doc_content = state.load_document(doc_path, docx_parser.extract_doc_content) if doc_path else ""
+            state.set_config(config_path)
+
+            frontend_para_manager = data.get('para_manager', None)
+
+            # 如果前端传来了para_manager，且与上一轮不同，则使用前端的para_manager
+            if isinstance(frontend_para_manager, list) and frontend_para_manager:
+                data_fingerprint = fingerprint(frontend_para_manager)
+                if data_fingerprint != state.para_fingerprint:
+                    try:
+                        # 创建一个新的ParagraphManager实例
+                        para_manager = ParagraphManager()
+
+                        # 将前端传来的数据加载到para_manager中
+                        for para_data in frontend_para_manager:
+                            para_manager.add_paragraph_from_dict(para_data)
+
+                        # 更新或添加到analysised_para_manager中
+                        for i, item in enumerate(analysised_para_manager):
+                            if item['doc_path'] == doc_path:
+                                analysised_para_manager[i]['para_manager'] = para_manager
+                                break
+                        else:
+                            # 如果没有找到对应的条目，添加新的
+                            analysised_para_manager.append({"doc_path": doc_path, "para_manager": para_manager})
+
+                        state.set_para_manager(para_manager, data_fingerprint)
+                    except Exception as e:
+                        print(f"加载前端传来的para_manager失败: {str(e)}")
+            else:
+                # 前端没有传来para_manager时，使用后端已存储的para_manager
+                stored_manager = next((item['para_manager'] for item in analysised_para_manager if item['doc_path'] == doc_path), None)
+                if stored_manager is not None:
+                    state.set_para_manager(stored_manager)
+
+            # 使用CommunicateAgent处理消息，包含意图分析和分发，同时传入会话状态
+            response = agents["communicate"].get_response(message, doc_content, state.para_manager, config_path, doc_path, state=state)
+            state.add_turn(message, response if isinstance(response, str) else json.dumps(response, ensure_ascii=False))
+
+        return jsonify({"success": True, "message": response, "session_id": state.session_id})
     except Exception as e:
         print(f"发送消息时出错: {str(e)}")
         import traceback
@@ -1353,7 +1480,44 @@ def enhance_paragraphs():
 
         # 使用EditorAgent增强段落
         editor_agent = agents["editor"]
-        result = editor_agent.enhance_paragraph_manager(para_manager, para_indices)
+        try:
+            max_workers = min(max(int(data.get('max_workers', 4)), 1), MAX_ENHANCE_WORKERS)
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "max_workers 必须是整数"}), 400
+
+        if data.get('stream'):
+            # 流式模式：后台执行，每个段落完成后通过Socket.IO推送到以任务ID命名的房间，可通过 cancel_enhance 取消
+            # 任务ID由服务端生成，只有发起请求的客户端知道，其他客户端收不到段落内容
+            task_id = uuid.uuid4().hex
+            socket_id = data.get('socket_id')
+            if socket_id:
+                # 发起请求的Socket.IO连接直接加入房间，避免错过最早完成的段落
+                join_room(task_id, sid=socket_id, namespace='/')
+            cancel_event = threading.Event()
+            enhance_tasks[task_id] = cancel_event
+
+            def run_enhance_task():
+                try:
+                    result = editor_agent.enhance_paragraph_manager(
+                        para_manager, para_indices, max_workers=max_workers,
+                        on_result=lambda item: socketio.emit('enhance_result', {"task_id": task_id, "result": item}, to=task_id),
+                        cancel_event=cancel_event)
+                    socketio.emit('enhance_done', {
+                        "task_id": task_id,
+                        "processed_count": result["processed_count"],
+                        "total_paragraphs": result["total_paragraphs"],
+                        "cancelled": result["cancelled"]
+                    }, to=task_id)
+                except Exception as task_error:
+                    print(f"流式增强段落时出错: {str(task_error)}")
+                    socketio.emit('enhance_error', {"task_id": task_id, "message": str(task_error)}, to=task_id)
+                finally:
+                    enhance_tasks.pop(task_id, None)
+
+            socketio.start_background_task(run_enhance_task)
+            return jsonify({"success": True, "task_id": task_id})
+
+        result = editor_agent.enhance_paragraph_manager(para_manager, para_indices, max_workers=max_workers)
 
         return jsonify({"success": True, "result": result})
     except Exception as e:
@@ -1362,6 +1526,35 @@ def enhance_paragraphs():
         traceback.print_exc()
         return jsonify({"success": False, "message": str(e)}), 500
 
+def cancel_enhance_task(task_id: str) -> bool:
+    """取消流式增强任务，已发出的请求会完成，排队中的批次不再执行"""
+    cancel_event = enhance_tasks.get(task_id)
+    if cancel_event is None:
+        return False
+    cancel_event.set()
+    return True
+
+# 取消段落增强API
+@app.route('/api/cancel-enhance', methods=['POST'])
+def cancel_enhance():
+    data = request.get_json() or {}
+    if cancel_enhance_task(data.get('task_id', '')):
+        return jsonify({"success": True})
+    return jsonify({"success": False, "message": "任务不存在或已结束"}), 404
+
+@socketio.on('join_enhance')
+def handle_join_enhance(data):
+    # 订阅流式增强任务的结果，请求时未提供 socket_id 的客户端用任务ID加入房间
+    task_id = (data or {}).get('task_id', '')
+    if task_id in enhance_tasks:
+        join_room(task_id)
+    emit('enhance_joined', {"task_id": task_id, "success": task_id in enhance_tasks})
+
+@socketio.on('cancel_enhance')
+def handle_cancel_enhance(data):
+    task_id = (data or {}).get('task_id', '')
+    emit('enhance_cancelled', {"task_id": task_id, "success": cancel_enhance_task(task_id)})
+
 # 获取docx文档内容API
 @app.route('/api/get-docx-content', methods=['GET'])
 def get_docx_content():
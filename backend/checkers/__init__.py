@@ -9,8 +9,12 @@ from .checker import (
 )
 
 from .check_paper import check_paper_format
+# 注册表使用绝对导入：checker.py 以 checkers 为包名导入本包时，插件注册的检查器与 run_checkers 仍共用同一个注册表
+from backend.checkers.registry import DocumentContext, register_checker, run_checkers
 from .check_references import check_reference_format
+from .check_citations import check_citations, build_citation_index
 from .check_tables_figures import check_table_format, check_figure_format
+from .check_captions import check_caption_numbering, build_caption_index
 
 # 导出所有公共函数
 __all__ = [
@@ -20,6 +24,13 @@ __all__ = [
     'check_format',
     'check_paper_format',
     'check_reference_format',
+    'check_citations',
+    'build_citation_index',
     'check_table_format',
-    'check_figure_format'
+    'check_figure_format',
+    'check_caption_numbering',
+    'build_caption_index',
+    'DocumentContext',
+    'register_checker',
+    'run_checkers'
 ]
@@ -0,0 +1,191 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from backend.preparation.para_type import ParagraphManager, ParsedParaType
+from backend.utils.label_matcher import leading_label
+
+# 题注编号：图3-1 / 表 2.4 / Figure 3-1 / Table 2-4，题注前缀由标签匹配器识别，编号紧跟在前缀之后
+CAPTION_NUMBER_PATTERN = re.compile(r'\s*(?P<chapter>\d+)\s*[-－.．]\s*(?P<seq>\d+)')
+
+# 公式编号：位于段落末尾的 (3-1) / （3.1）
+EQUATION_PATTERN = re.compile(r'[(（]\s*(?P<chapter>\d+)\s*[-－.．]\s*(?P<seq>\d+)\s*[)）]\s*$')
+
+# 正文中的交叉引用：如图3-2所示 / 见表2.1 / 式(3-1)
+REFERENCE_PATTERN = re.compile(
+    r'(?P<kind>图|表|公式|式|Figure|Fig\.?|Table|Eq\.?)\s*[(（]?\s*(?P<chapter>\d+)\s*[-－.．]\s*(?P<seq>\d+)\s*[)）]?',
+    re.IGNORECASE)
+
+# 章节标题中的章号：第3章 / 第三章 / 3 绪论 / 3. 绪论
+CHAPTER_PATTERN = re.compile(r'^\s*(?:第\s*(?P<zh>[\d一二三四五六七八九十]+)\s*章|(?P<num>\d+)(?:[\s.、．]|$))')
+
+# 按内容识别题注时的最大长度，避免把以"图3-1"开头的正文句子当作题注
+MAX_CAPTION_LENGTH = 60
+
+_KIND_ALIASES = {
+    '图': 'figure', 'figure': 'figure', 'fig': 'figure', 'fig.': 'figure',
+    '表': 'table', 'table': 'table',
+    '式': 'equation', '公式': 'equation', 'eq': 'equation', 'eq.': 'equation',
+}
+_KIND_NAMES = {'figure': '图', 'table': '表', 'equation': '式'}
+_CAPTION_TYPES = {
+    ParsedParaType.FIGURES: 'figure',
+    ParsedParaType.TABLES: 'table',
+    ParsedParaType.EQUATIONS: 'equation',
+}
+_ZH_DIGITS = {'一': 1, '二': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9, '十': 10}
+
+
+@dataclass
+class CaptionIndex:
+    """章节 -> 图/表/公式编号的计数索引"""
+    # (类型, 章号, 序号) -> 题注所在段落下标
+    labels: Dict[Tuple[str, int, int], int] = field(default_factory=dict)
+    # 章号 -> {类型: 当前计数}
+    counters: Dict[int, Dict[str, int]] = field(default_factory=dict)
+    # 正文交叉引用：(类型, 章号, 序号, 段落下标)
+    references: List[Tuple[str, int, int, int]] = field(default_factory=list)
+    # 编号问题：(段落下标, 错误信息)
+    problems: List[Tuple[int, str]] = field(default_factory=list)
+
+
+def _parse_chapter_number(text: str) -> Optional[int]:
+    match = CHAPTER_PATTERN.match(text)
+    if not match:
+        return None
+    if match.group('num'):
+        return int(match.group('num'))
+    zh = match.group('zh')
+    if zh.isdigit():
+        return int(zh)
+    # 仅处理"十一"、"二十"这类两位以内的中文数字
+    if zh.startswith('十'):
+        return 10 + _ZH_DIGITS.get(zh[1:], 0)
+    if '十' in zh:
+        tens, _, ones = zh.partition('十')
+        return _ZH_DIGITS.get(tens, 0) * 10 + _ZH_DIGITS.get(ones, 0)
+    return _ZH_DIGITS.get(zh)
+
+
+def _label_name(kind: str, chapter: int, seq: int) -> str:
+    return f"{_KIND_NAMES[kind]}{chapter}-{seq}"
+
+
+def _match_caption(para) -> Optional[Tuple[str, int, int]]:
+    """识别题注段落，返回 (类型, 章号, 序号)"""
+    content = para.content.strip()
+    caption_kind = _CAPTION_TYPES.get(para.type)
+
+    if caption_kind == 'equation':
+        match = EQUATION_PATTERN.search(content)
+        if match:
+            return 'equation', int(match.group('chapter')), int(match.group('seq'))
+        return None
+
+    # 题注前缀复用段落已缓存的标签命中结果
+    hit = leading_label(para.content, ('figure', 'table'), para.labels)
+    if hit is None:
+        return None
+    match = CAPTION_NUMBER_PATTERN.match(para.content, hit.end)
+    if not match:
+        return None
+    if caption_kind is None and len(content) > MAX_CAPTION_LENGTH:
+        return None
+    return hit.label, int(match.group('chapter')), int(match.group('seq'))
+
+
+def build_caption_index(manager: ParagraphManager) -> CaptionIndex:
+    """
+    一次扫描段落管理器，按一级标题划分章节并建立图、表、公式编号索引
+
+    Args:
+        manager: 段落管理器
+
+    Returns:
+        CaptionIndex: 题注索引
+    """
+    index = CaptionIndex()
+    chapter = 0
+
+    for para_index, para in enumerate(manager.paragraphs):
+        content = para.content.strip()
+        if not content:
+            continue
+
+        if para.type == ParsedParaType.HEADING1:
+            chapter = _parse_chapter_number(content) or chapter + 1
+            index.counters.setdefault(chapter, {})
+            continue
+
+        caption = _match_caption(para)
+        if caption is None:
+            if para.type in (ParsedParaType.REFERENCES_CONTENT, ParsedParaType.COVER):
+                continue
+            for match in REFERENCE_PATTERN.finditer(content):
+                kind = _KIND_ALIASES[match.group('kind').lower()]
+                index.references.append((kind, int(match.group('chapter')), int(match.group('seq')), para_index))
+            continue
+
+        kind, label_chapter, seq = caption
+        name = _label_name(kind, label_chapter, seq)
+        key = (kind, label_chapter, seq)
+
+        if key in index.labels:
+            index.problems.append((para_index, f"{name}编号重复"))
+            continue
+        index.labels[key] = para_index
+
+        if chapter and label_chapter != chapter:
+            index.problems.append((para_index, f"{name}位于第{chapter}章，章节号应为{chapter}"))
+
+        counters = index.counters.setdefault(label_chapter, {})
+        expected = counters.get(kind, 0) + 1
+        if seq != expected:
+            index.problems.append((para_index, f"{name}编号不连续，应为{_label_name(kind, label_chapter, expected)}"))
+        counters[kind] = max(counters.get(kind, 0), seq)
+
+    return index
+
+
+def check_caption_numbering(manager: ParagraphManager) -> List[Dict]:
+    """
+    检查图、表、公式编号是否按章节连续，以及正文交叉引用是否存在
+
+    Args:
+        manager: 段落管理器
+
+    Returns:
+        List[Dict]: 错误列表
+    """
+    errors = []
+
+    try:
+        index = build_caption_index(manager)
+
+        for para_index, message in index.problems:
+            errors.append({
+                'message': message,
+                'location': manager.paragraphs[para_index].content[:20],
+                'para_id': f"para{para_index}"
+            })
+
+        # 只核对文档中确实存在题注的类型，避免未识别的公式编号产生误报
+        labelled_kinds = {kind for kind, _, _ in index.labels}
+        reported = set()
+        for kind, chapter, seq, para_index in index.references:
+            key = (kind, chapter, seq)
+            if kind not in labelled_kinds or key in index.labels or key in reported:
+                continue
+            reported.add(key)
+            errors.append({
+                'message': f"正文引用的{_label_name(kind, chapter, seq)}不存在",
+                'location': manager.paragraphs[para_index].content[:20],
+                'para_id': f"para{para_index}"
+            })
+
+    except Exception as e:
+        errors.append({
+            'message': f"检查图表编号时出错: {str(e)}",
+            'location': '图表编号'
+        })
+
+    return errors
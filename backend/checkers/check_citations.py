@@ -0,0 +1,199 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from backend.preparation.para_type import ParagraphManager, ParsedParaType
+
+# 正文引用的多模式匹配器：顺序编码制 [12] / [3-5] / [1,2] 与著者-出版年制 (Smith, 2020) 合并为一个预编译正则
+CITATION_PATTERN = re.compile(
+    r'\[(?P<numeric>\d+(?:\s*[-–~,，、]\s*\d+)*)\]'
+    r'|[(（](?P<author_year>[^()（）]*?\d{4}[a-z]?(?:\s*[;；]\s*[^()（）]*?\d{4}[a-z]?)*)[)）]',
+    re.UNICODE)
+
+_RANGE_SPLIT = re.compile(r'\s*[,，、]\s*')
+_RANGE_PATTERN = re.compile(r'^(\d+)\s*[-–~]\s*(\d+)$')
+_AUTHOR_YEAR_ITEM = re.compile(r'^(?P<author>[^\d,，;；]+?)(?:\s+et\s+al\.?|等)?\s*[,，]?\s*(?P<year>\d{4})[a-z]?$')
+_REF_NUMBER_PATTERN = re.compile(r'^\s*\[(\d+)\]\s*')
+_REF_AUTHOR_PATTERN = re.compile(r'^\s*(?:\[\d+\]\s*)?(?P<author>[^,，.．\s]+)')
+_YEAR_PATTERN = re.compile(r'(?<!\d)(\d{4})(?!\d)')
+
+# 单个范围引用最多展开的条目数，避免 [1-99999] 之类的异常输入破坏线性复杂度
+MAX_RANGE_SPAN = 200
+
+# 不参与正文引用扫描的段落类型
+_SKIP_TYPES = {
+    ParsedParaType.REFERENCES,
+    ParsedParaType.REFERENCES_CONTENT,
+    ParsedParaType.COVER,
+}
+
+
+@dataclass
+class CitationIndex:
+    """正文引用与参考文献列表之间的交叉索引"""
+    # 参考文献编号 -> 条目文本
+    references: Dict[int, str] = field(default_factory=dict)
+    # (作者姓氏, 年份) -> 参考文献编号
+    author_year_keys: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    # 参考文献编号 -> 引用它的段落下标列表
+    cited_by: Dict[int, List[int]] = field(default_factory=dict)
+    # 按首次出现顺序排列的顺序编码制引用编号
+    first_numeric_order: List[int] = field(default_factory=list)
+    # 无法对应到参考文献的引用：(段落下标, 引用原文)
+    dangling: List[Tuple[int, str]] = field(default_factory=list)
+    # 参考文献列表是否采用 [序号] 编号（顺序编码制）
+    numbered: bool = False
+
+    @property
+    def uncited(self) -> List[int]:
+        return [number for number in self.references if number not in self.cited_by]
+
+
+def _expand_numeric(text: str) -> List[int]:
+    """展开 [1,3-5] 形式的编号列表"""
+    numbers = []
+    for part in _RANGE_SPLIT.split(text.strip()):
+        range_match = _RANGE_PATTERN.match(part)
+        if range_match:
+            start, end = int(range_match.group(1)), int(range_match.group(2))
+            if start <= end and end - start <= MAX_RANGE_SPAN:
+                numbers.extend(range(start, end + 1))
+            else:
+                numbers.extend([start, end])
+        elif part.isdigit():
+            numbers.append(int(part))
+    return numbers
+
+
+def _author_year_key(author: str, year: str) -> Tuple[str, str]:
+    # 英文取姓氏（首个单词），中文取完整作者名
+    author = author.strip()
+    surname = author.split()[0] if ' ' in author else author
+    return surname.rstrip('.,，').lower(), year
+
+
+def _index_references(manager: ParagraphManager, index: CitationIndex) -> None:
+    """登记参考文献条目及其编号、著者-出版年键"""
+    position = 0
+    for para in manager.paragraphs:
+        if para.type != ParsedParaType.REFERENCES_CONTENT:
+            continue
+        text = para.content.strip()
+        if not text:
+            continue
+        position += 1
+
+        number_match = _REF_NUMBER_PATTERN.match(text)
+        number = int(number_match.group(1)) if number_match else position
+        index.numbered = index.numbered or bool(number_match)
+        index.references.setdefault(number, text)
+
+        author_match = _REF_AUTHOR_PATTERN.match(text)
+        year_match = _YEAR_PATTERN.search(text)
+        if author_match and year_match:
+            key = _author_year_key(author_match.group('author'), year_match.group(1))
+            index.author_year_keys.setdefault(key, number)
+
+
+def build_citation_index(manager: ParagraphManager) -> CitationIndex:
+    """
+    一次扫描段落管理器，建立正文引用到参考文献条目的索引
+
+    Args:
+        manager: 段落管理器
+
+    Returns:
+        CitationIndex: 引用索引
+    """
+    index = CitationIndex()
+    _index_references(manager, index)
+
+    seen_numeric = set()
+    for para_index, para in enumerate(manager.paragraphs):
+        if para.type in _SKIP_TYPES or not para.content:
+            continue
+
+        for match in CITATION_PATTERN.finditer(para.content):
+            numeric = match.group('numeric')
+            if numeric is not None:
+                for number in _expand_numeric(numeric):
+                    if number not in seen_numeric:
+                        seen_numeric.add(number)
+                        index.first_numeric_order.append(number)
+                    if number in index.references:
+                        index.cited_by.setdefault(number, []).append(para_index)
+                    else:
+                        index.dangling.append((para_index, f"[{number}]"))
+                continue
+
+            for item in re.split(r'\s*[;；]\s*', match.group('author_year')):
+                item_match = _AUTHOR_YEAR_ITEM.match(item.strip())
+                if not item_match:
+                    continue
+                key = _author_year_key(item_match.group('author'), item_match.group('year'))
+                number = index.author_year_keys.get(key)
+                if number is not None:
+                    index.cited_by.setdefault(number, []).append(para_index)
+                elif not index.numbered:
+                    index.dangling.append((para_index, f"({item.strip()})"))
+
+    return index
+
+
+def _first_out_of_order(order: List[int]) -> Optional[Tuple[int, int]]:
+    """返回第一个违反顺序编码制的 (实际编号, 应出现的编号)"""
+    expected = 1
+    for number in order:
+        if number > expected:
+            return number, expected
+        expected = max(expected, number + 1)
+    return None
+
+
+def check_citations(manager: ParagraphManager) -> List[Dict]:
+    """
+    检查正文引用与参考文献列表的对应关系
+
+    Args:
+        manager: 段落管理器
+
+    Returns:
+        List[Dict]: 错误列表
+    """
+    errors = []
+
+    try:
+        index = build_citation_index(manager)
+        if not index.references:
+            return errors
+
+        for para_index, citation in index.dangling:
+            errors.append({
+                'message': f"正文引用{citation}在参考文献列表中不存在",
+                'location': manager.paragraphs[para_index].content[:20],
+                'para_id': f"para{para_index}"
+            })
+
+        for number in index.uncited:
+            errors.append({
+                'message': f"参考文献[{number}]未在正文中被引用",
+                'location': f"参考文献[{number}]"
+            })
+
+        # 顺序编码制要求按首次引用的先后顺序编号
+        out_of_order = _first_out_of_order(index.first_numeric_order)
+        if out_of_order:
+            actual, expected = out_of_order
+            para_index = index.cited_by.get(actual, [None])[0]
+            location = manager.paragraphs[para_index].content[:20] if para_index is not None else '正文引用'
+            errors.append({
+                'message': f"引用编号未按首次出现顺序排列：首次引用[{actual}]时尚未引用[{expected}]",
+                'location': location
+            })
+
+    except Exception as e:
+        errors.append({
+            'message': f"检查正文引用时出错: {str(e)}",
+            'location': '正文引用'
+        })
+
+    return errors
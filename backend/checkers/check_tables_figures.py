@@ -1,13 +1,14 @@
 import re, docx
 from typing import Dict, List
 from utils.utils import extract_number
+from backend.utils.label_matcher import caption_label, leading_label
 
-def check_table_format(doc_path: str, required_format: Dict) -> List[Dict]:
-    """检查表格格式"""
+def check_table_format(doc_path: str, required_format: Dict, doc=None) -> List[Dict]:
+    """检查表格格式，可传入已打开的文档 doc 避免重复解析"""
     errors = []
 
     try:
-        doc = docx.Document(doc_path)
+        doc = doc if doc is not None else docx.Document(doc_path)
 
         # 获取表格格式要求
         table_format = required_format.get('table_format', {})
@@ -36,7 +37,7 @@ def check_table_format(doc_path: str, required_format: Dict) -> List[Dict]:
             text = para.text.strip()
 
             # 检查是否为表格标题
-            if text.startswith('表') or text.lower().startswith('table'):
+            if leading_label(text, ('table',)):
                 # 检查标题格式
                 caption_errors = _check_caption_format(para, table_format, 'table')
 
@@ -219,7 +220,7 @@ def _check_table_number_format(caption_text: str) -> List[Dict]:
 
     return errors
 
-def check_figure_format(doc_path: str, required_format: Dict, paragraph_manager=None) -> List[Dict]:
+def check_figure_format(doc_path: str, required_format: Dict, paragraph_manager=None, doc=None) -> List[Dict]:
     """
     检查图片格式是否符合要求
 
@@ -227,9 +228,10 @@ def check_figure_format(doc_path: str, required_format: Dict, paragraph_manager=
         doc_path: 文档路径
         required_format: 格式要求字典
         paragraph_manager: 段落管理器实例，用于检查是否存在图片段落
+        doc: 已打开的文档，省略时从 doc_path 读取
     """
     errors = []
-    doc = docx.Document(doc_path)
+    doc = doc if doc is not None else docx.Document(doc_path)
 
     # 获取图片部分的要求格式
     figure_required_format = required_format.get('figures', {})
@@ -249,7 +251,7 @@ def check_figure_format(doc_path: str, required_format: Dict, paragraph_manager=
     # 遍历段落查找图片标题
     for i, para in enumerate(doc.paragraphs):
         # 查找图片标题段落
-        if re.search(r'图\s*\d+[-－]\d+|Figure\s*\d+[-－]\d+', para.text, re.IGNORECASE):
+        if caption_label(para.text, 'figure'):
             figure_count += 1
 
             # 检查图片标题格式
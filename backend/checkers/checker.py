@@ -7,13 +7,19 @@ from backend.preparation.para_type import ParagraphManager, ParsedParaType, Para
 from preparation.docx_parser import extract_doc_content
 import preparation.extract_para_info as extract_para_info
 from utils.utils import is_value_equal
+from backend.utils.label_matcher import leading_label
+from backend.utils.error_record import FormatError
 from utils.config_utils import load_config
 from utils.translation_utils import translate_errors
 from agents.format_agent import FormatAgent
 from checkers.check_paper import check_paper_format
 from checkers.check_references import check_reference_format
+from checkers.check_citations import check_citations
+from checkers.check_captions import check_caption_numbering
 from checkers.check_tables_figures import check_table_format, check_figure_format
-from preparation.delude_engine import remark_para_type, check_para_type
+from preparation.delude_engine import classify_para_types, verify_flagged_para_types
+from backend.checkers.registry import DocumentContext, register_checker, run_checkers, format_timing_report
+from backend.checkers.rule_plan import RulePlan
 
 def check_abstract(paragraph_manager: ParagraphManager) -> List[Dict]:
     """检查摘要格式"""
@@ -24,7 +30,7 @@ def check_abstract(paragraph_manager: ParagraphManager) -> List[Dict]:
     abstract_content_paras = []
 
     for para in paragraph_manager.paragraphs:
-        if para.type == ParsedParaType.ABSTRACT_ZH or para.content.strip().startswith('摘要'):
+        if para.type == ParsedParaType.ABSTRACT_ZH or leading_label(para.content, ('abstract_zh',), para.labels):
             abstract_paras.append(para)
         elif para.type == ParsedParaType.ABSTRACT_CONTENT_ZH:
             abstract_content_paras.append(para)
@@ -63,8 +69,7 @@ def check_keywords(paragraph_manager: ParagraphManager) -> List[Dict]:
     # 查找关键词段落
     keyword_paras = []
     for para in paragraph_manager.paragraphs:
-        para_text = para.content.strip()
-        if para_text.startswith('关键词') or para_text.startswith('Keywords'):
+        if leading_label(para.content, ('keywords_zh', 'keywords_en'), para.labels):
             keyword_paras.append(para)
 
     # 检查是否存在关键词
@@ -130,10 +135,10 @@ def check_required_paragraphs(paragraph_manager: ParagraphManager, required_form
 
     return errors
 
-def _recursive_check(actual, expected, para_content):
+def _recursive_check(actual, expected, para_content, para_id=None):
     """
     递归检查嵌套字典的字段。
-    返回格式为[{"message": error_message, "location": key}, ...]的列表
+    返回 FormatError 结构化错误记录列表，字段路径、要求值和实际值随记录携带，消息在序列化时生成
     """
     errors = []
 
@@ -144,10 +149,7 @@ def _recursive_check(actual, expected, para_content):
         if actual_value is None:
             # 如果是必需字段，才添加错误
             if key in ['fonts', 'paragraph_format']:
-                errors.append({
-                    "message": f"缺少必需字段: '{key}'",
-                    "location": para_content[:20]
-                })
+                errors.append(FormatError('missing', key, para_content[:20], para_id=para_id))
             continue
 
         # 处理集合类型的值
@@ -156,10 +158,8 @@ def _recursive_check(actual, expected, para_content):
             if len(actual_value) > 1:
                 # 对于字体大小、字体名称等特定字段，如果有多个不同的值，报告不一致错误
                 if key in ['size', 'zh_family', 'en_family', 'color']:
-                    errors.append({
-                        "message": f"'{key}' 不一致: 包含多个不同的值 {actual_value}",
-                        "location": para_content[:20]
-                    })
+                    errors.append(FormatError('inconsistent', key, para_content[:20],
+                                              expected_value, actual_value, para_id))
 
             # 将集合转换为列表或单个值
             if len(actual_value) == 1:
@@ -173,10 +173,8 @@ def _recursive_check(actual, expected, para_content):
             if len(actual_value) > 1:
                 # 对于字体大小、字体名称等特定字段，如果有多个不同的值，报告不一致错误
                 if key in ['size', 'zh_family', 'en_family', 'color']:
-                    errors.append({
-                        "message": f"'{key}' 不一致: 包含多个不同的值 {actual_value}",
-                        "location": para_content[:20]
-                    })
+                    errors.append(FormatError('inconsistent', key, para_content[:20],
+                                              expected_value, actual_value, para_id))
                     # 继续使用列表进行后续比较
 
             # 如果列表只有一个元素，取出来进行比较
@@ -188,17 +186,14 @@ def _recursive_check(actual, expected, para_content):
         # 递归处理嵌套字典
         if isinstance(expected_value, dict):
             if not isinstance(actual_value, dict):
-                errors.append({
-                    "message": f"字段类型不匹配: '{key}' 应为字典类型，实际为 {type(actual_value).__name__}",
-                    "location": para_content[:20]
-                })
+                errors.append(FormatError('type', key, para_content[:20],
+                                          actual=type(actual_value).__name__, para_id=para_id))
                 continue
 
             # 递归检查嵌套字段
-            deeper_errors = _recursive_check(actual_value, expected_value, para_content[:10])
+            deeper_errors = _recursive_check(actual_value, expected_value, para_content[:10], para_id)
             for err in deeper_errors:
-                err["location"] = f"{key}.{err['location']}"
-                errors.append(err)
+                errors.append(err.nest(key))
 
         # 检查值是否匹配
         else:
@@ -215,31 +210,60 @@ def _recursive_check(actual, expected, para_content):
                 is_equal = is_value_equal(expected_value, actual_value, key=key)
 
             if not is_equal:
-                # 处理可能的重复值
-                expected_str = str(expected_value)
-                actual_str = str(actual_value)
-
-                errors.append({
-                    "message": f"'{key}' 不匹配: 要求 {expected_str}, 实际 {actual_str}",
-                    "location": para_content[:20]
-                })
+                errors.append(FormatError('mismatch', key, para_content[:20],
+                                          expected_value, actual_value, para_id))
 
     return errors
 
 
+def check_paragraph_formats(paragraph_manager: ParagraphManager, rule_plan: RulePlan) -> List[Dict]:
+    """按段落类型逐段检查格式，期望格式取自预先编译的检查规则计划"""
+    errors = []
+
+    # 将段落信息转换为字典格式（包含完整的meta信息）
+    paragraphs_dict = paragraph_manager.to_dict()
+    for para_dict in paragraphs_dict:
+        para_type = para_dict["type"]
+        para_content = para_dict["content"]
+        para_meta = para_dict["meta"]
+        # 检查段落格式
+        errors.extend(_recursive_check(para_meta, rule_plan.rules_for(para_type), para_content, para_dict["id"]))
+
+    return errors
+
+# 内置检查器注册，按注册顺序汇总错误；其他模块可通过 register_checker 追加检查器
+register_checker('paper', inputs=('section_info', 'config'))(check_paper_format)
+register_checker('abstract', inputs=('manager',))(check_abstract)
+register_checker('keywords', inputs=('manager',))(check_keywords)
+register_checker('required_paragraphs', inputs=('manager', 'config'))(check_required_paragraphs)
+register_checker('references', inputs=('doc_path', 'config', 'document'))(check_reference_format)
+register_checker('citations', inputs=('manager',))(check_citations)
+register_checker('tables', inputs=('doc_path', 'config', 'document'))(check_table_format)
+register_checker('figures', inputs=('doc_path', 'config', 'manager', 'document'))(check_figure_format)
+register_checker('captions', inputs=('manager',))(check_caption_numbering)
+register_checker('paragraph_format', inputs=('manager', 'rule_plan'))(check_paragraph_formats)
 
 # 检查的入口函数
-def check_format(doc_path: str, config_path: str, format_agent: FormatAgent) -> Tuple[List[Dict], ParagraphManager]:
-    """检查格式"""
-    errors = []
+def check_format(doc_path: str, config_path: str, format_agent: FormatAgent, template=None) -> Tuple[List[Dict], ParagraphManager]:
+    """
+    检查格式
+
+    Args:
+        doc_path: 文档路径
+        config_path: 配置文件路径，提供 template 时忽略
+        format_agent: 格式代理
+        template: 模板库中已编译的模板（可选），直接使用其配置和检查规则计划
 
-    # 加载配置文件
-    required_format = load_config(config_path)
+    Returns:
+        Tuple[List[Dict], ParagraphManager]: 错误列表和段落管理器
+    """
+    errors = []
 
-    # 检查页面格式
-    from preparation.docx_parser import extract_section_info
-    doc_info = extract_section_info(doc_path)
-    errors.extend(check_paper_format(doc_info, required_format))
+    # 加载配置文件，模板库中的模板已预先解析和编译
+    if template is not None:
+        required_format, rule_plan = template.config, template.rule_plan
+    else:
+        required_format, rule_plan = load_config(config_path), None
 
     # 检查段落格式
     try:
@@ -248,8 +272,8 @@ def check_format(doc_path: str, config_path: str, format_agent: FormatAgent) ->
 
         manager = extract_para_info.extract_para_format_info(doc_path, manager)
 
-        # 重分配段落类型
-        manager = remark_para_type(doc_path, format_agent, manager)
+        # 重分配段落类型，同时记录规则与大模型结论不一致的段落
+        manager, flagged = classify_para_types(doc_path, format_agent, manager)
 
         # 保存重分配的段落和格式到caches文件夹,以文件名+result命名
 
@@ -270,27 +294,14 @@ def check_format(doc_path: str, config_path: str, format_agent: FormatAgent) ->
 
         print(f"重分配结果已保存到: {result_path}")
 
-        # 检查是否正确
-        check_para_type(format_agent, manager)
-
-        # 检查摘要和关键词格式
-        errors.extend(check_abstract(manager))
-        errors.extend(check_keywords(manager))
-        errors.extend(check_required_paragraphs(manager, required_format))
-        errors.extend(check_reference_format(doc_path, required_format))
-        errors.extend(check_table_format(doc_path, required_format))
-        errors.extend(check_figure_format(doc_path, required_format, manager))
-
-        # 将段落信息转换为字典格式（包含完整的meta信息）
-        paragraphs_dict = manager.to_dict()
-        for para_dict in paragraphs_dict:
-            para_type = para_dict["type"]
-            para_content = para_dict["content"]
-            if len(para_content) <= 1:
-                pass
-            para_meta = para_dict["meta"]
-            # 检查段落格式
-            errors.extend(_recursive_check(para_meta, required_format.get(para_type, {}), para_content))
+        # 只并发复核有分歧的段落
+        verify_flagged_para_types(format_agent, manager, flagged)
+
+        # 执行所有已注册的检查器（页面、摘要、关键词、参考文献、图表、段落格式等）
+        context = DocumentContext(doc_path, required_format, manager, rule_plan)
+        checker_errors, checker_results = run_checkers(context)
+        errors.extend(checker_errors)
+        print(format_timing_report(checker_results))
 
         # 将错误信息翻译为中文
         translated_errors = translate_errors(errors)
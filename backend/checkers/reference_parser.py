@@ -0,0 +1,235 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Tuple
+
+# 参考文献解析引擎：每种引用样式预编译为一组语法，条目只解析一次并按内容哈希缓存
+
+# GB/T 7714 条目的公共前缀：[序号] 作者. 题名
+_GBT_HEAD = r'^\[(?P<number>\d+)\]\s+(?P<authors>[\w\s,]+)\.\s+(?P<title>.+)'
+
+# GB/T 7714 各文献类型的语法，按类型标识检测的优先级排列
+GBT_GRAMMARS: Dict[str, Tuple[str, Pattern]] = {
+    # [序号] 作者. 题名[J]. 刊名, 出版年, 卷号(期号): 起止页码.
+    'J': ('期刊论文', re.compile(
+        _GBT_HEAD + r'\[(?P<ref_type>J(?:/OL)?)\]\.\s+(?P<venue>.+),\s+(?P<year>\d{4})'
+        r'(?:,\s+(?P<volume>\d+)(?:\((?P<issue>\d+)\))?)?(?:\:\s*(?P<pages>\d+(?:-\d+)?))?\.?$',
+        re.UNICODE)),
+    # [序号] 作者. 书名[M]. 版本. 出版地: 出版社, 出版年: 起止页码.
+    'M': ('专著', re.compile(
+        _GBT_HEAD + r'\[(?P<ref_type>M)\]\.\s+.*?'
+        r'(?:\:\s+(?P<venue>.+),\s+(?P<year>\d{4})(?:\:\s*(?P<pages>\d+(?:-\d+)?))?)?\.?$',
+        re.UNICODE)),
+    # [序号] 作者. 题名[D]. 保存地: 保存单位, 出版年.
+    'D': ('学位论文', re.compile(
+        _GBT_HEAD + r'\[(?P<ref_type>D)\]\.\s+.*?(?:\:\s+(?P<venue>.+),\s+(?P<year>\d{4}))?\.?$',
+        re.UNICODE)),
+    # [序号] 作者. 题名[C]. 会议名, 会议地点, 会议年份. 出版地: 出版者, 出版年: 起止页码.
+    'C': ('会议论文', re.compile(
+        _GBT_HEAD + r'\[(?P<ref_type>C(?:/OL)?)\]\.\s+(?P<venue>.+?)(?:,\s+.+,\s+(?P<year>\d{4}))?\.'
+        r'(?:\s+.+\:\s+.+,\s+\d{4}(?:\:\s*(?P<pages>\d+(?:-\d+)?))?)?\.?$',
+        re.UNICODE)),
+    # [序号] 作者. 题名[EB/OL]. 出版地: 出版者, 出版年[引用日期]. 获取和访问路径.
+    'EB/OL': ('电子资源', re.compile(
+        _GBT_HEAD + r'\[(?P<ref_type>EB/OL)\]\.(?:\s+(?P<venue>.+)\:\s+.+,\s+(?P<year>\d{4}))?\s*'
+        r'(?:\[(?P<accessed>\d{4}-\d{2}-\d{2})\])?\.(?:\s+(?P<url>https?://.*))?$',
+        re.UNICODE)),
+}
+
+# 文献类型标识到语法键的映射
+_GBT_TYPE_TAGS = {
+    'J': 'J', 'J/OL': 'J',
+    'M': 'M',
+    'D': 'D',
+    'C': 'C', 'C/OL': 'C',
+    'EB/OL': 'EB/OL',
+}
+_GBT_TYPE_PRIORITY = ['J', 'M', 'D', 'C', 'EB/OL']
+
+_GBT_TYPE_TAG_PATTERN = re.compile(r'\[(J/OL|J|M|D|C/OL|C|EB/OL)\]')
+_GBT_NUMBER_PATTERN = re.compile(r'^\[(\d+)\]')
+
+# APA: 作者 (年份). 题名. 来源, 卷(期), 页码.
+APA_GRAMMAR = re.compile(
+    r'^(?P<authors>[\w\s,]+)\s+\((?P<year>\d{4})\)'
+    r'(?:\.\s*(?P<title>[^.]+)\.(?:\s*(?P<venue>[^,.]+))?(?:.*?(?P<pages>\d+(?:-\d+)?)\.?$)?)?',
+    re.UNICODE)
+
+# MLA: 作者. 题名. 来源, 年份, 页码.
+MLA_GRAMMAR = re.compile(
+    r'^(?P<authors>[\w\s,]+)\.'
+    r'(?:\s*"?(?P<title>[^".]+)\.?"?\.?(?:\s*(?P<venue>[^,."]+))?(?:.*?(?P<year>\d{4}))?'
+    r'(?:.*?pp?\.\s*(?P<pages>\d+(?:-\d+)?))?)?',
+    re.UNICODE)
+
+# 用于重复检测的归一化：去掉编号、空白和标点差异
+_DEDUP_STRIP_NUMBER = re.compile(r'^\[\d+\]\s*')
+_DEDUP_COLLAPSE = re.compile(r'[\s.,，。．:：;；]+')
+
+
+@dataclass(frozen=True)
+class ParsedReference:
+    """解析后的参考文献条目"""
+    raw: str
+    style: str
+    number: Optional[int] = None
+    ref_type: Optional[str] = None
+    authors: Tuple[str, ...] = ()
+    year: Optional[str] = None
+    title: Optional[str] = None
+    venue: Optional[str] = None
+    pages: Optional[str] = None
+    problems: Tuple[str, ...] = ()
+
+    @property
+    def valid(self) -> bool:
+        return not self.problems
+
+    @property
+    def dedup_key(self) -> str:
+        """用于检测重复条目的归一化键"""
+        text = _DEDUP_STRIP_NUMBER.sub('', self.raw)
+        return _DEDUP_COLLAPSE.sub(' ', text).strip().lower()
+
+
+def normalize_style(citation_style: str) -> Optional[str]:
+    """将配置中的引用样式名称归一化为 gbt / apa / mla"""
+    style = (citation_style or '').lower()
+    if 'gb' in style:
+        return 'gbt'
+    if 'apa' in style:
+        return 'apa'
+    if 'mla' in style:
+        return 'mla'
+    return None
+
+
+def _split_authors(authors: Optional[str]) -> Tuple[str, ...]:
+    if not authors:
+        return ()
+    return tuple(a.strip() for a in re.split(r'[,，;；]|\band\b|&', authors) if a.strip())
+
+
+def _fields_from_match(match) -> Dict:
+    groups = match.groupdict()
+    return {
+        'authors': _split_authors(groups.get('authors')),
+        'year': groups.get('year'),
+        'title': (groups.get('title') or '').strip() or None,
+        'venue': (groups.get('venue') or '').strip() or None,
+        'pages': groups.get('pages'),
+    }
+
+
+def _parse_gbt(raw: str, standard: str) -> ParsedReference:
+    number_match = _GBT_NUMBER_PATTERN.match(raw)
+    if not number_match:
+        return ParsedReference(raw=raw, style='gbt', problems=('编号格式错误，应以[数字]开头',))
+
+    number = int(number_match.group(1))
+    problems = []
+
+    # 检查作者与题名之间的分隔符
+    if '. ' not in raw and '．' not in raw:
+        problems.append('作者与题名之间缺少正确的分隔符')
+
+    # 按优先级确定文献类型
+    tags = {_GBT_TYPE_TAGS[tag] for tag in _GBT_TYPE_TAG_PATTERN.findall(raw)}
+    grammar_key = next((key for key in _GBT_TYPE_PRIORITY if key in tags), None)
+    if grammar_key is None:
+        return ParsedReference(raw=raw, style='gbt', number=number,
+                               problems=tuple(problems) + (f'不符合的参考文献类型: {raw}',))
+
+    type_name, grammar = GBT_GRAMMARS[grammar_key]
+    match = grammar.match(raw)
+    if not match:
+        problems.append(f'{type_name}格式不符合{standard}标准')
+        return ParsedReference(raw=raw, style='gbt', number=number, ref_type=grammar_key,
+                               problems=tuple(problems))
+
+    return ParsedReference(raw=raw, style='gbt', number=number, ref_type=grammar_key,
+                           problems=tuple(problems), **_fields_from_match(match))
+
+
+def _parse_apa(raw: str) -> ParsedReference:
+    match = APA_GRAMMAR.match(raw)
+    if not match:
+        return ParsedReference(raw=raw, style='apa', problems=('作者和年份格式不符合APA标准',))
+    return ParsedReference(raw=raw, style='apa', **_fields_from_match(match))
+
+
+def _parse_mla(raw: str) -> ParsedReference:
+    match = MLA_GRAMMAR.match(raw)
+    if not match:
+        return ParsedReference(raw=raw, style='mla', problems=('作者格式不符合MLA标准',))
+    return ParsedReference(raw=raw, style='mla', **_fields_from_match(match))
+
+
+@lru_cache(maxsize=4096)
+def parse_reference(raw: str, style: str, standard: str = '') -> ParsedReference:
+    """
+    解析单条参考文献，结果按 (条目内容, 样式) 的哈希缓存
+
+    Args:
+        raw: 参考文献原文
+        style: 归一化后的样式（gbt / apa / mla）
+        standard: 配置中的原始标准名称，用于错误信息
+
+    Returns:
+        ParsedReference: 结构化的条目
+    """
+    if style == 'gbt':
+        return _parse_gbt(raw, standard or 'GB/T 7714')
+    if style == 'apa':
+        return _parse_apa(raw)
+    if style == 'mla':
+        return _parse_mla(raw)
+    raise ValueError(f"不支持的引用样式: {style}")
+
+
+def validate_references(references: List[str], style: str, standard: str = '') -> Tuple[List[ParsedReference], List[Tuple[int, str]]]:
+    """
+    批量校验参考文献列表，在一次遍历中完成格式、重复条目与编号连续性检查
+
+    Args:
+        references: 参考文献条目列表
+        style: 归一化后的样式（gbt / apa / mla）
+        standard: 配置中的原始标准名称
+
+    Returns:
+        Tuple[List[ParsedReference], List[Tuple[int, str]]]: 解析结果和 (条目下标, 错误信息) 列表
+    """
+    parsed = []
+    problems = []
+    seen_entries = {}
+    seen_numbers = {}
+    last_number = 0
+
+    for i, raw in enumerate(references):
+        ref = parse_reference(raw, style, standard)
+        parsed.append(ref)
+
+        for problem in ref.problems:
+            if problem.startswith('不符合的参考文献类型'):
+                problems.append((i, problem))
+            else:
+                problems.append((i, f"参考文献 #{i+1} {problem}"))
+
+        # 重复条目检测
+        key = ref.dedup_key
+        if key in seen_entries:
+            problems.append((i, f"参考文献 #{i+1} 与 #{seen_entries[key]+1} 重复"))
+        else:
+            seen_entries[key] = i
+
+        # 编号连续性检测（仅适用于顺序编码制）
+        if ref.number is not None:
+            if ref.number in seen_numbers:
+                problems.append((i, f"参考文献 #{i+1} 编号[{ref.number}]与 #{seen_numbers[ref.number]+1} 重复"))
+            else:
+                seen_numbers[ref.number] = i
+                if ref.number != last_number + 1:
+                    problems.append((i, f"参考文献 #{i+1} 编号不连续，[{last_number}]之后应为[{last_number+1}]，实际为[{ref.number}]"))
+                last_number = max(last_number, ref.number)
+
+    return parsed, problems
@@ -0,0 +1,187 @@
+import time
+import threading
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+import docx
+from backend.preparation.para_type import ParagraphManager
+from backend.checkers.rule_plan import RulePlan, compile_rule_plan
+
+# 检查器注册表：每个检查器声明自己需要的输入以及是否为纯函数，
+# 纯检查器在线程池中并发执行，非纯检查器按注册顺序串行执行
+
+
+class DocumentContext:
+    """一次格式检查共享的文档上下文，docx 文档和页面信息只加载一次"""
+
+    def __init__(self, doc_path: str, required_format: Dict, manager: ParagraphManager,
+                 rule_plan: Optional[RulePlan] = None):
+        self.doc_path = doc_path
+        self.required_format = required_format
+        self.manager = manager
+        self._rule_plan = rule_plan
+        self._document = None
+        self._section_info = None
+        self._lock = threading.Lock()
+
+    @property
+    def document(self):
+        """已解析的 docx 文档（只读共享）"""
+        with self._lock:
+            if self._document is None:
+                self._document = docx.Document(self.doc_path)
+            return self._document
+
+    @property
+    def section_info(self) -> Dict:
+        """页面设置信息"""
+        with self._lock:
+            if self._section_info is None:
+                from backend.preparation.docx_parser import extract_section_info
+                self._section_info = extract_section_info(self.doc_path)
+            return self._section_info
+
+    @property
+    def rule_plan(self) -> RulePlan:
+        """检查规则计划，使用模板库中的模板时已预先编译"""
+        with self._lock:
+            if self._rule_plan is None:
+                self._rule_plan = compile_rule_plan(self.required_format)
+            return self._rule_plan
+
+
+# 输入名称 -> 从上下文中取值的方法
+INPUT_PROVIDERS: Dict[str, Callable[[DocumentContext], object]] = {
+    'context': lambda ctx: ctx,
+    'doc_path': lambda ctx: ctx.doc_path,
+    'document': lambda ctx: ctx.document,
+    'section_info': lambda ctx: ctx.section_info,
+    'manager': lambda ctx: ctx.manager,
+    'config': lambda ctx: ctx.required_format,
+    'rule_plan': lambda ctx: ctx.rule_plan,
+}
+
+
+@dataclass
+class CheckerSpec:
+    """检查器声明"""
+    name: str
+    func: Callable[..., List[Dict]]
+    inputs: Tuple[str, ...]
+    config_section: Optional[str] = None
+    pure: bool = True
+
+    def build_args(self, ctx: DocumentContext) -> list:
+        args = [INPUT_PROVIDERS[name](ctx) for name in self.inputs]
+        if self.config_section is not None:
+            args.append(ctx.required_format.get(self.config_section, {}))
+        return args
+
+
+@dataclass
+class CheckerResult:
+    """单个检查器的执行结果"""
+    name: str
+    errors: List[Dict] = field(default_factory=list)
+    elapsed: float = 0.0
+    exception: Optional[str] = None
+
+    @property
+    def error_count(self) -> int:
+        return len(self.errors)
+
+
+_REGISTRY: Dict[str, CheckerSpec] = {}
+
+
+def register_checker(name: str, inputs: Tuple[str, ...] = ('manager',), config_section: str = None, pure: bool = True):
+    """
+    注册检查器的装饰器，检查器按 inputs 声明的顺序接收位置参数
+
+    Args:
+        name: 检查器名称，重复注册时覆盖旧的实现
+        inputs: 需要的输入，取值见 INPUT_PROVIDERS
+        config_section: 需要的配置段名称，作为最后一个位置参数传入
+        pure: 是否为纯函数（不修改段落管理器），纯检查器可并发执行
+
+    Returns:
+        Callable: 原函数
+    """
+    unknown = [item for item in inputs if item not in INPUT_PROVIDERS]
+    if unknown:
+        raise ValueError(f"未知的检查器输入: {unknown}")
+
+    def decorator(func):
+        _REGISTRY[name] = CheckerSpec(name, func, tuple(inputs), config_section, pure)
+        return func
+
+    return decorator
+
+
+def unregister_checker(name: str) -> None:
+    """移除已注册的检查器"""
+    _REGISTRY.pop(name, None)
+
+
+def registered_checkers() -> List[CheckerSpec]:
+    """按注册顺序返回所有检查器"""
+    return list(_REGISTRY.values())
+
+
+def _run_one(spec: CheckerSpec, ctx: DocumentContext) -> CheckerResult:
+    result = CheckerResult(spec.name)
+    start = time.perf_counter()
+    try:
+        result.errors = list(spec.func(*spec.build_args(ctx)) or [])
+    except Exception as e:
+        result.exception = str(e)
+        result.errors = [{
+            'message': f"检查器 {spec.name} 执行出错: {str(e)}",
+            'location': '格式检查过程'
+        }]
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def run_checkers(ctx: DocumentContext, names: List[str] = None, max_workers: int = None) -> Tuple[List[Dict], List[CheckerResult]]:
+    """
+    执行已注册的检查器，错误按注册顺序汇总，与执行完成的先后无关
+
+    Args:
+        ctx: 文档上下文
+        names: 只执行这些检查器，默认全部
+        max_workers: 线程池大小，默认为纯检查器数量
+
+    Returns:
+        Tuple[List[Dict], List[CheckerResult]]: 错误列表和每个检查器的执行结果
+    """
+    specs = [spec for spec in registered_checkers() if names is None or spec.name in names]
+    results: Dict[str, CheckerResult] = {}
+
+    # 非纯检查器可能修改共享状态，先串行执行
+    for spec in specs:
+        if not spec.pure:
+            results[spec.name] = _run_one(spec, ctx)
+
+    pure_specs = [spec for spec in specs if spec.pure]
+    if pure_specs:
+        workers = max_workers or len(pure_specs)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_run_one, spec, ctx): spec.name for spec in pure_specs}
+            for future in concurrent.futures.as_completed(futures):
+                results[futures[future]] = future.result()
+
+    ordered = [results[spec.name] for spec in specs]
+    errors = []
+    for result in ordered:
+        errors.extend(result.errors)
+    return errors, ordered
+
+
+def format_timing_report(results: List[CheckerResult]) -> str:
+    """生成检查器耗时报告，按耗时从高到低排列"""
+    lines = ["检查器耗时统计:"]
+    for result in sorted(results, key=lambda r: r.elapsed, reverse=True):
+        status = f"，异常: {result.exception}" if result.exception else ""
+        lines.append(f"  {result.name}: {result.elapsed * 1000:.1f}ms，{result.error_count} 个错误{status}")
+    return "\n".join(lines)
@@ -0,0 +1,48 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict
+from backend.preparation.para_type import ParsedParaType
+
+# 检查规则计划：把格式配置预先整理为按段落类型索引的期望格式，
+# 模板库在保存配置时生成并存储，检查时直接使用
+
+# 规则计划的格式版本，模板库中版本不同的计划在读取时按配置重新生成
+RULE_PLAN_VERSION = 2
+
+
+@dataclass
+class RulePlan:
+    """
+    编译后的检查规则
+
+    para_rules: 段落类型 -> 该类型段落的期望格式。值为 "Unknown" 的字段保留在计划中：
+    检查时虽不比较期望值，但字号、字体、颜色仍要检查段落内是否一致
+    """
+    para_rules: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def rules_for(self, para_type: str) -> Dict[str, Any]:
+        return self.para_rules.get(para_type, {})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'version': RULE_PLAN_VERSION, 'para_rules': self.para_rules}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RulePlan":
+        return cls(para_rules=data.get('para_rules', {}))
+
+
+def compile_rule_plan(config: Dict[str, Any]) -> RulePlan:
+    """
+    由格式配置生成检查规则计划
+
+    Args:
+        config: 格式配置字典
+
+    Returns:
+        RulePlan: 检查规则计划
+    """
+    para_types = {member.value for member in ParsedParaType}
+    para_rules = {}
+    for key, value in config.items():
+        if key in para_types and isinstance(value, dict):
+            para_rules[key] = value
+    return RulePlan(para_rules)
@@ -8,6 +8,11 @@ from .format_editor import (
     format_table_caption
 )
 
+from .style_formatter import (
+    generate_styled_doc,
+    ensure_paragraph_styles
+)
+
 from .format_fixer import (
     FormatFixer,
     batch_fix_errors,
@@ -16,6 +21,7 @@ from .format_fixer import (
 
 from .document_marker import (
     mark_document_errors,
+    mark_errors_with_comments,
     parse_error_message
 )
 
@@ -25,9 +31,12 @@ __all__ = [
     'generate_formatted_doc',
     'add_figure_caption',
     'format_table_caption',
+    'generate_styled_doc',
+    'ensure_paragraph_styles',
     'FormatFixer',
     'batch_fix_errors',
     'apply_format_requirements',
     'mark_document_errors',
+    'mark_errors_with_comments',
     'parse_error_message'
 ]
\ No newline at end of file
@@ -6,9 +6,21 @@ import re
 from datetime import datetime
 from typing import Dict, List, Optional, Union, Tuple, Any
 from backend.preparation.para_type import ParagraphManager, ParsedParaType, ParaInfo
+from backend.utils.translation_utils import translation_dict, translate_to_chinese
+from backend.editors.docx_writer import save_document
+from docx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from docx.opc.oxml import serialize_part_xml
+from docx.opc.packuri import PackURI
+from docx.opc.part import XmlPart
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls
 from docx.oxml.ns import qn  # 导入qn函数，用于XML命名空间
 
-def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Optional[ParagraphManager] = None, output_path: Optional[str] = None) -> str:
+# 批注作者信息
+COMMENT_AUTHOR = '格式检查'
+COMMENT_INITIALS = 'GS'
+
+def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Optional[ParagraphManager] = None, output_path: Optional[str] = None, mode: str = 'inline') -> str:
     """
     标记文档中的格式错误，将错误内容标记为红色，并在内容后面添加错误说明
 
@@ -17,6 +29,7 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
         errors: 错误列表
         para_manager: 段落管理器（可选）
         output_path: 输出文档路径
+        mode: 标记方式，inline 为红色标记并追加说明，comments 为插入 Word 批注
 
     Returns:
         str: 标记后的文档路径
@@ -24,6 +37,9 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
     # 加载文档
     doc = Document(doc_path)
 
+    if mode == 'comments' and errors:
+        return mark_errors_with_comments(doc, doc_path, errors, para_manager, output_path)
+
     # 检查错误列表是否为空
     if not errors or len(errors) == 0:
         # 添加标题 - 使用更通用的方式
@@ -48,7 +64,7 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
             output_path = os.path.join(os.path.dirname(doc_path), f"marked_{os.path.basename(doc_path)}")
 
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        doc.save(output_path)
+        save_document(doc, output_path, doc_path)
         return output_path
 
     # 添加标题 - 使用更通用的方式
@@ -91,43 +107,9 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
             # 设置中文字体
             location_run.element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
 
-    # 按段落分组错误
-    errors_by_para = {}
-    for error in errors:
-        location = error.get('location', '')
-        if location and '.' in location:
-            # 提取段落内容的前几个字作为标识
-            parts = location.split('.', 1)
-            error_type = parts[0].strip()
-            para_identifier = parts[1].strip()
-
-            if para_identifier not in errors_by_para:
-                errors_by_para[para_identifier] = []
-
-            # 添加错误类型到错误信息中
-            error_with_type = error.copy()
-            if 'error_type' not in error_with_type:
-                error_with_type['error_type'] = error_type
-
-            errors_by_para[para_identifier].append(error_with_type)
-
     # 处理段落错误
-    for para in doc.paragraphs:
+    for para, para_errors in match_errors_to_paragraphs(doc, errors, para_manager):
         para_text = para.text
-        if not para_text.strip():
-            continue
-
-        # 查找匹配的错误
-        para_errors = []
-        for para_id, err_list in errors_by_para.items():
-            # 使用前30个字符作为匹配依据
-            para_start = para_text[:30] if len(para_text) > 30 else para_text
-            if para_start.startswith(para_id) or para_id.startswith(para_start):
-                para_errors = err_list
-                break
-
-        if not para_errors:
-            continue
 
         # 清除段落中的所有运行
         try:
@@ -151,23 +133,7 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
         run.element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
 
         # 添加错误说明
-        error_text = " （"
-        for i, error in enumerate(para_errors):
-            error_message = error.get('message', '')
-            error_type = error.get('error_type', '')
-
-            # 解析错误消息，提取错误类型、要求值和实际值
-            parsed_error = parse_error_message(error_message)
-            if parsed_error[0]:
-                error_type, required_value, actual_value = parsed_error
-                error_text += f"{error_type}应为{required_value}，实际为{actual_value}"
-            else:
-                error_text += error_message
-
-            if i < len(para_errors) - 1:
-                error_text += "；"
-
-        error_text += "）"
+        error_text = " （" + "；".join(describe_error(error) for error in para_errors) + "）"
         error_run = para.add_run(error_text)
         error_run.font.color.rgb = RGBColor(255, 0, 0)
         error_run.italic = True
@@ -226,7 +192,7 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
     try:
         # 确保输出目录存在
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        doc.save(output_path)
+        save_document(doc, output_path, doc_path)
         print(f"文档已成功标记并保存到: {output_path}")
     except Exception as e:
         print(f"保存标记文档时出错: {str(e)}")
@@ -234,12 +200,222 @@ def mark_document_errors(doc_path: str, errors: List[Dict], para_manager: Option
         caches_folder = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'caches')
         os.makedirs(caches_folder, exist_ok=True)
         temp_output_path = os.path.join(caches_folder, f"marked_{os.path.basename(doc_path)}")
-        doc.save(temp_output_path)
+        save_document(doc, temp_output_path, doc_path)
         print(f"文档已保存到caches目录: {temp_output_path}")
         output_path = temp_output_path
 
     return output_path
 
+def _get_or_add_comments_part(doc) -> Tuple[Any, Any, bool]:
+    """
+    获取文档的批注部件，不存在时新建
+
+    Returns:
+        Tuple[Any, Any, bool]: (批注部件, w:comments 根元素, 是否为已有部件)
+    """
+    for rel in doc.part.rels.values():
+        if rel.reltype == RT.COMMENTS and not rel.is_external:
+            part = rel.target_part
+            element = getattr(part, 'element', None)
+            if element is None:
+                element = parse_xml(part.blob)
+            return part, element, True
+
+    element = parse_xml(f'<w:comments {nsdecls("w")}/>')
+    part = XmlPart(PackURI('/word/comments.xml'), CT.WML_COMMENTS, element, doc.part.package)
+    doc.part.relate_to(part, RT.COMMENTS)
+    return part, element, False
+
+def _build_comment(comment_id: int, lines: List[str], date: str):
+    """构造 w:comment 元素，每条说明一个段落"""
+    comment = OxmlElement('w:comment')
+    comment.set(qn('w:id'), str(comment_id))
+    comment.set(qn('w:author'), COMMENT_AUTHOR)
+    comment.set(qn('w:initials'), COMMENT_INITIALS)
+    comment.set(qn('w:date'), date)
+    for line in lines:
+        p = OxmlElement('w:p')
+        r = OxmlElement('w:r')
+        t = OxmlElement('w:t')
+        t.set(qn('xml:space'), 'preserve')
+        t.text = line
+        r.append(t)
+        p.append(r)
+        comment.append(p)
+    return comment
+
+def _anchor_comment(para, comment_id: int) -> None:
+    """用 commentRangeStart/End 包住整个段落，并在段尾添加批注引用"""
+    p = para._p
+    start = OxmlElement('w:commentRangeStart')
+    start.set(qn('w:id'), str(comment_id))
+    if p.pPr is not None:
+        p.pPr.addnext(start)
+    else:
+        p.insert(0, start)
+
+    end = OxmlElement('w:commentRangeEnd')
+    end.set(qn('w:id'), str(comment_id))
+    p.append(end)
+
+    reference_run = OxmlElement('w:r')
+    reference = OxmlElement('w:commentReference')
+    reference.set(qn('w:id'), str(comment_id))
+    reference_run.append(reference)
+    p.append(reference_run)
+
+def mark_errors_with_comments(doc, doc_path: str, errors: List[Dict], para_manager: Optional[ParagraphManager] = None, output_path: Optional[str] = None) -> str:
+    """
+    以 Word 批注的形式标记错误：一次扫描正文完成定位，所有批注批量写入 comments.xml
+
+    Args:
+        doc: 已加载的文档对象
+        doc_path: 文档路径
+        errors: 错误列表
+        para_manager: 段落管理器（可选）
+        output_path: 输出文档路径
+
+    Returns:
+        str: 标记后的文档路径
+    """
+    part, comments, existing = _get_or_add_comments_part(doc)
+    next_id = max((int(c.get(qn('w:id'))) for c in comments.iterchildren(qn('w:comment'))), default=-1) + 1
+    first_id = next_id
+    date = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+
+    anchored = set()
+    for para, para_errors in match_errors_to_paragraphs(doc, errors, para_manager):
+        comments.append(_build_comment(next_id, [describe_error(error) for error in para_errors], date))
+        _anchor_comment(para, next_id)
+        next_id += 1
+        anchored.update(id(error) for error in para_errors)
+
+    # 无法定位到段落的错误汇总为一条批注，挂在第一个非空段落上
+    unanchored = [error for error in errors if id(error) not in anchored]
+    first_para = next((para for para in doc.paragraphs if para.text.strip()), None) if unanchored else None
+    if first_para is not None:
+        lines = [f"未定位到段落的格式问题（{len(unanchored)} 个）："]
+        lines.extend(f"{error.get('location', '')}: {describe_error(error)}" for error in unanchored)
+        comments.append(_build_comment(next_id, lines, date))
+        _anchor_comment(first_para, next_id)
+        next_id += 1
+
+    # 非 XmlPart 形式加载的批注部件需要写回序列化结果
+    if getattr(part, 'element', None) is None:
+        part._blob = serialize_part_xml(comments)
+
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(doc_path), f"marked_{os.path.basename(doc_path)}")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    save_document(doc, output_path, doc_path, dirty_parts=[str(part.partname)] if existing else ())
+    print(f"已插入 {next_id - first_id} 条批注并保存到: {output_path}")
+    return output_path
+
+def match_errors_to_paragraphs(doc, errors: List[Dict], para_manager: Optional[ParagraphManager] = None) -> List[Tuple[Any, List[Dict]]]:
+    """
+    一次扫描文档正文，把错误分配到对应的段落
+
+    带段落ID的结构化错误通过段落管理器记录的原始段落下标直接定位，
+    其余错误按 location 中的段落内容前缀匹配
+
+    Args:
+        doc: 文档对象
+        errors: 错误列表
+        para_manager: 段落管理器（可选）
+
+    Returns:
+        List[Tuple[Any, List[Dict]]]: (段落, 该段落的错误列表)，按文档顺序排列
+    """
+    # 带段落ID的结构化错误：通过段落管理器记录的原始段落下标直接定位
+    errors_by_source = {}
+    resolved = set()
+    if para_manager is not None:
+        for error in errors:
+            para_id = error.get('para_id')
+            if not para_id or not para_id.startswith('para') or not para_id[4:].isdigit():
+                continue
+            manager_index = int(para_id[4:])
+            if manager_index >= len(para_manager.paragraphs):
+                continue
+            source_index = (para_manager.paragraphs[manager_index].meta or {}).get('source_index')
+            if isinstance(source_index, int) and source_index >= 0:
+                errors_by_source.setdefault(source_index, []).append(error)
+                resolved.add(id(error))
+
+    # 其余错误按 location 中的段落内容前缀分组，已按段落ID定位的错误不参与前缀匹配，
+    # 避免内容开头相同的段落（如多个"图…"题注）互相认领对方的错误
+    errors_by_para = {}
+    for error in errors:
+        if id(error) in resolved:
+            continue
+        location = error.get('location', '')
+        if location and '.' in location:
+            # 提取段落内容的前几个字作为标识
+            para_identifier = location.split('.', 1)[1].strip()
+            errors_by_para.setdefault(para_identifier, []).append(error)
+
+    # 分组标识都是段落内容的前缀，按出现过的长度截取段落开头直接查表
+    key_lengths = sorted({len(key) for key in errors_by_para if key}, reverse=True)
+
+    def prefix_matches(para_start: str) -> List[str]:
+        return [para_start[:length] for length in key_lengths
+                if length <= len(para_start) and para_start[:length] in errors_by_para]
+
+    # 使用前30个字符作为匹配依据
+    paragraphs = [(source_index, para, para.text[:30]) for source_index, para in enumerate(doc.paragraphs)
+                  if para.text.strip()]
+
+    # 段落内容比分组标识短时反过来按分组标识的前缀匹配：只考虑没有被任何段落直接匹配的分组，
+    # 且前缀只对应一个分组，避免"图1"这样的短段落认领"图1-1…"段落的错误
+    claimed = {key for _, _, para_start in paragraphs for key in prefix_matches(para_start)}
+    identifier_prefixes = {}
+    for identifier in errors_by_para:
+        if identifier in claimed:
+            continue
+        for length in range(1, len(identifier)):
+            identifier_prefixes.setdefault(identifier[:length], []).append(identifier)
+
+    matched = []
+    for source_index, para, para_start in paragraphs:
+        # 按原始段落下标定位的错误和按内容前缀匹配的错误合并
+        para_errors = list(errors_by_source.get(source_index, []))
+        for key in prefix_matches(para_start):
+            para_errors.extend(errors_by_para[key])
+        if key_lengths and len(para_start) < key_lengths[0]:
+            candidates = identifier_prefixes.get(para_start, [])
+            if len(candidates) == 1:
+                para_errors.extend(errors_by_para[candidates[0]])
+
+        if para_errors:
+            matched.append((para, para_errors))
+
+    return matched
+
+def describe_error(error: Dict) -> str:
+    """
+    生成面向用户的单条错误说明
+
+    Args:
+        error: 错误字典
+
+    Returns:
+        str: 错误说明，如 "字号应为12pt，实际为10.5pt"
+    """
+    error_message = error.get('message', '')
+
+    # 结构化错误直接使用字段、要求值和实际值，否则解析错误消息
+    if error.get('field') and error.get('expected') is not None:
+        field_name = error['field'].rsplit('.', 1)[-1]
+        parsed_error = (translation_dict.get(field_name, field_name),
+                        translate_to_chinese(str(error['expected'])),
+                        translate_to_chinese(str(error.get('actual'))))
+    else:
+        parsed_error = parse_error_message(error_message)
+    if parsed_error[0]:
+        error_type, required_value, actual_value = parsed_error
+        return f"{error_type}应为{required_value}，实际为{actual_value}"
+    return error_message
+
 def parse_error_message(error_message: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
     """
     解析错误消息，提取错误类型和要求值
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import Iterable, Optional, Set
+from docx.opc.constants import CONTENT_TYPE as CT
+
+# 增量写出 docx：以原文档压缩包为基础，只重新序列化被修改过的 XML 部件，
+# 图片、字体、嵌入对象等其余成员按原内容逐块复制，不经过 python-docx 的完整序列化
+
+# 默认视为已修改的部件类型（正文和样式）
+DIRTY_CONTENT_TYPES = {CT.WML_DOCUMENT_MAIN, CT.WML_STYLES}
+
+_CONTENT_TYPES_MEMBER = '[Content_Types].xml'
+_PACKAGE_RELS_MEMBER = '_rels/.rels'
+
+
+def _member_name(partname) -> str:
+    # 部件名以 / 开头，压缩包成员名不带前导 /
+    return str(partname).lstrip('/')
+
+
+def _copy_member(zin: zipfile.ZipFile, zout: zipfile.ZipFile, name: str) -> None:
+    """流式复制一个压缩包成员，保留原有的压缩方式"""
+    info = zin.getinfo(name)
+    target = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    target.compress_type = info.compress_type
+    target.external_attr = info.external_attr
+    with zin.open(info) as src, zout.open(target, 'w') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def _write_patched(doc, source_path: str, output_path: str, dirty_partnames: Set[str]) -> None:
+    package = doc.part.package
+    parts = list(package.iter_parts())
+
+    with zipfile.ZipFile(source_path) as zin:
+        source_members = set(zin.namelist())
+        new_parts = [part for part in parts if _member_name(part.partname) not in source_members]
+
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+            # 新增部件（如插入的图片、批注）需要重新生成内容类型声明
+            if new_parts or _CONTENT_TYPES_MEMBER not in source_members:
+                from docx.opc.pkgwriter import _ContentTypesItem
+                zout.writestr(_CONTENT_TYPES_MEMBER, _ContentTypesItem.from_parts(parts).blob)
+            else:
+                _copy_member(zin, zout, _CONTENT_TYPES_MEMBER)
+
+            if _PACKAGE_RELS_MEMBER in source_members:
+                _copy_member(zin, zout, _PACKAGE_RELS_MEMBER)
+            else:
+                zout.writestr(_PACKAGE_RELS_MEMBER, package.rels.xml)
+
+            for part in parts:
+                name = _member_name(part.partname)
+                rels_name = _member_name(part.partname.rels_uri)
+                rewrite = name in dirty_partnames or name not in source_members
+
+                if rewrite:
+                    zout.writestr(name, part.blob)
+                else:
+                    _copy_member(zin, zout, name)
+
+                if len(part.rels):
+                    if rewrite or rels_name not in source_members:
+                        zout.writestr(rels_name, part.rels.xml)
+                    else:
+                        _copy_member(zin, zout, rels_name)
+
+
+def save_document(doc, output_path: str, source_path: Optional[str] = None, dirty_parts: Iterable[str] = ()) -> str:
+    """
+    保存文档：提供原文档路径时只重写正文、样式等被修改的部件，其余成员直接复制；
+    无法增量写出时退回到 doc.save
+
+    Args:
+        doc: python-docx 文档对象
+        output_path: 输出文档路径
+        source_path: 加载该文档时使用的原文档路径（可选）
+        dirty_parts: 额外需要重写的部件名，如 /word/numbering.xml
+
+    Returns:
+        str: 输出文档路径
+    """
+    if not source_path or not os.path.exists(source_path) or not zipfile.is_zipfile(source_path):
+        doc.save(output_path)
+        return output_path
+
+    dirty_partnames = {_member_name(name) for name in dirty_parts}
+    for part in doc.part.package.iter_parts():
+        if part.content_type in DIRTY_CONTENT_TYPES:
+            dirty_partnames.add(_member_name(part.partname))
+
+    # 先写到临时文件，输出路径与原文档相同时也不会破坏正在读取的压缩包
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(suffix='.docx', dir=output_dir)
+    os.close(fd)
+    try:
+        _write_patched(doc, source_path, temp_path, dirty_partnames)
+        os.replace(temp_path, output_path)
+    except Exception as e:
+        print(f"增量写出文档失败，改用完整保存: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        doc.save(output_path)
+
+    return output_path
@@ -2,13 +2,26 @@ from docx import Document
 from docx.shared import Pt, RGBColor, Cm, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
 from docx.enum.section import WD_ORIENT
+import copy
+import hashlib
 import json
 import os
 import re
 import requests
 from typing import Dict, List, Optional, Union, Tuple
 from backend.preparation.para_type import ParagraphManager, ParsedParaType, ParaInfo
+from backend.utils.label_matcher import CAPTION_LABELS, leading_label
+from backend.editors.docx_writer import save_document
+from backend.agents.caption_pipeline import (
+    CaptionPipeline,
+    CaptionRequest,
+    get_cached_caption,
+    set_cached_caption
+)
+from backend.preparation.image_preprocess import prepare_image
 from docx.oxml.ns import qn  # 导入qn函数，用于XML命名空间
+from docx.oxml import parse_xml
+from lxml import etree
 
 # 全局映射字典
 ALIGNMENT_MAP = {
@@ -294,6 +307,9 @@ def is_chinese_char(char: str) -> bool:
     """判断字符是否为中文"""
     return '\u4e00' <= char <= '\u9fff'
 
+# 中文连续段与非中文连续段交替出现，一次匹配完成分段
+LANGUAGE_SEGMENT_PATTERN = re.compile(r'[\u4e00-\u9fff]+|[^\u4e00-\u9fff]+')
+
 def split_text_by_language(text: str) -> List[Tuple[str, bool]]:
     """
     将文本按中英文分段
@@ -304,29 +320,223 @@ def split_text_by_language(text: str) -> List[Tuple[str, bool]]:
     Returns:
         List[Tuple[str, bool]]: 文本段列表，每项是(文本段, 是否中文)
     """
-    result = []
-    current_text = ""
-    current_is_chinese = None
+    return [(segment, is_chinese_char(segment[0])) for segment in LANGUAGE_SEGMENT_PATTERN.findall(text)]
 
-    for char in text:
-        is_chinese = is_chinese_char(char)
+class FormattingEngine:
+    """
+    批量格式化引擎
 
-        # 首个字符或当前字符类型与前面相同
-        if current_is_chinese is None or is_chinese == current_is_chinese:
-            current_text += char
-            current_is_chinese = is_chinese
-        else:
-            # 字符类型发生变化，保存前一段并开始新段
-            if current_text:
-                result.append((current_text, current_is_chinese))
-            current_text = char
-            current_is_chinese = is_chinese
+    每种 (格式键, 是否中文, 设置内容) 的字体设置只计算一次，生成现成的 w:rPr 模板；
+    每种段落格式同样预先生成 w:pPr 模板。新建的 run 直接克隆模板，
+    不再逐个 run 调用 apply_font_settings / apply_paragraph_format。
+    模板键中包含设置内容的哈希，同一格式键使用不同设置时各自生成模板
+    """
 
-    # 添加最后一段
-    if current_text:
-        result.append((current_text, current_is_chinese))
+    def __init__(self, config: Dict):
+        self.config = config
+        self._scratch_doc = None
+        self._run_templates = {}
+        self._para_templates = {}
+        # id(设置字典) -> (设置字典, 哈希)，同一个设置字典只序列化一次
+        self._settings_digests = {}
+
+    def _settings_digest(self, settings: Dict) -> str:
+        """设置内容的哈希，作为模板键的一部分"""
+        cached = self._settings_digests.get(id(settings))
+        if cached is not None and cached[0] is settings:
+            return cached[1]
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()[:16]
+        self._settings_digests[id(settings)] = (settings, digest)
+        return digest
+
+    def _scratch_paragraph(self):
+        # 在草稿文档上生成模板，避免污染目标文档
+        if self._scratch_doc is None:
+            self._scratch_doc = Document()
+        return self._scratch_doc.add_paragraph()
+
+    def run_template(self, key: str, font_settings: Dict, is_chinese: bool = True):
+        """
+        获取字体设置对应的 w:rPr 模板
+
+        Args:
+            key: 模板键，通常为段落类型，如 body / figures.caption
+            font_settings: 字体设置字典
+            is_chinese: 是否为中文
+
+        Returns:
+            w:rPr 元素，设置为空时返回 None
+        """
+        cache_key = (key, is_chinese, self._settings_digest(font_settings))
+        if cache_key not in self._run_templates:
+            run = self._scratch_paragraph().add_run()
+            apply_font_settings(run, font_settings, is_chinese)
+            rPr = run._r.rPr
+            self._run_templates[cache_key] = copy.deepcopy(rPr) if rPr is not None else None
+        return self._run_templates[cache_key]
+
+    def paragraph_template(self, key: str, format_settings: Dict):
+        """
+        获取段落格式设置对应的 w:pPr 模板
+
+        Args:
+            key: 模板键，通常为段落类型
+            format_settings: 段落格式设置字典
+
+        Returns:
+            w:pPr 元素，设置为空时返回 None
+        """
+        cache_key = (key, self._settings_digest(format_settings))
+        if cache_key not in self._para_templates:
+            paragraph = self._scratch_paragraph()
+            apply_paragraph_format(paragraph, format_settings)
+            pPr = paragraph._p.pPr
+            self._para_templates[cache_key] = copy.deepcopy(pPr) if pPr is not None else None
+        return self._para_templates[cache_key]
+
+    def precompile(self) -> None:
+        """为配置中每种段落类型（以及图表题注）预先生成全部 w:rPr / w:pPr 模板"""
+        for key, settings in self.config.items():
+            if not isinstance(settings, dict):
+                continue
+            try:
+                if isinstance(settings.get('paragraph_format'), dict):
+                    self.paragraph_template(key, settings['paragraph_format'])
+                if isinstance(settings.get('fonts'), dict):
+                    for is_chinese in (True, False):
+                        self.run_template(key, settings['fonts'], is_chinese)
+                caption = settings.get('caption')
+                if isinstance(caption, dict) and isinstance(caption.get('fonts'), dict):
+                    for is_chinese in (True, False):
+                        self.run_template(f"{key}.caption", caption['fonts'], is_chinese)
+            except Exception as e:
+                # 无法预先生成的模板在使用时按需生成
+                print(f"预生成 {key} 的格式模板失败: {str(e)}")
+
+    def export_templates(self) -> Dict:
+        """
+        导出已生成的模板，可序列化为 JSON 保存
+
+        Returns:
+            Dict: {'run': [[模板键, 是否中文, 设置哈希, rPr XML]], 'para': [[模板键, 设置哈希, pPr XML]]}，
+                设置为空的模板 XML 为 None
+        """
+        def to_xml(element):
+            return etree.tostring(element, encoding='unicode') if element is not None else None
+
+        return {
+            'run': [[key, is_chinese, digest, to_xml(rPr)] for (key, is_chinese, digest), rPr in self._run_templates.items()],
+            'para': [[key, digest, to_xml(pPr)] for (key, digest), pPr in self._para_templates.items()],
+        }
 
-    return result
+    @classmethod
+    def from_templates(cls, config: Dict, templates: Dict) -> "FormattingEngine":
+        """
+        用 export_templates 导出的模板创建引擎，已有的模板不再在草稿文档上重新生成
+
+        Args:
+            config: 格式配置字典
+            templates: export_templates 的结果
+
+        Returns:
+            FormattingEngine: 格式化引擎
+        """
+        engine = cls(config)
+        # 旧格式的模板不含设置哈希，无法确认对应的设置，跳过后在使用时按需生成
+        for entry in templates.get('run', []):
+            if len(entry) == 4:
+                key, is_chinese, digest, xml = entry
+                engine._run_templates[(key, is_chinese, digest)] = parse_xml(xml) if xml else None
+        para_templates = templates.get('para', [])
+        for entry in para_templates if isinstance(para_templates, list) else []:
+            key, digest, xml = entry
+            engine._para_templates[(key, digest)] = parse_xml(xml) if xml else None
+        return engine
+
+    def copy(self) -> "FormattingEngine":
+        """共享已生成模板的新引擎（模板在使用时总是先复制），每次生成文档使用各自的草稿文档"""
+        engine = FormattingEngine(self.config)
+        engine._run_templates = dict(self._run_templates)
+        engine._para_templates = dict(self._para_templates)
+        return engine
+
+    def apply_paragraph_format(self, paragraph, key: str, format_settings: Dict) -> None:
+        """
+        将段落格式模板合并到段落上，只覆盖模板中出现的属性，保留段落原有的样式、编号和分节信息
+
+        Args:
+            paragraph: 段落对象
+            key: 模板键
+            format_settings: 段落格式设置字典
+        """
+        template = self.paragraph_template(key, format_settings)
+        if template is None:
+            return
+
+        pPr = paragraph._p.get_or_add_pPr()
+        for child in template:
+            tag_name = child.tag.rsplit('}', 1)[-1]
+            existing = pPr.find(child.tag)
+            if existing is not None:
+                # 与 python-docx 的属性设置语义一致：逐个覆盖属性
+                for attr, value in child.attrib.items():
+                    existing.set(attr, value)
+                continue
+            insert = getattr(pPr, f'_insert_{tag_name}', None)
+            if insert is not None:
+                insert(copy.deepcopy(child))
+
+    def add_formatted_text(self, paragraph, text: str, key: str, font_settings: Dict) -> List:
+        """
+        按中英文分段向段落添加文本，并克隆对应的字体模板
+
+        Args:
+            paragraph: 段落对象
+            text: 文本内容
+            key: 模板键
+            font_settings: 字体设置字典
+
+        Returns:
+            List: 新建的 run 列表
+        """
+        runs = []
+        for segment, is_chinese in split_text_by_language(text):
+            run = paragraph.add_run(segment)
+            self.apply_font_template(run, key, font_settings, is_chinese)
+            runs.append(run)
+        return runs
+
+    def apply_font_template(self, run, key: str, font_settings: Dict, is_chinese: bool = True) -> None:
+        """
+        将字体模板应用到 run 上：新建的 run 直接克隆整个 w:rPr，
+        已有格式的 run 只替换模板中出现的属性，保留上下标等其他设置
+
+        Args:
+            run: 文本运行对象
+            key: 模板键
+            font_settings: 字体设置字典
+            is_chinese: 是否为中文
+        """
+        template = self.run_template(key, font_settings, is_chinese)
+        if template is None:
+            return
+        r = run._r
+        if r.rPr is None:
+            r.insert(0, copy.deepcopy(template))
+            return
+
+        rPr = r.rPr
+        for child in template:
+            existing = rPr.find(child.tag)
+            if existing is not None:
+                rPr.replace(existing, copy.deepcopy(child))
+                continue
+            insert = getattr(rPr, f'_insert_{child.tag.rsplit("}", 1)[-1]}', None)
+            if insert is not None:
+                insert(copy.deepcopy(child))
+
+# 生成图片题注使用的视觉模型
+IMAGE_CAPTION_MODEL = "gpt-4-vision-preview"
 
 def get_openai_image_caption(image_path: str) -> str:
     """
@@ -343,10 +553,11 @@ def get_openai_image_caption(image_path: str) -> str:
         if not api_key:
             return "图片题注（需要设置OpenAI API密钥）"
 
-        # 读取图片并转为base64
-        import base64
-        with open(image_path, "rb") as image_file:
-            encoded_image = base64.b64encode(image_file.read()).decode('utf-8')
+        # 缩小并转换图片，相同内容的图片直接使用缓存的题注
+        image = prepare_image(image_path)
+        cached = get_cached_caption(IMAGE_CAPTION_MODEL, image.digest)
+        if cached is not None:
+            return cached
 
         # 调用OpenAI API
         headers = {
@@ -355,7 +566,7 @@ def get_openai_image_caption(image_path: str) -> str:
         }
 
         payload = {
-            "model": "gpt-4-vision-preview",
+            "model": IMAGE_CAPTION_MODEL,
             "messages": [
                 {
                     "role": "user",
@@ -367,7 +578,7 @@ def get_openai_image_caption(image_path: str) -> str:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
+                                "url": image.data_url
                             }
                         }
                     ]
@@ -383,13 +594,38 @@ def get_openai_image_caption(image_path: str) -> str:
         )
 
         if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
+            caption = response.json()["choices"][0]["message"]["content"]
+            set_cached_caption(IMAGE_CAPTION_MODEL, image.digest, caption)
+            return caption
         else:
             return f"图 {os.path.basename(image_path)}"
 
     except Exception:
         return f"图 {os.path.basename(image_path)}"
 
+def prefetch_image_captions(para_manager: ParagraphManager, max_workers: int = 4) -> Dict[str, str]:
+    """
+    并发为缺少题注的图片生成题注，格式化循环中直接取用结果
+
+    Args:
+        para_manager: 段落管理器
+        max_workers: 最大并发请求数
+
+    Returns:
+        Dict[str, str]: 图片路径 -> 题注
+    """
+    if not os.environ.get("OPENAI_API_KEY"):
+        return {}
+
+    requests_list = []
+    for para_info in para_manager.paragraphs:
+        image_path = (para_info.meta or {}).get('image_path')
+        if para_info.type == ParsedParaType.FIGURES and not para_info.content and image_path and os.path.exists(image_path):
+            requests_list.append(CaptionRequest(image_path, 'figure', image_path=image_path))
+
+    pipeline = CaptionPipeline(get_openai_image_caption, model=IMAGE_CAPTION_MODEL, max_workers=max_workers)
+    return pipeline.run(requests_list)
+
 def set_paper_format(doc: Document, config: Dict):
     """
     设置文档页面格式
@@ -452,7 +688,8 @@ def set_paper_format(doc: Document, config: Dict):
             elif margin_name == 'right':
                 section.right_margin = Cm(margin_cm)
 
-def format_document(config: Dict, para_manager: ParagraphManager, output_path: str = None, doc_path: str = None) -> str:
+def format_document(config: Dict, para_manager: ParagraphManager, output_path: str = None, doc_path: str = None,
+                    engine: Optional[FormattingEngine] = None) -> str:
     """
     根据配置和段落管理器格式化文档
 
@@ -461,6 +698,7 @@ def format_document(config: Dict, para_manager: ParagraphManager, output_path: s
         para_manager: 段落管理器实例
         output_path: 输出文档路径，如果为None则生成临时文件
         doc_path: 可选的输入文档路径，如果提供则在该文档基础上修改
+        engine: 预先生成模板的格式化引擎（可选），如模板库中已编译的模板
 
     Returns:
         str: 输出文档的路径
@@ -482,6 +720,12 @@ def format_document(config: Dict, para_manager: ParagraphManager, output_path: s
     # 设置页面格式
     set_paper_format(doc, config)
 
+    # 格式模板按段落类型预先生成，逐段克隆
+    engine = engine.copy() if engine is not None else FormattingEngine(config)
+
+    # 缺少题注的图片先批量并发生成题注
+    image_captions = prefetch_image_captions(para_manager)
+
     # 按照段落类型和配置格式化文档
     for para_info in para_manager.paragraphs:
         # 创建新段落
@@ -496,19 +740,12 @@ def format_document(config: Dict, para_manager: ParagraphManager, output_path: s
 
             # 应用段落格式
             if 'paragraph_format' in format_config:
-                apply_paragraph_format(paragraph, format_config['paragraph_format'])
+                engine.apply_paragraph_format(paragraph, para_type, format_config['paragraph_format'])
 
             # 处理文本内容并应用字体设置
             if 'fonts' in format_config:
-                font_settings = format_config['fonts']
-
-                # 拆分中英文
-                segments = split_text_by_language(para_info.content)
-
-                # 为每段添加相应的格式
-                for text, is_chinese in segments:
-                    run = paragraph.add_run(text)
-                    apply_font_settings(run, font_settings, is_chinese)
+                # 拆分中英文并克隆字体模板
+                engine.add_formatted_text(paragraph, para_info.content, para_type, format_config['fonts'])
             else:
                 # 无特殊字体设置，使用默认体
                 paragraph.add_run(para_info.content)
@@ -525,7 +762,7 @@ def format_document(config: Dict, para_manager: ParagraphManager, output_path: s
                 # 创建图片段落（不是题注段落）
                 img_paragraph = doc.add_paragraph()
                 if 'paragraph_format' in config['figures']:
-                    apply_paragraph_format(img_paragraph, config['figures']['paragraph_format'])
+                    engine.apply_paragraph_format(img_paragraph, 'figures', config['figures']['paragraph_format'])
 
                 # 添加图片，设置合适的宽度（可根据需要调整）
                 img_paragraph.add_run().add_picture(image_path, width=Inches(6))
@@ -533,26 +770,26 @@ def format_document(config: Dict, para_manager: ParagraphManager, output_path: s
                 # 生成题注
                 caption = para_info.content
                 if not caption:
-                    caption = get_openai_image_caption(image_path)
+                    caption = image_captions.get(image_path) or get_openai_image_caption(image_path)
 
                 # 添加题注段落
                 caption_paragraph = doc.add_paragraph()
                 if 'paragraph_format' in config['figures']:
-                    apply_paragraph_format(caption_paragraph, config['figures']['paragraph_format'])
+                    engine.apply_paragraph_format(caption_paragraph, 'figures', config['figures']['paragraph_format'])
 
                 # 设置题注文本
                 caption_run = caption_paragraph.add_run(f"图 {para_info.meta.get('figure_number', '')} {caption}")
 
                 # 应用题注字体格式
                 if 'caption' in config['figures'] and 'fonts' in config['figures']['caption']:
-                    apply_font_settings(caption_run, config['figures']['caption']['fonts'])
+                    engine.apply_font_template(caption_run, 'figures.caption', config['figures']['caption']['fonts'])
 
     # 确定输出路径
     if output_path is None:
         output_path = f"output_{os.path.basename(doc_path)}" if doc_path else "formatted_document.docx"
 
     # 保存文档
-    doc.save(output_path)
+    save_document(doc, output_path, doc_path)
 
     return output_path
 
@@ -617,7 +854,7 @@ def add_figure_caption(config: Dict, doc_path: str, image_path: str, figure_numb
 
     # 保存文档
     output_file = output_path or doc_path
-    doc.save(output_file)
+    save_document(doc, output_file, doc_path)
 
     return output_file
 
@@ -662,11 +899,12 @@ def format_table_caption(config: Dict, doc_path: str, table_number: int, caption
 
     # 保存文档
     output_file = output_path or doc_path
-    doc.save(output_file)
+    save_document(doc, output_file, doc_path)
 
     return output_file
 
-def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_path: str, errors: Optional[List[Dict]] = None, doc_path: Optional[str] = None) -> str:
+def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_path: str, errors: Optional[List[Dict]] = None, doc_path: Optional[str] = None, mode: str = 'direct',
+                           engine: Optional[FormattingEngine] = None) -> str:
     """
     根据段落管理器和配置文件生成格式化的文档，并根据错误信息进行修改
     保留原文档中所有元素的相对位置
@@ -677,6 +915,8 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
         output_path: 输出文档路径
         errors: 错误信息列表（可选）
         doc_path: 原文档路径（可选），如果提供则直接在原文档上修改文本内容
+        mode: 格式化方式，direct 为逐段写入直接格式，style 为按段落类型写入命名样式
+        engine: 预先生成模板的格式化引擎（可选），如模板库中已编译的模板，只用于 direct 方式
 
     Returns:
         str: 生成的文档路径
@@ -685,6 +925,14 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
     if isinstance(config, str):
         config = load_config(config)
 
+    if mode == 'style':
+        # 延迟导入，style_formatter 依赖本模块的格式设置函数
+        from backend.editors.style_formatter import generate_styled_doc
+        return generate_styled_doc(config, para_manager, output_path, errors, doc_path=doc_path)
+
+    # 格式模板按段落类型预先生成，逐段克隆
+    engine = engine.copy() if engine is not None else FormattingEngine(config)
+
     # 判断是否有原文档
     if doc_path and os.path.exists(doc_path):
         # 直接打开原文档进行修改，而不是创建新文档
@@ -710,6 +958,10 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                 para_info = para_manager.paragraphs[para_index]
                 para_type = para_info.type.value
 
+                # 开头的题注前缀（表/图/式）
+                caption_hit = leading_label(para.text, CAPTION_LABELS)
+                caption_kind = caption_hit.label if caption_hit else None
+
                 # 判断是否为表格标题段落
                 is_table_caption = False
                 if i < len(original_paragraphs) - 1:
@@ -717,7 +969,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                     next_para = original_paragraphs[i+1]
                     if not next_para.text.strip() and table_index < len(original_tables):
                         # 可能是表格标题
-                        if para.text.strip().startswith("表"):
+                        if caption_kind == 'table':
                             is_table_caption = True
 
                 # 判断是否为图片
@@ -729,12 +981,12 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                 # 判断是否为图片标题
                 is_figure_caption = False
-                if para.text.strip().startswith("图") and not is_figure:
+                if caption_kind == 'figure' and not is_figure:
                     is_figure_caption = True
 
                 # 判断是否为公式
                 is_equation = False
-                if para.text.strip().startswith("式") or para.text.strip().startswith("公式"):
+                if caption_kind == 'equation':
                     is_equation = True
 
                 # 应用格式设置
@@ -744,7 +996,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                     # 应用段落格式
                     if 'paragraph_format' in format_config:
-                        apply_paragraph_format(para, format_config['paragraph_format'])
+                        engine.apply_paragraph_format(para, para_type, format_config['paragraph_format'])
 
                     # 更新段落文本内容
                     if not is_figure and not is_table_caption and not is_figure_caption and not is_equation:
@@ -755,15 +1007,8 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                         # 处理文本内容并应用字体设置
                         if 'fonts' in format_config:
-                            font_settings = format_config['fonts']
-
-                            # 拆分中英文
-                            segments = split_text_by_language(para_info.content)
-
-                            # 为每段添加相应的格式
-                            for text, is_chinese in segments:
-                                run = para.add_run(text)
-                                apply_font_settings(run, font_settings, is_chinese)
+                            # 拆分中英文并克隆字体模板
+                            engine.add_formatted_text(para, para_info.content, para_type, format_config['fonts'])
                         else:
                             # 无特殊字体设置，使用默认体
                             para.add_run(para_info.content)
@@ -777,7 +1022,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                                 if ref_fonts:
                                     # 如果配置中有字体设置，使用配置中的设置
                                     for run in para.runs:
-                                        apply_font_settings(run, ref_fonts)
+                                        engine.apply_font_template(run, 'references', ref_fonts)
                                 else:
                                     # 如果配置中没有字体设置，使用默认值
                                     for run in para.runs:
@@ -814,11 +1059,11 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                 for cell in row.cells:
                     for paragraph in cell.paragraphs:
                         if 'tables' in config and 'paragraph_format' in config['tables']:
-                            apply_paragraph_format(paragraph, config['tables']['paragraph_format'])
+                            engine.apply_paragraph_format(paragraph, 'tables', config['tables']['paragraph_format'])
 
                         for run in paragraph.runs:
                             if 'tables' in config and 'caption' in config['tables'] and 'fonts' in config['tables']['caption']:
-                                apply_font_settings(run, config['tables']['caption']['fonts'])
+                                engine.apply_font_template(run, 'tables.caption', config['tables']['caption']['fonts'])
     else:
         # 如果没有原文档，则创建新文档（原有逻辑）
         doc = Document()
@@ -974,6 +1219,9 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                     meta=meta_data
                 )
 
+        # 缺少题注的图片先批量并发生成题注
+        image_captions = prefetch_image_captions(para_manager)
+
         # 遍历所有段落并应用相应格式
         for para_info in para_manager.paragraphs:
             # 获取段落类型
@@ -1019,7 +1267,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                     # 添加图片段落
                     img_paragraph = doc.add_paragraph()
                     if 'paragraph_format' in config['figures']:
-                        apply_paragraph_format(img_paragraph, config['figures']['paragraph_format'])
+                        engine.apply_paragraph_format(img_paragraph, 'figures', config['figures']['paragraph_format'])
 
                     # 添加图片
                     width = Inches(6)  # 默认宽度
@@ -1036,7 +1284,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                     # 生成题注
                     caption = para_info.content
                     if not caption:
-                        caption = get_openai_image_caption(image_path)
+                        caption = image_captions.get(image_path) or get_openai_image_caption(image_path)
 
                     # 设置图片编号
                     fig_num = para_info.meta.get('figure_number', figure_number)
@@ -1049,7 +1297,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                     # 添加题注段落
                     caption_paragraph = doc.add_paragraph()
                     if 'paragraph_format' in config['figures']:
-                        apply_paragraph_format(caption_paragraph, config['figures']['paragraph_format'])
+                        engine.apply_paragraph_format(caption_paragraph, 'figures', config['figures']['paragraph_format'])
 
                     # 设置题注文本
                     caption_text = f"图 {fig_num} {caption}"
@@ -1057,7 +1305,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                     # 应用题注字体格式
                     if 'caption' in config['figures'] and 'fonts' in config['figures']['caption']:
-                        apply_font_settings(caption_run, config['figures']['caption']['fonts'])
+                        engine.apply_font_template(caption_run, 'figures.caption', config['figures']['caption']['fonts'])
 
                     # 更新图片编号
                     figure_number += 1
@@ -1077,7 +1325,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                     # 添加题注段落
                     caption_paragraph = doc.add_paragraph()
                     if 'paragraph_format' in config['tables']:
-                        apply_paragraph_format(caption_paragraph, config['tables']['paragraph_format'])
+                        engine.apply_paragraph_format(caption_paragraph, 'tables', config['tables']['paragraph_format'])
 
                     # 设置题注文本
                     caption = para_info.content
@@ -1087,7 +1335,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                     # 应用题注字体格式
                     if 'caption' in config['tables'] and 'fonts' in config['tables']['caption']:
-                        apply_font_settings(caption_run, config['tables']['caption']['fonts'])
+                        engine.apply_font_template(caption_run, 'tables.caption', config['tables']['caption']['fonts'])
 
                 # 正常处理表格
                 # 我们已经将原文档中的表格添加到段落管理器中
@@ -1113,18 +1361,18 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                             # 应用单元格格式
                             for paragraph in cell.paragraphs:
                                 if 'paragraph_format' in config['tables']:
-                                    apply_paragraph_format(paragraph, config['tables']['paragraph_format'])
+                                    engine.apply_paragraph_format(paragraph, 'tables', config['tables']['paragraph_format'])
 
                                 for run in paragraph.runs:
                                     if 'caption' in config['tables'] and 'fonts' in config['tables']['caption']:
-                                        apply_font_settings(run, config['tables']['caption']['fonts'])
+                                        engine.apply_font_template(run, 'tables.caption', config['tables']['caption']['fonts'])
 
                 # 如果题注在表格下方，在表格后添加题注
                 if position.lower() == "below":
                     # 添加题注段落
                     caption_paragraph = doc.add_paragraph()
                     if 'paragraph_format' in config['tables']:
-                        apply_paragraph_format(caption_paragraph, config['tables']['paragraph_format'])
+                        engine.apply_paragraph_format(caption_paragraph, 'tables', config['tables']['paragraph_format'])
 
                     # 设置题注文本
                     caption = para_info.content
@@ -1134,7 +1382,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                     # 应用题注字体格式
                     if 'caption' in config['tables'] and 'fonts' in config['tables']['caption']:
-                        apply_font_settings(caption_run, config['tables']['caption']['fonts'])
+                        engine.apply_font_template(caption_run, 'tables.caption', config['tables']['caption']['fonts'])
 
                 # 更新表格编号
                 table_number += 1
@@ -1149,19 +1397,13 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                 # 应用段落格式
                 if 'paragraph_format' in format_config:
-                    apply_paragraph_format(paragraph, format_config['paragraph_format'])
+                    engine.apply_paragraph_format(paragraph, para_type, format_config['paragraph_format'])
 
                 # 处理文本内容并应用字体设置
                 if 'fonts' in format_config:
-                    font_settings = format_config['fonts']
-
-                    # 拆分中英文
-                    segments = split_text_by_language(para_info.content)
-
-                    # 为每段添加相应的格式
-                    for text, is_chinese in segments:
-                        run = paragraph.add_run(text)
-                        apply_font_settings(run, font_settings, is_chinese)
+                    # 拆分中英文并克隆字体模板
+                    runs = engine.add_formatted_text(paragraph, para_info.content, para_type, format_config['fonts'])
+                    run = runs[-1] if runs else paragraph.add_run()
                 else:
                     # 无特殊字体设置，使用默认体
                     run = paragraph.add_run(para_info.content)
@@ -1174,7 +1416,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                         if ref_fonts:
                             # 如果配置中有字体设置，使用配置中的设置
-                            apply_font_settings(run, ref_fonts)
+                            engine.apply_font_template(run, 'references', ref_fonts)
                         else:
                             # 如果配置中没有字体设置，使用默认值
                             # 设置英文字体
@@ -1202,7 +1444,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
 
                     if ref_fonts:
                         # 如果配置中有字体设置，使用配置中的设置
-                        apply_font_settings(run, ref_fonts)
+                        engine.apply_font_template(run, 'references', ref_fonts)
                     else:
                         # 如果配置中没有字体设置，使用默认值
                         # 设置英文字体
@@ -1214,7 +1456,7 @@ def generate_formatted_doc(config: Dict, para_manager: ParagraphManager, output_
                             run.font.size = Pt(10.5)
 
     # 保存文档
-    doc.save(output_path)
+    save_document(doc, output_path, doc_path)
 
     # 返回文档路径
     return output_path
@@ -2,11 +2,15 @@ from docx import Document
 from docx.shared import Pt, RGBColor, Cm, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
 from docx.enum.section import WD_ORIENT
+from docx.text.run import Run
+import copy
 import json
 import os
 import re
+from collections import deque
 from typing import Dict, List, Optional, Union, Tuple, Any
 from backend.preparation.para_type import ParagraphManager, ParsedParaType, ParaInfo
+from backend.editors.docx_writer import save_document
 
 # 全局映射字典
 ALIGNMENT_MAP = {
@@ -40,6 +44,20 @@ class FormatFixer:
         """
         self.doc = None
         self.doc_path = doc_path
+
+        # 段落索引：文档段落列表、前缀哈希映射和已匹配的段落下标
+        self._doc_paragraphs = []
+        self._prefix_index = {}
+        self._claimed = set()
+
+        # 拆分段落（如"摘要："与摘要正文）在原始段落中的字符范围：id(ParaInfo) -> (起, 止)
+        self._fragment_spans = {}
+
+        # 错误索引：按段落ID分组的错误、分组标识的长度集合，以及没有被段落直接匹配的分组标识的前缀
+        self._errors_by_id = {}
+        self._error_key_lengths = []
+        self._identifier_prefixes = {}
+
         if doc_path:
             self.load_document(doc_path)
 
@@ -54,6 +72,19 @@ class FormatFixer:
             "字体": self._fix_font_family
         }
 
+        # 结构化错误的字段名映射（字段路径的最后一级，未翻译）
+        self.field_fix_map = {
+            "size": self._fix_font_size,
+            "line_spacing": self._fix_line_spacing,
+            "alignment": self._fix_alignment,
+            "bold": self._fix_bold,
+            "italic": self._fix_italic,
+            "first_line": self._fix_first_line_indent,
+            "first_line_indent": self._fix_first_line_indent,
+            "zh_family": self._fix_font_family,
+            "en_family": self._fix_font_family
+        }
+
     def load_document(self, doc_path: str) -> None:
         """
         加载文档
@@ -81,6 +112,9 @@ class FormatFixer:
 
         # 按段落分组错误
         errors_by_para = self._group_errors_by_paragraph(errors)
+        self._index_identifier_prefixes(para_manager, errors_by_para)
+        self._build_paragraph_index()
+        self._index_fragments(para_manager)
 
         # 遍历段落管理器中的段落
         for i, para_info in enumerate(para_manager.paragraphs):
@@ -88,13 +122,13 @@ class FormatFixer:
             para_type = para_info.type
 
             # 查找对应的段落错误
-            para_errors = self._find_para_errors(para_content, errors_by_para)
+            para_errors = self._find_para_errors(para_content, errors_by_para, f"para{i}")
 
             if not para_errors:
                 continue
 
             # 查找文档中对应的段落
-            doc_para = self._find_matching_paragraph(para_content)
+            doc_para = self._find_matching_paragraph(para_content, para_info)
             if not doc_para:
                 continue
 
@@ -105,7 +139,7 @@ class FormatFixer:
         if output_path is None:
             output_path = f"fixed_{os.path.basename(self.doc_path)}"
 
-        self.doc.save(output_path)
+        save_document(self.doc, output_path, self.doc_path)
         return output_path
 
     def fix_by_requirements(self, requirements: Dict, para_manager: ParagraphManager, output_path: Optional[str] = None) -> str:
@@ -123,13 +157,16 @@ class FormatFixer:
         if not self.doc:
             raise ValueError("未加载文档，请先调用load_document方法")
 
+        self._build_paragraph_index()
+        self._index_fragments(para_manager)
+
         # 遍历段落管理器中的段落
         for i, para_info in enumerate(para_manager.paragraphs):
             para_content = para_info.content
             para_type = para_info.type.value
 
             # 查找文档中对应的段落
-            doc_para = self._find_matching_paragraph(para_content)
+            doc_para = self._find_matching_paragraph(para_content, para_info)
             if not doc_para:
                 continue
 
@@ -142,7 +179,7 @@ class FormatFixer:
         if output_path is None:
             output_path = f"formatted_{os.path.basename(self.doc_path)}"
 
-        self.doc.save(output_path)
+        save_document(self.doc, output_path, self.doc_path)
         return output_path
 
     def _group_errors_by_paragraph(self, errors: List[Dict]) -> Dict[str, List[Dict]]:
@@ -156,8 +193,15 @@ class FormatFixer:
             Dict[str, List[Dict]]: 按段落分组的错误字典
         """
         errors_by_para = {}
+        self._errors_by_id = {}
 
         for error in errors:
+            # 带段落ID的错误直接按ID分组，不依赖内容前缀
+            para_id = error.get('para_id')
+            if para_id:
+                self._errors_by_id.setdefault(para_id, []).append(error)
+                continue
+
             location = error.get('location', '')
             if '.' in location:
                 # 提取段落内容的前几个字作为标识
@@ -168,43 +212,214 @@ class FormatFixer:
 
                 errors_by_para[para_identifier].append(error)
 
+        # 分组标识都是段落内容的前缀，记录出现过的长度以便按前缀直接查表
+        self._error_key_lengths = sorted({len(key) for key in errors_by_para if key}, reverse=True)
+
         return errors_by_para
 
-    def _find_para_errors(self, para_content: str, errors_by_para: Dict[str, List[Dict]]) -> List[Dict]:
+    def _lookup_prefix(self, para_start: str, errors_by_para: Dict[str, List[Dict]]) -> Optional[str]:
+        # 按分组标识的长度截取前缀查表，返回最长的命中标识
+        for length in self._error_key_lengths:
+            if length <= len(para_start) and para_start[:length] in errors_by_para:
+                return para_start[:length]
+        return None
+
+    def _index_identifier_prefixes(self, para_manager: ParagraphManager, errors_by_para: Dict[str, List[Dict]]) -> None:
+        """
+        为段落内容比分组标识短的情况建立分组标识的前缀索引
+
+        只收录没有被任何段落直接匹配的分组标识，避免"图1"这样的短段落认领"图1-1…"段落的错误
+
+        Args:
+            para_manager: 段落管理器
+            errors_by_para: 按段落分组的错误字典
+        """
+        claimed = set()
+        for i, para_info in enumerate(para_manager.paragraphs):
+            if f"para{i}" in self._errors_by_id:
+                continue
+            identifier = self._lookup_prefix(para_info.content[:30], errors_by_para)
+            if identifier is not None:
+                claimed.add(identifier)
+
+        self._identifier_prefixes = {}
+        for identifier in errors_by_para:
+            if identifier in claimed:
+                continue
+            for length in range(1, len(identifier)):
+                self._identifier_prefixes.setdefault(identifier[:length], []).append(identifier)
+
+    def _find_para_errors(self, para_content: str, errors_by_para: Dict[str, List[Dict]], para_id: str = None) -> List[Dict]:
         """
         查找段落对应的错误
 
         Args:
             para_content: 段落内容
             errors_by_para: 按段落分组的错误字典
+            para_id: 段落ID（如 para3），优先按ID查找
 
         Returns:
             List[Dict]: 段落对应的错误列表
         """
+        if para_id and para_id in self._errors_by_id:
+            return self._errors_by_id[para_id]
+
         # 取段落内容的前30个字符作为匹配依据
         para_start = para_content[:30] if len(para_content) > 30 else para_content
 
-        for para_id, errors in errors_by_para.items():
-            if para_start.startswith(para_id) or para_id.startswith(para_start):
-                return errors
+        # 按分组标识的长度截取前缀查表，避免逐个比较所有分组
+        identifier = self._lookup_prefix(para_start, errors_by_para)
+        if identifier is not None:
+            return errors_by_para[identifier]
+
+        # 段落内容比分组标识短时，反过来查分组标识的前缀索引，前缀只对应一个分组时才认领
+        if para_start and self._error_key_lengths and len(para_start) < self._error_key_lengths[0]:
+            candidates = self._identifier_prefixes.get(para_start, [])
+            if len(candidates) == 1:
+                return errors_by_para[candidates[0]]
 
         return []
 
-    def _find_matching_paragraph(self, para_content: str) -> Optional[Any]:
+    @staticmethod
+    def _prefix_key(text: str) -> str:
+        """段落前缀哈希键"""
+        return text.strip()[:30]
+
+    def _build_paragraph_index(self) -> None:
+        """
+        一次遍历文档建立段落索引：按原始下标的段落列表和前缀到下标队列的映射
+        """
+        self._doc_paragraphs = list(self.doc.paragraphs)
+        self._prefix_index = {}
+        self._claimed = set()
+
+        for i, para in enumerate(self._doc_paragraphs):
+            key = self._prefix_key(para.text)
+            if key:
+                self._prefix_index.setdefault(key, deque()).append(i)
+
+    def _index_fragments(self, para_manager: ParagraphManager) -> None:
+        """
+        记录拆分段落在原始段落中的字符范围
+
+        预处理时拆分出的段落共用原始段落下标（meta['source_index']），按 meta['source_part']
+        的顺序在原始段落文本中依次定位，修复时只修改各自范围内的 run
+
+        Args:
+            para_manager: 段落管理器
+        """
+        self._fragment_spans = {}
+        fragments = {}
+        for para_info in para_manager.paragraphs:
+            meta = para_info.meta or {}
+            source_index = meta.get('source_index')
+            if isinstance(source_index, int) and 0 <= source_index < len(self._doc_paragraphs):
+                fragments.setdefault(source_index, []).append(para_info)
+
+        for source_index, parts in fragments.items():
+            if len(parts) < 2:
+                continue
+            source_text = ''.join(run.text for run in self._doc_paragraphs[source_index].runs)
+            cursor = 0
+            for para_info in sorted(parts, key=lambda info: info.meta.get('source_part', 0)):
+                start = source_text.find(para_info.content, cursor)
+                if start < 0 or not para_info.content:
+                    # 无法定位时范围为空，不修改任何 run
+                    self._fragment_spans[id(para_info)] = (cursor, cursor)
+                    continue
+                cursor = start + len(para_info.content)
+                self._fragment_spans[id(para_info)] = (start, cursor)
+
+    def _is_fragment(self, para_info: ParaInfo) -> bool:
+        """段落是否只是原始段落的一部分，这类段落不修改整段的段落格式"""
+        return id(para_info) in self._fragment_spans
+
+    @staticmethod
+    def _split_run(run: Any, offset: int) -> Any:
+        """在 offset 处把 run 拆成两个格式相同的 run，返回后一个"""
+        new_r = copy.deepcopy(run._r)
+        run._r.addnext(new_r)
+        new_run = Run(new_r, run._parent)
+        text = run.text
+        run.text = text[:offset]
+        new_run.text = text[offset:]
+        return new_run
+
+    def _target_runs(self, paragraph: Any, para_info: ParaInfo) -> List[Any]:
+        """
+        段落信息对应的 run：完整段落返回全部 run，拆分段落只返回其字符范围内的 run
+
+        Args:
+            paragraph: 文档中的段落对象
+            para_info: 段落信息
+
+        Returns:
+            List[Any]: 需要修改的 run 列表
+        """
+        span = self._fragment_spans.get(id(para_info))
+        if span is None:
+            return paragraph.runs
+
+        start, end = span
+        # 范围边界落在 run 中间时先拆分 run
+        for boundary in (start, end):
+            position = 0
+            for run in paragraph.runs:
+                length = len(run.text)
+                if position < boundary < position + length:
+                    self._split_run(run, boundary - position)
+                    break
+                position += length
+
+        runs = []
+        position = 0
+        for run in paragraph.runs:
+            length = len(run.text)
+            if length and start <= position and position + length <= end:
+                runs.append(run)
+            position += length
+        return runs
+
+    def _find_matching_paragraph(self, para_content: str, para_info: ParaInfo = None) -> Optional[Any]:
         """
         在文档中查找匹配的段落
 
+        优先使用提取时记录的原始段落下标（meta['source_index']），
+        否则按前缀哈希查找，相同前缀的段落按文档顺序依次分配，不会重复匹配
+
         Args:
             para_content: 段落内容
+            para_info: 段落信息
 
         Returns:
             Optional[Any]: 匹配的段落对象，如果未找到则返回None
         """
-        # 取段落内容的前30个字符作为匹配依据
-        para_start = para_content[:30] if len(para_content) > 30 else para_content
+        if not self._doc_paragraphs:
+            self._build_paragraph_index()
+
+        # 稳定身份：原始段落下标
+        source_index = para_info.meta.get('source_index') if para_info else None
+        if isinstance(source_index, int) and 0 <= source_index < len(self._doc_paragraphs):
+            self._claimed.add(source_index)
+            return self._doc_paragraphs[source_index]
 
-        for para in self.doc.paragraphs:
+        # 前缀哈希：取第一个尚未被匹配的同前缀段落
+        candidates = self._prefix_index.get(self._prefix_key(para_content))
+        while candidates:
+            index = candidates.popleft()
+            if index not in self._claimed:
+                self._claimed.add(index)
+                return self._doc_paragraphs[index]
+
+        # 兜底：段落被拆分过（如"摘要："与摘要正文）时内容只是原段落的前缀
+        para_start = para_content[:30] if len(para_content) > 30 else para_content
+        if not para_start.strip():
+            return None
+        for index, para in enumerate(self._doc_paragraphs):
+            if index in self._claimed or not para.text.strip():
+                continue
             if para.text.startswith(para_start) or para_start.startswith(para.text[:30]):
+                self._claimed.add(index)
                 return para
 
         return None
@@ -219,6 +434,14 @@ class FormatFixer:
             para_info: 段落信息
         """
         for error in errors:
+            # 结构化错误直接按字段分派，不再解析消息文本
+            field_path = error.get('field')
+            if field_path and error.get('expected') is not None:
+                fix_method = self.field_fix_map.get(field_path.rsplit('.', 1)[-1])
+                if fix_method:
+                    fix_method(paragraph, str(error['expected']), para_info)
+                continue
+
             error_message = error.get('message', '')
 
             # 提取错误类型和要求值
@@ -263,8 +486,8 @@ class FormatFixer:
             paragraph.add_run(paragraph.text)
             paragraph.text = ""
 
-        # 应用字体设置到所有runs
-        for run in paragraph.runs:
+        # 应用字体设置到段落对应的runs
+        for run in self._target_runs(paragraph, para_info):
             # 设置字体族
             if 'zh_family' in font_settings:
                 run.font.name = font_settings['zh_family']
@@ -295,6 +518,10 @@ class FormatFixer:
             para_format: 段落格式字典
             para_info: 段落信息
         """
+        # 拆分段落与同一原始段落的其他部分共用段落格式，不修改
+        if self._is_fragment(para_info):
+            return
+
         # 设置对齐方式
         if 'alignment' in para_format:
             alignment = para_format['alignment'].lower()
@@ -367,8 +594,8 @@ class FormatFixer:
 
         size = float(size_match.group(1))
 
-        # 应用到所有runs
-        for run in paragraph.runs:
+        # 应用到段落对应的runs
+        for run in self._target_runs(paragraph, para_info):
             run.font.size = Pt(size)
 
     def _fix_line_spacing(self, paragraph: Any, required_value: str, para_info: ParaInfo) -> None:
@@ -380,6 +607,9 @@ class FormatFixer:
             required_value: 要求的行间距
             para_info: 段落信息
         """
+        if self._is_fragment(para_info):
+            return
+
         # 处理固定值行间距
         if '固定值' in required_value or 'Fixed value' in required_value:
             # 提取pt值
@@ -405,6 +635,9 @@ class FormatFixer:
             required_value: 要求的对齐方式
             para_info: 段落信息
         """
+        if self._is_fragment(para_info):
+            return
+
         if required_value in ALIGNMENT_MAP:
             paragraph.paragraph_format.alignment = ALIGNMENT_MAP[required_value]
 
@@ -419,8 +652,8 @@ class FormatFixer:
         """
         is_bold = required_value.lower() == '是' or required_value.lower() == 'true'
 
-        # 应用到所有runs
-        for run in paragraph.runs:
+        # 应用到段落对应的runs
+        for run in self._target_runs(paragraph, para_info):
             run.font.bold = is_bold
 
     def _fix_italic(self, paragraph: Any, required_value: str, para_info: ParaInfo) -> None:
@@ -434,8 +667,8 @@ class FormatFixer:
         """
         is_italic = required_value.lower() == '是' or required_value.lower() == 'true'
 
-        # 应用到所有runs
-        for run in paragraph.runs:
+        # 应用到段落对应的runs
+        for run in self._target_runs(paragraph, para_info):
             run.font.italic = is_italic
 
     def _fix_first_line_indent(self, paragraph: Any, required_value: str, para_info: ParaInfo) -> None:
@@ -447,6 +680,9 @@ class FormatFixer:
             required_value: 要求的首行缩进
             para_info: 段落信息
         """
+        if self._is_fragment(para_info):
+            return
+
         # 提取缩进值
         indent_match = re.search(r'(\d+(\.\d+)?)\s*(cm|字符)', required_value)
         if not indent_match:
@@ -470,8 +706,8 @@ class FormatFixer:
             required_value: 要求的字体族
             para_info: 段落信息
         """
-        # 应用到所有runs
-        for run in paragraph.runs:
+        # 应用到段落对应的runs
+        for run in self._target_runs(paragraph, para_info):
             run.font.name = required_value
 
 # 批量修复文档中的格式错误
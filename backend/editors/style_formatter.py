@@ -0,0 +1,252 @@
+import os
+from typing import Dict, List, Optional
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Inches, RGBColor
+from docx.oxml.ns import qn
+from backend.preparation.para_type import ParagraphManager
+from backend.editors.docx_writer import save_document
+from backend.editors.format_editor import (
+    apply_font_settings,
+    apply_paragraph_format,
+    load_config,
+    set_paper_format
+)
+
+# 样式模式：每种段落类型对应一个命名段落样式，样式定义只写一次，
+# 段落只设置 pStyle 并清除与样式冲突的直接格式
+
+# 标题类型沿用 Word 内置的标题样式，保留大纲级别和导航窗格
+BUILTIN_STYLE_NAMES = {
+    'heading1': 'Heading 1',
+    'heading2': 'Heading 2',
+    'heading3': 'Heading 3',
+}
+
+# 自定义样式名前缀
+STYLE_NAME_PREFIX = 'Paper '
+
+# 由样式接管、需要从段落上清除的直接格式
+PARAGRAPH_PROPERTY_TAGS = ('w:spacing', 'w:ind', 'w:jc')
+RUN_PROPERTY_TAGS = ('w:rFonts', 'w:sz', 'w:szCs', 'w:b', 'w:bCs', 'w:i', 'w:iCs', 'w:caps', 'w:color')
+
+
+def style_name_for(para_type: str) -> str:
+    """返回段落类型对应的样式名称"""
+    if para_type in BUILTIN_STYLE_NAMES:
+        return BUILTIN_STYLE_NAMES[para_type]
+    return STYLE_NAME_PREFIX + para_type.replace('_', ' ').title()
+
+
+def _style_fonts(format_config: Dict) -> Optional[Dict]:
+    # 图、表的字体设置位于 caption 下
+    if 'fonts' in format_config:
+        return format_config['fonts']
+    caption = format_config.get('caption')
+    if isinstance(caption, dict):
+        return caption.get('fonts')
+    return None
+
+
+def ensure_paragraph_styles(doc: Document, config: Dict) -> Dict[str, object]:
+    """
+    按配置创建或更新每种段落类型的段落样式
+
+    Args:
+        doc: 文档对象
+        config: 配置字典
+
+    Returns:
+        Dict[str, object]: 段落类型 -> 样式对象
+    """
+    styles = doc.styles
+    existing = {style.name: style for style in styles if style.type == WD_STYLE_TYPE.PARAGRAPH}
+    normal = existing.get('Normal')
+    result = {}
+
+    for para_type, format_config in config.items():
+        if not isinstance(format_config, dict):
+            continue
+        fonts = _style_fonts(format_config)
+        paragraph_format = format_config.get('paragraph_format')
+        if not fonts and not paragraph_format:
+            continue
+
+        name = style_name_for(para_type)
+        style = existing.get(name)
+        if style is None:
+            style = styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+            if normal is not None:
+                style.base_style = normal
+            existing[name] = style
+        style.quick_style = True
+
+        # 样式与段落、文本运行共用同一套格式属性接口
+        if paragraph_format:
+            apply_paragraph_format(style, paragraph_format)
+        if fonts:
+            apply_font_settings(style, fonts)
+        result[para_type] = style
+
+    return result
+
+
+def strip_direct_formatting(paragraph) -> None:
+    """
+    清除段落及其文本运行上与样式冲突的直接格式，保留编号、分节、上下标等其他属性
+
+    Args:
+        paragraph: 段落对象
+    """
+    pPr = paragraph._p.pPr
+    if pPr is not None:
+        for tag in PARAGRAPH_PROPERTY_TAGS:
+            for child in pPr.findall(qn(tag)):
+                pPr.remove(child)
+
+    for run in paragraph.runs:
+        rPr = run._r.rPr
+        if rPr is None:
+            continue
+        for tag in RUN_PROPERTY_TAGS:
+            for child in rPr.findall(qn(tag)):
+                rPr.remove(child)
+
+
+def apply_paragraph_style(paragraph, style) -> None:
+    """为段落设置样式并清除冲突的直接格式"""
+    strip_direct_formatting(paragraph)
+    paragraph.style = style
+
+
+def _mark_error(paragraph) -> None:
+    # 错误段落仍用红色直接标记，便于用户定位
+    for run in paragraph.runs:
+        run.font.color.rgb = RGBColor(255, 0, 0)
+
+
+def _error_para_ids(errors: Optional[List[Dict]]) -> set:
+    return {error['para_id'] for error in errors or [] if isinstance(error, dict) and error.get('para_id')}
+
+
+def _has_location_error(content: str, errors: Optional[List[Dict]]) -> bool:
+    for error in errors or []:
+        if not isinstance(error, dict) or error.get('para_id'):
+            continue
+        location = error.get('location')
+        if location and location[:20] in content[:20]:
+            return True
+    return False
+
+
+def _assign_source_paragraphs(doc: Document, para_manager: ParagraphManager) -> Dict[int, int]:
+    """
+    建立原文档段落下标 -> 段落管理器下标的映射
+
+    同一原始段落被拆分为多个部分时（如"摘要：……"），取内容最长的部分决定样式；
+    缺少 source_index 的段落按顺序对应到原文档中的非空段落
+    """
+    doc_paragraphs = doc.paragraphs
+    assigned = {}
+    non_empty = [i for i, para in enumerate(doc_paragraphs) if para.text.strip()]
+    cursor = 0
+
+    for manager_index, para_info in enumerate(para_manager.paragraphs):
+        source_index = (para_info.meta or {}).get('source_index')
+        if not (isinstance(source_index, int) and 0 <= source_index < len(doc_paragraphs)):
+            if cursor >= len(non_empty):
+                continue
+            source_index = non_empty[cursor]
+            cursor += 1
+        current = assigned.get(source_index)
+        if current is None or len(para_info.content) > len(para_manager.paragraphs[current].content):
+            assigned[source_index] = manager_index
+
+    return assigned
+
+
+def generate_styled_doc(config: Dict, para_manager: ParagraphManager, output_path: str,
+                        errors: Optional[List[Dict]] = None, doc_path: Optional[str] = None) -> str:
+    """
+    样式模式生成格式化文档：每种段落类型的格式只写入 styles.xml 一次，
+    段落只设置 pStyle，生成的文档更小、处理量与段落类型数而非文本运行数相关
+
+    Args:
+        config: 配置字典或配置文件路径
+        para_manager: 段落管理器
+        output_path: 输出文档路径
+        errors: 错误信息列表（可选）
+        doc_path: 原文档路径（可选），提供时在原文档上修改
+
+    Returns:
+        str: 生成的文档路径
+    """
+    if isinstance(config, str):
+        config = load_config(config)
+
+    error_ids = _error_para_ids(errors)
+
+    if doc_path and os.path.exists(doc_path):
+        doc = Document(doc_path)
+        print(f"正在基于原文档 {doc_path} 进行样式格式化")
+        styles = ensure_paragraph_styles(doc, config)
+
+        doc_paragraphs = doc.paragraphs
+        for source_index, manager_index in _assign_source_paragraphs(doc, para_manager).items():
+            para_info = para_manager.paragraphs[manager_index]
+            style = styles.get(para_info.type.value)
+            if style is None:
+                continue
+            paragraph = doc_paragraphs[source_index]
+            apply_paragraph_style(paragraph, style)
+            if f"para{manager_index}" in error_ids or _has_location_error(para_info.content, errors):
+                _mark_error(paragraph)
+
+        # 表格单元格使用表格样式
+        table_style = styles.get('tables')
+        if table_style is not None:
+            for table in doc.tables:
+                for row in table.rows:
+                    for cell in row.cells:
+                        for paragraph in cell.paragraphs:
+                            apply_paragraph_style(paragraph, table_style)
+    else:
+        doc = Document()
+        set_paper_format(doc, config)
+        styles = ensure_paragraph_styles(doc, config)
+
+        for manager_index, para_info in enumerate(para_manager.paragraphs):
+            para_type = para_info.type.value
+            style = styles.get(para_type)
+            meta = para_info.meta or {}
+
+            if para_type == 'figures' and meta.get('image_path') and os.path.exists(meta['image_path']):
+                img_paragraph = doc.add_paragraph(style=style)
+                img_paragraph.add_run().add_picture(meta['image_path'], width=Inches(6))
+
+            caption_above = para_type == 'tables' and str(
+                config.get('tables', {}).get('caption', {}).get('position', 'above')).lower() == 'above'
+            if caption_above:
+                paragraph = doc.add_paragraph(para_info.content, style=style)
+                if f"para{manager_index}" in error_ids or _has_location_error(para_info.content, errors):
+                    _mark_error(paragraph)
+
+            if para_type == 'tables' and isinstance(meta.get('table_data'), list) and meta['table_data']:
+                table_data = meta['table_data']
+                num_cols = len(table_data[0]) if isinstance(table_data[0], list) else 1
+                table = doc.add_table(rows=len(table_data), cols=num_cols)
+                for i, row_data in enumerate(table_data):
+                    for j, cell_data in enumerate(row_data if isinstance(row_data, list) else [row_data]):
+                        cell = table.cell(i, j)
+                        cell.text = str(cell_data)
+                        if style is not None:
+                            for paragraph in cell.paragraphs:
+                                paragraph.style = style
+
+            if not caption_above:
+                paragraph = doc.add_paragraph(para_info.content, style=style)
+                if f"para{manager_index}" in error_ids or _has_location_error(para_info.content, errors):
+                    _mark_error(paragraph)
+
+    save_document(doc, output_path, doc_path)
+    return output_path
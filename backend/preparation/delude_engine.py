@@ -4,8 +4,23 @@ import time
 from typing import Dict, List, Optional, Union, Tuple
 from backend.preparation.para_type import ParsedParaType, ParagraphManager, ParaInfo
 from backend.agents.format_agent import FormatAgent
+from backend.agents.async_runner import get_runner
+from backend.agents.scheduler import ProviderUnavailableError
+from backend.agents.cascade_router import CascadeRouter
 from backend.preparation.docx_parser import extract_doc_content
 import backend.preparation.extract_para_info as extract_para_info
+from backend.utils.label_matcher import find_labels, label_with_colon, leading_label
+
+# 标签类别到段落类型的映射
+LABEL_PARA_TYPES = {
+    'abstract_zh': ParsedParaType.ABSTRACT_ZH,
+    'abstract_en': ParsedParaType.ABSTRACT_EN,
+    'keywords_zh': ParsedParaType.KEYWORDS_ZH,
+    'keywords_en': ParsedParaType.KEYWORDS_EN,
+    'references': ParsedParaType.REFERENCES,
+    'acknowledgments': ParsedParaType.ACKNOWLEDGMENTS,
+}
+
 def determine_para_type(text, last_para_type=None, para_meta=None):
     """
     根据段落内容动态确定段落类型（基于规则的方法）
@@ -28,32 +43,16 @@ def determine_para_type(text, last_para_type=None, para_meta=None):
     elif last_para_type == ParsedParaType.REFERENCES and len(text.strip()) > 30:
         return ParsedParaType.REFERENCES_CONTENT
 
-    # 匹配关键词
-    pattern = re.compile(r'\b(摘要|Abstract|关键词|Keywords)\b\s*[:：]', re.IGNORECASE)
-    match = pattern.search(text)
+    # 匹配关键词（标签命中由共享的多模式自动机给出，按文本缓存）
+    hits = find_labels(text)
+    match = label_with_colon(text, hits=hits)
     if match and len(text.strip()) < 20:
-        keyword = match.group(1).lower()
-        if keyword == "摘要":
-            return ParsedParaType.ABSTRACT_ZH
-        elif keyword == "abstract":
-            return ParsedParaType.ABSTRACT_EN
-        elif keyword == "关键词":
-            return ParsedParaType.KEYWORDS_ZH
-        elif keyword == "keywords":
-            return ParsedParaType.KEYWORDS_EN
-        elif keyword == "致谢" or keyword == "acknowledgments":
-            return ParsedParaType.ACKNOWLEDGMENTS
-        elif keyword == "参考文献" or keyword == "references":
-            return ParsedParaType.REFERENCES
-
+        return LABEL_PARA_TYPES[match.label]
 
-    # 匹配参考文献
-    if text.lower().startswith("references") or text.startswith("参考文献"):
-        return ParsedParaType.REFERENCES
-
-    # 匹配致谢
-    if text.lower().startswith("acknowledgments") or text.startswith("致谢"):
-        return ParsedParaType.ACKNOWLEDGMENTS
+    # 匹配参考文献和致谢
+    match = leading_label(text, ('references', 'acknowledgments'), hits)
+    if match:
+        return LABEL_PARA_TYPES[match.label]
 
 
 
@@ -65,6 +64,20 @@ next_para_content: str = "", previous_types: List[Tuple[str, ParsedParaType]] =
     """
     混合推理模型，结合规则匹配和大模型推理
 
+    Returns:
+        Tuple[ParsedParaType, float]: 段落类型和置信度
+    """
+    para_type, confidence, _ = hybrid_classify(text, para_meta, format_agent, doc_content, prev_para_type,
+                                               next_para_type, next_para_content, previous_types)
+    return para_type, confidence
+
+
+def hybrid_classify(text: str, para_meta: Dict, format_agent: FormatAgent, doc_content: str,
+                    prev_para_type: Optional[ParsedParaType] = None, next_para_type: Optional[ParsedParaType] = None,
+                    next_para_content: str = "", previous_types: List[Tuple[str, ParsedParaType]] = None) -> Tuple[ParsedParaType, float, bool]:
+    """
+    混合推理模型，结合规则匹配和大模型推理，并标记规则与大模型结论不一致的段落
+
     Args:
         text: 段落文本内容
         para_meta: 段落的元数据信息
@@ -76,7 +89,7 @@ next_para_content: str = "", previous_types: List[Tuple[str, ParsedParaType]] =
         previous_types: 之前已判断过的所有段落的类型和内容
 
     Returns:
-        Tuple[ParsedParaType, float]: 段落类型和置信度
+        Tuple[ParsedParaType, float, bool]: 段落类型、置信度、是否需要复核
     """
     # 初始化之前判断过的段落类型列表
     if previous_types is None:
@@ -94,7 +107,7 @@ next_para_content: str = "", previous_types: List[Tuple[str, ParsedParaType]] =
         for _, prev_type in previous_types:
             if prev_type in [ParsedParaType.ABSTRACT_CONTENT_EN, ParsedParaType.KEYWORDS_CONTENT_ZH]:
                 print(f"段落内容超过200字且前面出现过摘要或关键词内容，直接判定为正文")
-                return ParsedParaType.BODY, 0.95
+                return ParsedParaType.BODY, 0.95, False
 
     # 如果规则已经确定了特定类型，则不再使用大模型判断
     special_types = [
@@ -108,7 +121,7 @@ next_para_content: str = "", previous_types: List[Tuple[str, ParsedParaType]] =
 
     if rule_based_type in special_types:
         print(f"规则已确定段落类型为 {rule_based_type.value}，不再使用大模型判断")
-        return rule_based_type, 0.95
+        return rule_based_type, 0.95, False
 
     # 第二步：大模型推理
     try:
@@ -118,63 +131,47 @@ next_para_content: str = "", previous_types: List[Tuple[str, ParsedParaType]] =
         # 3. 之前已判断过的所有段落类型和内容（对于heading类型，保留内容）
 
         # 构建之前段落类型的上下文
-        previous_context = ""
-        for prev_content, prev_type in previous_types:
-            # 对于标题类型，保留内容
-            if prev_type in [ParsedParaType.HEADING1, ParsedParaType.HEADING2, ParsedParaType.HEADING3]:
-                previous_context += f"段落类型: {prev_type.value}, 内容: {prev_content}\n"
-            else:
-                previous_context += f"段落类型: {prev_type.value}\n"
+        previous_context = build_previous_context(previous_types)
         print(f"Previous context: {previous_context}")
 
-        # 使用predict_location_with_context方法，传递更丰富的上下文信息
-        llm_response = format_agent.predict_location_with_context(
-            doc_content="",  # 不再传递全文
-            fragment_str=text,
-            para_meta=para_meta,
-            prev_para_type=prev_para_type,
-            next_para_type=next_para_type,
-            prev_content=previous_context,  # 传递之前段落的类型和内容
-            next_content=next_para_content  # 传递下一个段落的内容
-        )
-
-        # 获取位置信息
-        location = llm_response.get("location", "")
-
-        # 处理可能的无效位置格式，如 'others ()'
-        if location and ' ' in location:
-            # 只保留空格前的部分
-            location = location.split(' ')[0].strip()
-            print(f"Cleaned location from '{llm_response.get('location')}' to '{location}'")
-
-        # 检查是否是有效的枚举值
-        try:
-            llm_type = ParsedParaType(location)
-        except ValueError:
-            print(f"Invalid location value: {location}, using OTHERS instead")
-            llm_type = ParsedParaType.OTHERS
+        # 通过分级路由预测：快速模型先给出结论，置信度不足或与规则类型不一致时才升级到大模型
+        def predict(agent: FormatAgent) -> Tuple[ParsedParaType, float]:
+            llm_response = agent.predict_location_with_context(
+                doc_content="",  # 不再传递全文
+                fragment_str=text,
+                para_meta=para_meta,
+                prev_para_type=prev_para_type,
+                next_para_type=next_para_type,
+                prev_content=previous_context,  # 传递之前段落的类型和内容
+                next_content=next_para_content  # 传递下一个段落的内容
+            )
+            return parse_location_response(llm_response, ParsedParaType.OTHERS)
 
-        llm_confidence = float(llm_response.get("confidence", 0.5))
+        router = get_router(format_agent)
+        llm_type, llm_confidence, tier = router.predict(predict, rule_type=rule_based_type)
+        if len(router.tiers) > 1:
+            print(f"段落类型由 {tier} 给出: {llm_type.value} (confidence: {llm_confidence:.2f})")
     except Exception as e:
+        # 大模型未给出结论，规则结果需要复核
         print(f"Error in LLM prediction: {e}, using rule-based type instead")
-        llm_type = rule_based_type
-        llm_confidence = 0.5
+        return rule_based_type, 0.5, True
 
     # 第三步：混合决策
     # 如果规则推理和大模型推理结果一致，直接返回
     if rule_based_type == llm_type:
-        return rule_based_type, max(0.9, llm_confidence)  # 提高置信度
+        return rule_based_type, max(0.9, llm_confidence), False  # 提高置信度
 
+    # 规则与大模型结论不一致，留待复核
     # 如果大模型置信度较高，使用大模型结果
     if llm_confidence >= 0.8:
-        return llm_type, llm_confidence
+        return llm_type, llm_confidence, True
 
     # 对于特定类型，规则推理更可靠
     if rule_based_type in special_types:
-        return rule_based_type, 0.9
+        return rule_based_type, 0.9, True
 
     # 其他情况下，使用大模型结果，但置信度降低
-    return llm_type, llm_confidence * 0.9
+    return llm_type, llm_confidence * 0.9, True
 
 def remark_para_type(doc_path: str, format_agent: FormatAgent, paragraph_manager: ParagraphManager) -> ParagraphManager:
     """
@@ -188,6 +185,22 @@ def remark_para_type(doc_path: str, format_agent: FormatAgent, paragraph_manager
     Returns:
         ParagraphManager: 标注后的段落管理器
     """
+    return classify_para_types(doc_path, format_agent, paragraph_manager)[0]
+
+
+def classify_para_types(doc_path: str, format_agent: FormatAgent,
+                        paragraph_manager: ParagraphManager) -> Tuple[ParagraphManager, List[int]]:
+    """
+    一次分类：使用混合推理模型标注段落类型，同时记录规则与大模型结论不一致、需要复核的段落
+
+    Args:
+        doc_path: 文档路径
+        format_agent: 格式代理对象
+        paragraph_manager: 段落管理器
+
+    Returns:
+        Tuple[ParagraphManager, List[int]]: 标注后的段落管理器、需要复核的段落下标
+    """
 
     # 文档整个内容
     doc_content = extract_doc_content(doc_path)
@@ -201,6 +214,7 @@ def remark_para_type(doc_path: str, format_agent: FormatAgent, paragraph_manager
 
     # 存储已处理的段落类型和内容
     processed_paragraphs = []
+    flagged = []
 
     # 定义任务函数
     def process_paragraph(para_index: int, para: Dict, manager: ParagraphManager, processed_paras: List[Tuple[str, ParsedParaType]]):
@@ -236,14 +250,16 @@ def remark_para_type(doc_path: str, format_agent: FormatAgent, paragraph_manager
                 next_para_content = manager.paragraphs[para_index + 1].content
 
             # 使用混合推理模型预测段落类型，传递已处理的段落信息
-            predicted_type, confidence = hybrid_predict_para_type(
+            predicted_type, confidence, needs_review = hybrid_classify(
                 para_string, para_meta, format_agent, doc_content,
                 prev_para_type, next_para_type, next_para_content, processed_paras.copy()
             )
+            if needs_review:
+                flagged.append(para_index)
 
             # 更新段落类型，确保索引有效
             if 0 <= para_index < len(manager.paragraphs):
-                manager.paragraphs[para_index].type = predicted_type
+                manager.update_para(para_index, type=predicted_type)
                 print(f"Paragraph {para_index}: {para_string[:30]}... => {predicted_type.value} (confidence: {confidence:.2f})")
 
                 # 将当前处理的段落添加到已处理列表中
@@ -252,13 +268,14 @@ def remark_para_type(doc_path: str, format_agent: FormatAgent, paragraph_manager
                 print(f"Warning: Invalid paragraph index {para_index}, valid range is 0-{len(manager.paragraphs)-1}")
 
         except Exception as e:
-            # 如果解析失败，将段落类型设置为 BODY
+            # 如果解析失败，将段落类型设置为 BODY；模型不可用时保留规则判断的类型
             print(f"Error processing paragraph {para_index}: {para_string[:30] if para_string else 'No content'}... Error: {e}")
             try:
                 if 0 <= para_index < len(manager.paragraphs):
-                    manager.paragraphs[para_index].type = ParsedParaType.BODY
+                    if not isinstance(e, ProviderUnavailableError):
+                        manager.update_para(para_index, type=ParsedParaType.BODY)
                     # 即使出错，也将当前段落添加到已处理列表中
-                    processed_paras.append((para_string, ParsedParaType.BODY))
+                    processed_paras.append((para_string, manager.paragraphs[para_index].type))
                 else:
                     print(f"Cannot set paragraph type: Invalid index {para_index}")
             except Exception as inner_e:
@@ -268,7 +285,39 @@ def remark_para_type(doc_path: str, format_agent: FormatAgent, paragraph_manager
     for i, para in enumerate(paras_info_json_zh):
         process_paragraph(i, para, paragraph_manager, processed_paragraphs)
 
-    return paragraph_manager
+    return paragraph_manager, flagged
+
+
+def build_previous_context(previous_types: Optional[List[Tuple[str, ParsedParaType]]]) -> str:
+    """构建之前段落类型的上下文，标题类型保留内容"""
+    previous_context = ""
+    for prev_content, prev_type in previous_types or []:
+        if prev_type in [ParsedParaType.HEADING1, ParsedParaType.HEADING2, ParsedParaType.HEADING3]:
+            previous_context += f"段落类型: {prev_type.value}, 内容: {prev_content}\n"
+        else:
+            previous_context += f"段落类型: {prev_type.value}\n"
+    return previous_context
+
+
+def parse_location_response(llm_response: Dict, default: ParsedParaType) -> Tuple[ParsedParaType, float]:
+    """把大模型返回的 location/confidence 转换为段落类型和置信度，无效位置使用 default"""
+    # 获取位置信息
+    location = llm_response.get("location", "")
+
+    # 处理可能的无效位置格式，如 'others ()'
+    if location and ' ' in location:
+        # 只保留空格前的部分
+        location = location.split(' ')[0].strip()
+        print(f"Cleaned location from '{llm_response.get('location')}' to '{location}'")
+
+    # 检查是否是有效的枚举值
+    try:
+        llm_type = ParsedParaType(location)
+    except ValueError:
+        print(f"Invalid location value: {location}, using {default.value} instead")
+        llm_type = default
+
+    return llm_type, float(llm_response.get("confidence", 0.5))
 
 # 结束后再次通过大模型验证是否是正确的段落类型
 def llm_predict_para_type(text: str, format_agent: FormatAgent, para_meta: Dict = None,
@@ -297,14 +346,8 @@ def llm_predict_para_type(text: str, format_agent: FormatAgent, para_meta: Dict
             text = str(text)
         
         # 构建之前段落类型的上下文
-        previous_context = ""
-        if previous_types:
-            for prev_content, prev_type in previous_types:
-                # 对于标题类型，保留内容
-                if prev_type in [ParsedParaType.HEADING1, ParsedParaType.HEADING2, ParsedParaType.HEADING3]:
-                    previous_context += f"段落类型: {prev_type.value}, 内容: {prev_content}\n"
-                else:
-                    previous_context += f"段落类型: {prev_type.value}\n"
+        previous_context = build_previous_context(previous_types)
+        if previous_context:
             print(f"Previous context: {previous_context}")
 
         # 使用predict_location_with_context方法，传递更丰富的上下文信息
@@ -318,29 +361,127 @@ def llm_predict_para_type(text: str, format_agent: FormatAgent, para_meta: Dict
             next_content=next_para_content  # 传递下一个段落的内容
         )
 
-        # 获取位置信息
-        location = llm_response.get("location", "")
-
-        # 处理可能的无效位置格式，如 'others ()'
-        if location and ' ' in location:
-            # 只保留空格前的部分
-            location = location.split(' ')[0].strip()
-            print(f"Cleaned location from '{llm_response.get('location')}' to '{location}'")
-
-        # 检查是否是有效的枚举值
-        try:
-            llm_type = ParsedParaType(location)
-        except ValueError:
-            print(f"Invalid location value: {location}, using BODY as default")
-            llm_type = ParsedParaType.BODY
-
-        llm_confidence = float(llm_response.get("confidence", 0.5))
-        return llm_type, llm_confidence
+        return parse_location_response(llm_response, ParsedParaType.BODY)
 
+    except ProviderUnavailableError:
+        # 模型不可用时交由调用方保留原有类型，不静默降级为正文
+        raise
     except Exception as e:
         print(f"Error in LLM prediction: {e}, using BODY as default")
         return ParsedParaType.BODY, 0.5
 
+
+async def allm_predict_para_type(text: str, format_agent: FormatAgent, para_meta: Dict = None,
+                                 prev_para_type: Optional[ParsedParaType] = None,
+                                 next_para_type: Optional[ParsedParaType] = None,
+                                 next_para_content: str = "",
+                                 previous_types: List[Tuple[str, ParsedParaType]] = None) -> Tuple[ParsedParaType, float]:
+    """llm_predict_para_type 的异步版本，出错时向调用方抛出"""
+    if not isinstance(text, str):
+        text = str(text)
+    llm_response = await format_agent.apredict_location_with_context(
+        doc_content="",
+        fragment_str=text,
+        para_meta=para_meta,
+        prev_para_type=prev_para_type,
+        next_para_type=next_para_type,
+        prev_content=build_previous_context(previous_types),
+        next_content=next_para_content
+    )
+    return parse_location_response(llm_response, ParsedParaType.BODY)
+
+
+def verify_flagged_para_types(format_agent: FormatAgent, paragraph_manager: ParagraphManager,
+                              flagged: List[int]) -> List[int]:
+    """
+    复核一次分类中规则与大模型结论不一致的段落
+
+    分类已经完成，每个段落的上下文都可以直接取自分类结果，因此复核请求彼此独立，
+    通过异步执行器一次并发发出（使用分级路由的最后一级模型），全部返回后再合并
+
+    Args:
+        format_agent: 格式代理对象
+        paragraph_manager: 段落管理器
+        flagged: 需要复核的段落下标
+
+    Returns:
+        List[int]: 类型被修正的段落下标
+    """
+    paragraphs = paragraph_manager.paragraphs
+    flagged = sorted({i for i in flagged if 0 <= i < len(paragraphs)})
+    if not flagged:
+        return []
+
+    router = get_router(format_agent)
+    tier, agent = router.tiers[-1]
+    # 分类结果快照，复核请求的上下文都基于同一份结果
+    classified = [(para.content, para.type) for para in paragraphs]
+
+    def review(index: int):
+        prev_para_type = classified[index - 1][1] if index > 0 else None
+        if index + 1 < len(classified):
+            next_para_content, next_para_type = classified[index + 1]
+        else:
+            next_para_content, next_para_type = "", None
+        para = paragraphs[index]
+        return router.timed(tier, lambda: allm_predict_para_type(
+            para.content, agent, para.meta, prev_para_type, next_para_type,
+            next_para_content, classified[:index]))
+
+    print(f"复核 {len(flagged)}/{len(paragraphs)} 个规则与大模型结论不一致的段落")
+    results = get_runner().map(review, flagged)
+
+    corrected = []
+    for index, result in zip(flagged, results):
+        if isinstance(result, Exception):
+            print(f"Error reviewing paragraph {index}: {result}")
+            continue
+        predicted_type, confidence = result
+        current_type = paragraphs[index].type
+        if confidence >= router.threshold and predicted_type != current_type:
+            paragraph_manager.update_para(index, type=predicted_type)
+            corrected.append(index)
+            print(f"Updated paragraph {index} type from {current_type.value} to {predicted_type.value} with confidence {confidence:.2f}")
+    return corrected
+
+def get_router(format_agent: FormatAgent) -> CascadeRouter:
+    """返回格式代理的分级路由，未配置时创建只使用该代理的单级路由"""
+    if getattr(format_agent, 'router', None) is None:
+        format_agent.router = CascadeRouter([(format_agent.model, format_agent)])
+    return format_agent.router
+
+
+def cascade_predict_para_type(text: str, router: CascadeRouter, para_meta: Dict = None,
+                              prev_para_type: Optional[ParsedParaType] = None,
+                              next_para_type: Optional[ParsedParaType] = None,
+                              next_para_content: str = "",
+                              previous_types: List[Tuple[str, ParsedParaType]] = None,
+                              rule_type: Optional[ParsedParaType] = None) -> Tuple[ParsedParaType, float]:
+    """
+    通过分级路由预测段落类型：快速模型先预测，置信度不足或与规则类型不一致时升级
+
+    Args:
+        text: 段落文本内容
+        router: 分级路由
+        para_meta: 段落的元数据信息
+        prev_para_type: 上一个段落的类型
+        next_para_type: 下一个段落的类型
+        next_para_content: 下一个段落的内容
+        previous_types: 之前已判断过的所有段落的类型和内容
+        rule_type: 规则引擎给出的类型
+
+    Returns:
+        Tuple[ParsedParaType, float]: 段落类型和置信度
+    """
+    predicted_type, confidence, tier = router.predict(
+        lambda agent: llm_predict_para_type(text, agent, para_meta, prev_para_type, next_para_type,
+                                            next_para_content, previous_types),
+        rule_type)
+    if len(router.tiers) > 1:
+        print(f"段落类型由 {tier} 给出: {predicted_type.value} (confidence: {confidence:.2f})")
+    return predicted_type, confidence
+
+
 def remark_para_type_with_llm(doc_path: str, format_agent: FormatAgent, paragraph_manager: ParagraphManager) -> ParagraphManager:
     """
     使用纯大模型方法标注段落类型
@@ -362,6 +503,7 @@ def remark_para_type_with_llm(doc_path: str, format_agent: FormatAgent, paragrap
 
     # 存储已处理的段落类型和内容
     processed_paragraphs = []
+    router = get_router(format_agent)
 
     # 定义任务函数
     def process_paragraph(para_index: int, para: Dict, manager: ParagraphManager, processed_paras: List[Tuple[str, ParsedParaType]]):
@@ -396,15 +538,16 @@ def remark_para_type_with_llm(doc_path: str, format_agent: FormatAgent, paragrap
                 # 获取下一个段落的内容
                 next_para_content = manager.paragraphs[para_index + 1].content
 
-            # 使用纯大模型预测段落类型，传递已处理的段落信息
-            predicted_type, confidence = llm_predict_para_type(
-                para_string, format_agent, para_meta,
-                prev_para_type, next_para_type, next_para_content, processed_paras.copy()
+            # 使用纯大模型预测段落类型，传递已处理的段落信息；与规则类型不一致时升级到大模型
+            rule_type = manager.paragraphs[para_index].type if 0 <= para_index < len(manager.paragraphs) else None
+            predicted_type, confidence = cascade_predict_para_type(
+                para_string, router, para_meta,
+                prev_para_type, next_para_type, next_para_content, processed_paras.copy(), rule_type
             )
 
             # 更新段落类型，确保索引有效
             if 0 <= para_index < len(manager.paragraphs):
-                manager.paragraphs[para_index].type = predicted_type
+                manager.update_para(para_index, type=predicted_type)
                 print(f"Paragraph {para_index}: {para_string[:30]}... => {predicted_type.value} (confidence: {confidence:.2f})")
 
                 # 将当前处理的段落添加到已处理列表中
@@ -413,13 +556,14 @@ def remark_para_type_with_llm(doc_path: str, format_agent: FormatAgent, paragrap
                 print(f"Warning: Invalid paragraph index {para_index}, valid range is 0-{len(manager.paragraphs)-1}")
 
         except Exception as e:
-            # 如果解析失败，将段落类型设置为 BODY
+            # 如果解析失败，将段落类型设置为 BODY；模型不可用时保留规则判断的类型
             print(f"Error processing paragraph {para_index}: {para_string[:30] if para_string else 'No content'}... Error: {e}")
             try:
                 if 0 <= para_index < len(manager.paragraphs):
-                    manager.paragraphs[para_index].type = ParsedParaType.BODY
+                    if not isinstance(e, ProviderUnavailableError):
+                        manager.update_para(para_index, type=ParsedParaType.BODY)
                     # 即使出错，也将当前段落添加到已处理列表中
-                    processed_paras.append((para_string, ParsedParaType.BODY))
+                    processed_paras.append((para_string, manager.paragraphs[para_index].type))
                 else:
                     print(f"Cannot set paragraph type: Invalid index {para_index}")
             except Exception as inner_e:
@@ -430,72 +574,3 @@ def remark_para_type_with_llm(doc_path: str, format_agent: FormatAgent, paragrap
         process_paragraph(i, para, paragraph_manager, processed_paragraphs)
 
     return paragraph_manager
-
-def check_para_type(format_agent: FormatAgent, paragraph_manager: ParagraphManager) -> ParagraphManager:
-    """
-    检查段落类型是否正确，使用大模型验证（顺序处理版本）
-
-    Args:
-        format_agent: 格式代理对象
-        paragraph_manager: 段落管理器
-
-    Returns:
-        ParagraphManager: 检查后的段落管理器
-    """
-    try:
-        paragraph_manager.to_chinese_dict()
-    except Exception as e:
-        print(f"Error converting to Chinese dict in check_para_type: {e}")
-
-    # 存储已处理的段落类型和内容
-    processed_paragraphs = []
-
-    for i, para in enumerate(paragraph_manager.paragraphs):
-        try:
-            # 确保在使用前初始化变量
-            para_string = para.content if hasattr(para, 'content') else ""
-            para_meta = para.meta if hasattr(para, 'meta') else {}
-
-            # 防止索引错误
-            prev_para_type = None
-            next_para_type = None
-            next_para_content = ""
-
-            if i > 0 and i - 1 < len(paragraph_manager.paragraphs):
-                prev_para_type = paragraph_manager.paragraphs[i - 1].type
-
-            if i + 1 < len(paragraph_manager.paragraphs):
-                next_para_type = paragraph_manager.paragraphs[i + 1].type
-                next_para_content = paragraph_manager.paragraphs[i + 1].content
-
-            # 确保para_string是字符串
-            if not isinstance(para_string, str):
-                para_string = str(para_string)
-
-            # 检查段落类型是否正确
-            if format_agent.check_rule_based_prediction(para_string, para_meta, prev_para_type, next_para_type):
-                print(f"Paragraph {i}: {para_string[:30]}... is correct")
-                # 将当前段落添加到已处理列表中
-                processed_paragraphs.append((para_string, para.type))
-            else:
-                print(f"Paragraph {i}: {para_string[:30]}... is incorrect")
-
-                # 使用llm_predict_para_type函数重新预测段落类型
-                predicted_type, confidence = llm_predict_para_type(
-                    para_string, format_agent, para_meta,
-                    prev_para_type, next_para_type, next_para_content, processed_paragraphs.copy()
-                )
-
-                if confidence >= 0.8:
-                    paragraph_manager.paragraphs[i].type = predicted_type
-                    print(f"Updated paragraph {i} type to {predicted_type.value} with confidence {confidence:.2f}")
-
-                # 将当前段落添加到已处理列表中（使用更新后的类型）
-                processed_paragraphs.append((para_string, paragraph_manager.paragraphs[i].type))
-
-        except Exception as e:
-            print(f"Error in process_paragraph for index {i}: {str(e)}")
-            # 即使出错，也将当前段落添加到已处理列表中
-            processed_paragraphs.append((para_string, paragraph_manager.paragraphs[i].type))
-
-    return paragraph_manager
\ No newline at end of file
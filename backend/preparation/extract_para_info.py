@@ -2,6 +2,7 @@ import docx
 import xml.etree.ElementTree as ET
 import json, re, os, zipfile
 from backend.preparation.para_type import ParsedParaType, ParagraphManager
+from backend.utils.label_matcher import label_with_colon, colon_end
 from docx.shared import RGBColor
 from docx.oxml.ns import qn
 
@@ -435,6 +436,9 @@ def extract_para_format_info(doc_path, manager: ParagraphManager):
     manager = add_media_to_manager(manager, doc_path)
     print("已从文档中提取图片和表格信息")
 
+    # 记录原始段落元素到下标的映射，作为段落的稳定身份（持有元素引用以保证映射有效）
+    source_elements = {para._p: i for i, para in enumerate(doc.paragraphs)}
+
     # 预处理段落，将摘要等信息提取出来
     processed_paras = pre_process_paragraphs(doc)
     print(f"预处理后的段落数量：{len(processed_paras)}")
@@ -443,8 +447,18 @@ def extract_para_format_info(doc_path, manager: ParagraphManager):
     total_paras = len([p for p in processed_paras if p.text.strip()])
     processed_count = 0
 
+    # 当前段落在原始文档中的下标，拆分产生的段落沿用被拆分段落的下标
+    source_index = -1
+    source_part = 0
+
     # 遍历每个段落
     for para in processed_paras:
+        original_index = source_elements.get(para._p)
+        if original_index is not None:
+            source_index, source_part = original_index, 0
+        else:
+            source_part += 1
+
         # 如果段落文本为空，则跳过
         if not para.text.strip():
             continue
@@ -454,7 +468,10 @@ def extract_para_format_info(doc_path, manager: ParagraphManager):
             print(f"处理进度：{processed_count}/{total_paras} ({int(processed_count/total_paras*100)}%)")
 
         # 创建段落的元数据字典
-        meta_data = {}
+        meta_data = {
+            "source_index": source_index,
+            "source_part": source_part
+        }
         para_text_preview = para.text[:30] + ('...' if len(para.text) > 30 else '')
 
         # 获取段落和样式的XML数据
@@ -1330,6 +1347,9 @@ def split_paragraph(paragraph, split_pos):
 
     return new_para
 
+# 需要从正文中拆分出来的标签
+_SPLIT_LABELS = ('abstract_zh', 'abstract_en', 'keywords_zh', 'keywords_en')
+
 # 预处理段落，将摘要等信息提取出来
 def pre_process_paragraphs(doc):
     """
@@ -1343,8 +1363,7 @@ def pre_process_paragraphs(doc):
             if not text:
                 continue
             # 匹配中英文关键词（摘要、Abstract、关键词、Keywords）
-            pattern = re.compile(r'\b(摘要|Abstract|关键词|Keywords)\b\s*[:：]', re.IGNORECASE)
-            match = pattern.search(text)
+            match = label_with_colon(text, _SPLIT_LABELS)
             if not match:
                 continue
 
@@ -1361,7 +1380,7 @@ def pre_process_paragraphs(doc):
 
             # print(f"正在处理段落: {text}")
             # 计算分割位置（关键词后的位置）
-            split_pos = match.end()
+            split_pos = colon_end(text, match)
 
             # 分割段落
             new_para = split_paragraph(para, split_pos)
@@ -0,0 +1,203 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+# 视觉模型调用前的图片预处理：缩小到最长边上限、转换为 JPEG/WebP（少色图片为 PNG），
+# 相同内容的图片按哈希去重，处理结果缓存到磁盘，重复出现的图片只处理一次
+
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_FORMAT = 'JPEG'
+DEFAULT_QUALITY = 85
+
+# 输出格式 -> (MIME 类型, 扩展名)
+OUTPUT_FORMATS = {
+    'JPEG': ('image/jpeg', 'jpg'),
+    'WEBP': ('image/webp', 'webp'),
+}
+
+# 视觉模型接口普遍支持的原图格式，其他格式（BMP、TIFF 等）必须转换后发送
+_VISION_FORMATS = {'PNG', 'JPEG', 'GIF', 'WEBP'}
+
+# PNG 可以直接保存的图片模式
+_PNG_MODES = {'1', 'L', 'LA', 'P', 'RGB', 'RGBA'}
+
+# 无法转换时按原始数据发送，根据 PIL 识别的格式或文件头确定 MIME 类型
+_PIL_MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'GIF': 'image/gif',
+    'BMP': 'image/bmp',
+    'TIFF': 'image/tiff',
+    'WEBP': 'image/webp',
+}
+_MAGIC_MIME_TYPES = (
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'\x01\x00\x00\x00', 'image/emf'),
+)
+
+# 缓存文件可能使用的 MIME 类型，转换后的格式优先
+_CACHE_MIME_TYPES = tuple(dict.fromkeys(
+    [mime for mime, _ in OUTPUT_FORMATS.values()] + list(_PIL_MIME_TYPES.values())
+    + [mime for _, mime in _MAGIC_MIME_TYPES] + ['application/octet-stream']))
+
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'caches', 'images')
+
+# 内存缓存的图片数量上限，超过时淘汰最久未使用的图片，其余由磁盘缓存提供
+DEFAULT_MEMORY_CACHE_SIZE = 64
+
+_MEMORY_CACHE: "OrderedDict[Tuple[str, int, str], PreparedImage]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """预处理后的图片"""
+    # 原始图片内容的 sha256，用于去重和题注缓存
+    digest: str
+    mime_type: str
+    data: bytes
+
+    def base64(self) -> str:
+        return base64.b64encode(self.data).decode('utf-8')
+
+    @property
+    def data_url(self) -> str:
+        """可直接放入 image_url 的 data URL"""
+        return f"data:{self.mime_type};base64,{self.base64()}"
+
+
+def _sniff_mime_type(data: bytes) -> str:
+    for magic, mime_type in _MAGIC_MIME_TYPES:
+        if data.startswith(magic):
+            return mime_type
+    return 'application/octet-stream'
+
+
+def _convert(data: bytes, max_edge: int, output_format: str, quality: int) -> Tuple[str, bytes]:
+    """缩小并转换图片，PIL 无法打开时返回原始数据"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            source_format = image.format
+            within_limit = max(image.size) <= max_edge
+            image.thumbnail((max_edge, max_edge))
+            downscaled = image
+            if image.mode not in ('RGB', 'L'):
+                # 透明背景铺白，避免转换 JPEG 后变黑
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image = image.convert('RGBA')
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.split()[-1])
+                    image = background
+                else:
+                    image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, format=output_format, quality=quality)
+            mime_type, converted = OUTPUT_FORMATS[output_format][0], buffer.getvalue()
+
+            if len(converted) >= len(data):
+                # 截图、线条图等颜色较少的图片，无损 PNG 通常比有损格式更小
+                buffer = io.BytesIO()
+                (downscaled if downscaled.mode in _PNG_MODES else image).save(buffer, format='PNG', optimize=True)
+                if len(buffer.getvalue()) < len(converted):
+                    mime_type, converted = 'image/png', buffer.getvalue()
+    except Exception as e:
+        # EMF/WMF 等 PIL 无法处理的格式按原始数据发送
+        print(f"图片预处理失败，使用原始数据: {str(e)}")
+        return _sniff_mime_type(data), data
+
+    # 原图尺寸未超限、格式可直接发送且比转换结果小时不必替换
+    if within_limit and source_format in _VISION_FORMATS and len(data) <= len(converted):
+        return _PIL_MIME_TYPES[source_format], data
+    return mime_type, converted
+
+
+def prepare_image_bytes(data: bytes, max_edge: int = DEFAULT_MAX_EDGE, output_format: str = DEFAULT_FORMAT,
+                        quality: int = DEFAULT_QUALITY, cache_folder: Optional[str] = CACHE_FOLDER) -> PreparedImage:
+    """
+    预处理图片数据
+
+    Args:
+        data: 原始图片数据
+        max_edge: 最长边像素上限
+        output_format: 输出格式，JPEG 或 WEBP
+        quality: 有损压缩质量
+        cache_folder: 磁盘缓存目录，为 None 时只使用内存缓存
+
+    Returns:
+        PreparedImage: 预处理后的图片
+    """
+    output_format = output_format.upper()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的图片输出格式: {output_format}")
+
+    digest = hashlib.sha256(data).hexdigest()
+    cache_key = (digest, max_edge, output_format)
+    with _CACHE_LOCK:
+        cached = _MEMORY_CACHE.get(cache_key)
+        if cached is not None:
+            _MEMORY_CACHE.move_to_end(cache_key)
+    if cached is not None:
+        return cached
+
+    # 磁盘缓存：文件名包含原图哈希和处理参数，扩展名记录 MIME 类型
+    cache_name = f"{digest}_{max_edge}_{output_format.lower()}"
+    prepared = None
+    if cache_folder:
+        for mime_type in _CACHE_MIME_TYPES:
+            cache_path = os.path.join(cache_folder, f"{cache_name}.{mime_type.replace('/', '_')}")
+            if os.path.exists(cache_path):
+                with open(cache_path, 'rb') as f:
+                    prepared = PreparedImage(digest, mime_type, f.read())
+                break
+
+    if prepared is None:
+        mime_type, converted = _convert(data, max_edge, output_format, quality)
+        prepared = PreparedImage(digest, mime_type, converted)
+        if cache_folder:
+            try:
+                os.makedirs(cache_folder, exist_ok=True)
+                target = os.path.join(cache_folder, f"{cache_name}.{mime_type.replace('/', '_')}")
+                temp_path = f"{target}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(converted)
+                os.replace(temp_path, target)
+            except OSError as e:
+                print(f"写入图片缓存失败: {str(e)}")
+
+    with _CACHE_LOCK:
+        _MEMORY_CACHE[cache_key] = prepared
+        _MEMORY_CACHE.move_to_end(cache_key)
+        while len(_MEMORY_CACHE) > DEFAULT_MEMORY_CACHE_SIZE:
+            _MEMORY_CACHE.popitem(last=False)
+    return prepared
+
+
+def prepare_image(image_path: str, max_edge: int = DEFAULT_MAX_EDGE, output_format: str = DEFAULT_FORMAT,
+                  quality: int = DEFAULT_QUALITY, cache_folder: Optional[str] = CACHE_FOLDER) -> PreparedImage:
+    """
+    读取并预处理图片文件
+
+    Args:
+        image_path: 图片路径
+        max_edge: 最长边像素上限
+        output_format: 输出格式，JPEG 或 WEBP
+        quality: 有损压缩质量
+        cache_folder: 磁盘缓存目录，为 None 时只使用内存缓存
+
+    Returns:
+        PreparedImage: 预处理后的图片
+    """
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    return prepare_image_bytes(data, max_edge, output_format, quality, cache_folder)
@@ -1,8 +1,11 @@
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from collections.abc import MutableSequence
+import itertools
 import json
 import os
+from backend.utils.label_matcher import LabelHit, find_labels
 
 # 创建一个简单的translation_dict
 translation_dict = {
@@ -82,6 +85,106 @@ class ParaInfo:
             raise ValueError("Invalid paragraph type")
         self.meta = self.meta or {}
 
+    @property
+    def labels(self) -> Tuple[LabelHit, ...]:
+        """段落中的标签命中（摘要、关键词、题注前缀等）及其偏移，按内容缓存"""
+        return find_labels(self.content or '')
+
+class ParagraphList(MutableSequence):
+    """
+    写时复制的段落列表
+
+    派生版本与基础版本共享同一个底层列表，只在 _delta 中记录被替换的下标，
+    派生和替换的开销与修改数量成正比；插入、删除等结构性修改时才复制出独立的列表
+    """
+
+    def __init__(self, base: Iterable[ParaInfo] = None, delta: Dict[int, ParaInfo] = None, owned: bool = True):
+        self._base = base if isinstance(base, list) else list(base or [])
+        self._delta = delta or {}
+        # 底层列表是否只被当前对象持有
+        self._owned = owned
+
+    def _normalize(self, index: int) -> int:
+        length = len(self._base)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("list index out of range")
+        return index
+
+    def _materialize(self) -> None:
+        if self._owned and not self._delta:
+            return
+        delta = self._delta
+        self._base = [delta.get(i, para) for i, para in enumerate(self._base)] if delta else list(self._base)
+        self._delta = {}
+        self._owned = True
+
+    def snapshot(self) -> "ParagraphList":
+        """返回共享底层列表的副本，开销与已记录的修改数量成正比"""
+        self._owned = False
+        return ParagraphList(self._base, dict(self._delta), owned=False)
+
+    @property
+    def changed_indices(self) -> List[int]:
+        """相对于共享底层列表被替换的下标"""
+        return sorted(self._delta)
+
+    def __len__(self) -> int:
+        return len(self._base)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._base)))]
+        index = self._normalize(index)
+        if self._delta:
+            para = self._delta.get(index)
+            if para is not None:
+                return para
+        return self._base[index]
+
+    def __iter__(self) -> Iterator[ParaInfo]:
+        if not self._delta:
+            return iter(self._base)
+        delta = self._delta
+        return (delta.get(i, para) for i, para in enumerate(self._base))
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            self._materialize()
+            self._base[index] = value
+            return
+        index = self._normalize(index)
+        if self._owned and not self._delta:
+            self._base[index] = value
+        else:
+            self._delta[index] = value
+
+    def __delitem__(self, index) -> None:
+        self._materialize()
+        del self._base[index]
+
+    def insert(self, index: int, value: ParaInfo) -> None:
+        self._materialize()
+        self._base.insert(index, value)
+
+    def append(self, value: ParaInfo) -> None:
+        self._materialize()
+        self._base.append(value)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (ParagraphList, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ParagraphList({list(self)!r})"
+
+
+# 段落管理器版本号生成器，每次创建或派生都会得到新的版本号
+_VERSION_COUNTER = itertools.count(1)
+
+
 class ParagraphManager:
     """段落信息管理系统"""
 
@@ -90,6 +193,71 @@ class ParagraphManager:
         self.position = 0  # 添加文件指针位置跟踪
         self.figures = []  # 存储图片信息
         self.tables = []   # 存储表格信息
+        self.version = next(_VERSION_COUNTER)
+        self.parent_version: Optional[int] = None
+
+    @property
+    def paragraphs(self) -> ParagraphList:
+        return self._paragraphs
+
+    @paragraphs.setter
+    def paragraphs(self, value: Iterable[ParaInfo]) -> None:
+        self._paragraphs = value if isinstance(value, ParagraphList) else ParagraphList(value)
+
+    def derive(self, modifications: Dict[int, ParaInfo] = None) -> "ParagraphManager":
+        """
+        派生新版本：未修改的段落与当前版本共享同一个 ParaInfo 对象，只记录被替换的段落
+        :param modifications: 段落下标 -> 新的段落信息
+        :return: 新版本的段落管理器
+        """
+        derived = ParagraphManager()
+        derived.paragraphs = self._paragraphs.snapshot()
+        derived.position = self.position
+        derived.figures = list(self.figures)
+        derived.tables = list(self.tables)
+        derived.parent_version = self.version
+        for index, para in (modifications or {}).items():
+            derived.paragraphs[index] = para
+        return derived
+
+    def snapshot(self) -> "ParagraphManager":
+        """返回当前内容的只读快照（派生一个没有修改的版本）"""
+        return self.derive()
+
+    def update_para(self, index: int, **changes) -> ParaInfo:
+        """
+        替换指定段落的字段，不修改可能被其他版本共享的原 ParaInfo 对象
+        :param index: 段落下标
+        :param changes: 要修改的字段，如 content / type / meta
+        :return: 新的段落信息
+        """
+        para = replace(self.paragraphs[index], **changes)
+        self.paragraphs[index] = para
+        return para
+
+    def derive_from_dicts(self, para_dicts: List[Dict]) -> "ParagraphManager":
+        """
+        根据前端传回的段落字典派生新版本，内容、类型和元数据都未变化的段落直接共享
+        :param para_dicts: to_dict 格式的段落列表
+        :return: 新版本的段落管理器；段落数量变化时完整重建
+        """
+        if len(para_dicts) != len(self.paragraphs):
+            rebuilt = ParagraphManager()
+            for para_dict in para_dicts:
+                rebuilt.add_paragraph_from_dict(para_dict)
+            return rebuilt
+
+        modifications = {}
+        for index, (para, para_dict) in enumerate(zip(self.paragraphs, para_dicts)):
+            meta = {k: v for k, v in (para_dict.get("meta") or {}).items() if k != "extra_info"}
+            if (para_dict.get("type") == para.type.value and para_dict.get("content") == para.content
+                    and meta == self.convert_sets_to_lists(para.meta)):
+                continue
+            single = ParagraphManager()
+            single.add_paragraph_from_dict(para_dict)
+            if single.paragraphs:
+                modifications[index] = single.paragraphs[0]
+        return self.derive(modifications)
 
     def add_para(self, para_type: ParsedParaType, content: str, meta: Dict = None) -> None:
         """
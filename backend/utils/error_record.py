@@ -0,0 +1,84 @@
+# 结构化错误记录模块
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+# 错误种类 -> 消息模板（与原有的消息文本保持一致，翻译逻辑无需改动）
+MESSAGE_TEMPLATES = {
+    'mismatch': "'{key}' 不匹配: 要求 {expected}, 实际 {actual}",
+    'inconsistent': "'{key}' 不一致: 包含多个不同的值 {actual}",
+    'missing': "缺少必需字段: '{key}'",
+    'type': "字段类型不匹配: '{key}' 应为字典类型，实际为 {actual}",
+}
+
+# 错误种类 -> 默认严重程度
+DEFAULT_SEVERITY = {
+    'mismatch': 'error',
+    'inconsistent': 'warning',
+    'missing': 'error',
+    'type': 'error',
+}
+
+
+def canonical_value(value: Any) -> Any:
+    """将集合等无法直接序列化的值转换为稳定的 JSON 值"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(str(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(item) for item in value]
+    return value
+
+
+@dataclass
+class FormatError:
+    """
+    结构化的格式错误记录
+
+    字段路径、要求值和实际值以原始（未翻译）形式保存，修复器和标记器据此直接分派；
+    面向用户的消息只在序列化时按需生成
+    """
+    kind: str
+    field: str
+    location: str
+    expected: Any = None
+    actual: Any = None
+    para_id: Optional[str] = None
+    severity: str = None
+    _message: Optional[str] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.kind not in MESSAGE_TEMPLATES:
+            raise ValueError(f"未知的错误种类: {self.kind}")
+        self.severity = self.severity or DEFAULT_SEVERITY[self.kind]
+
+    @property
+    def key(self) -> str:
+        """字段路径中的最后一级字段名"""
+        return self.field.rsplit('.', 1)[-1]
+
+    @property
+    def message(self) -> str:
+        """渲染后的错误消息（首次访问时生成）"""
+        if self._message is None:
+            self._message = MESSAGE_TEMPLATES[self.kind].format(
+                key=self.key, expected=self.expected, actual=self.actual)
+        return self._message
+
+    def nest(self, key: str) -> "FormatError":
+        """把错误挂到上一级字段下，字段路径和位置都加上前缀"""
+        self.field = f"{key}.{self.field}"
+        self.location = f"{key}.{self.location}"
+        return self
+
+    def to_dict(self) -> Dict:
+        """转换为传输用的字典，保留 message/location 以兼容现有前端"""
+        result = {
+            'message': self.message,
+            'location': self.location,
+            'field': self.field,
+            'expected': canonical_value(self.expected),
+            'actual': canonical_value(self.actual),
+            'severity': self.severity,
+        }
+        if self.para_id is not None:
+            result['para_id'] = self.para_id
+        return result
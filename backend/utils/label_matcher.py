@@ -0,0 +1,198 @@
+# 标签检测模块：基于 Aho-Corasick 自动机的多模式匹配
+import re
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 标签类别 -> 触发该类别的关键词（英文关键词大小写不敏感）
+LABEL_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    'abstract_zh': ('摘要',),
+    'abstract_en': ('Abstract',),
+    'keywords_zh': ('关键词', '关键字'),
+    'keywords_en': ('Keywords', 'Key words'),
+    'references': ('参考文献', 'References', 'Bibliography'),
+    'acknowledgments': ('致谢', 'Acknowledgments', 'Acknowledgements'),
+    'figure': ('图', 'Figure', 'Fig', 'Fig.'),
+    'table': ('表', 'Table'),
+    'equation': ('式', '公式', 'Equation', 'Eq.'),
+}
+
+# 章节标题类标签（摘要、关键词、参考文献、致谢）
+HEADING_LABELS = ('abstract_zh', 'abstract_en', 'keywords_zh', 'keywords_en', 'references', 'acknowledgments')
+
+# 题注前缀类标签
+CAPTION_LABELS = ('figure', 'table', 'equation')
+
+# 题注编号，在题注前缀命中位置之后做锚定匹配：图3-1 / Table 2-4
+_CAPTION_NUMBER = re.compile(r'\s*\d+[-－]\d+')
+_COLON = re.compile(r'\s*[:：]')
+
+
+@dataclass(frozen=True)
+class LabelHit:
+    """一次标签命中"""
+    label: str
+    keyword: str
+    start: int
+    end: int
+
+
+class _Automaton:
+    """Aho-Corasick 自动机，构建一次后对每段文本做单次线性扫描"""
+
+    def __init__(self, keywords: Dict[str, Iterable[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[str, str, int]]] = [[]]
+
+        for label, words in keywords.items():
+            for word in words:
+                self._add(label, word)
+        self._build_fail_links()
+
+    def _add(self, label: str, word: str) -> None:
+        state = 0
+        for ch in word.lower():
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append((label, word, len(word)))
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def scan(self, text: str) -> List[Tuple[str, str, int, int]]:
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            lowered = ch.lower()
+            # 个别字符小写后会变为多个字符，保持原字符以免偏移错位
+            ch = lowered if len(lowered) == 1 else ch
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for label, word, length in self.output[state]:
+                hits.append((label, word, i - length + 1, i + 1))
+        return hits
+
+
+_AUTOMATON = _Automaton(LABEL_KEYWORDS)
+
+
+def _is_word_char(ch: str) -> bool:
+    # 只有 ASCII 字母数字构成英文单词边界，中文关键词不受边界约束
+    return ch.isascii() and ch.isalnum()
+
+
+@lru_cache(maxsize=8192)
+def find_labels(text: str) -> Tuple[LabelHit, ...]:
+    """
+    扫描文本中的所有标签命中，结果按文本缓存，分类器与检查器共享
+
+    Args:
+        text: 段落文本
+
+    Returns:
+        Tuple[LabelHit, ...]: 按起始位置排序的命中列表
+    """
+    if not text:
+        return ()
+
+    hits = []
+    for label, word, start, end in _AUTOMATON.scan(text):
+        # 英文关键词要求完整单词，避免 "Tables" 之类的误命中；题注前缀后可以直接跟编号，如 "Figure3-1"
+        if word[0].isascii() and word[0].isalnum():
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+        if word[-1].isascii() and word[-1].isalnum():
+            if end < len(text) and _is_word_char(text[end]) and not (label in CAPTION_LABELS and text[end].isdigit()):
+                continue
+        hits.append(LabelHit(label, text[start:end], start, end))
+
+    hits.sort(key=lambda hit: (hit.start, -(hit.end - hit.start)))
+    return tuple(hits)
+
+
+def leading_label(text: str, labels: Iterable[str] = None, hits: Tuple[LabelHit, ...] = None) -> Optional[LabelHit]:
+    """
+    返回位于文本开头（忽略前导空白）的标签命中
+
+    Args:
+        text: 段落文本
+        labels: 只考虑这些标签类别，默认全部
+        hits: 已有的命中结果，省略时调用 find_labels
+
+    Returns:
+        Optional[LabelHit]: 开头的命中，没有则返回 None
+    """
+    if hits is None:
+        hits = find_labels(text)
+    offset = len(text) - len(text.lstrip())
+    for hit in hits:
+        if hit.start > offset:
+            break
+        if hit.start == offset and (labels is None or hit.label in labels):
+            return hit
+    return None
+
+
+def label_with_colon(text: str, labels: Iterable[str] = HEADING_LABELS, hits: Tuple[LabelHit, ...] = None) -> Optional[LabelHit]:
+    """
+    返回第一个紧跟冒号的标签命中，例如 "摘要：" / "Keywords:"
+
+    Args:
+        text: 段落文本
+        labels: 只考虑这些标签类别，默认为章节标题类标签
+        hits: 已有的命中结果，省略时调用 find_labels
+
+    Returns:
+        Optional[LabelHit]: 命中，没有则返回 None
+    """
+    if hits is None:
+        hits = find_labels(text)
+    for hit in hits:
+        if hit.label in labels and _COLON.match(text, hit.end):
+            return hit
+    return None
+
+
+def colon_end(text: str, hit: LabelHit) -> int:
+    """返回标签后冒号结束的位置"""
+    match = _COLON.match(text, hit.end)
+    return match.end() if match else hit.end
+
+
+def caption_label(text: str, label: str, hits: Tuple[LabelHit, ...] = None) -> Optional[LabelHit]:
+    """
+    返回第一个后接 "x-y" 编号的题注前缀命中
+
+    Args:
+        text: 段落文本
+        label: 题注类别（figure / table / equation）
+        hits: 已有的命中结果，省略时调用 find_labels
+
+    Returns:
+        Optional[LabelHit]: 命中，没有则返回 None
+    """
+    if hits is None:
+        hits = find_labels(text)
+    for hit in hits:
+        if hit.label == label and _CAPTION_NUMBER.match(text, hit.end):
+            return hit
+    return None
+
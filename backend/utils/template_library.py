@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from backend.checkers.rule_plan import RULE_PLAN_VERSION, RulePlan, compile_rule_plan
+
+# 格式模板库：按模板 id 在 SQLite 中保存带版本的格式配置，写入时预先编译检查规则计划
+# 和格式化引擎的 w:rPr / w:pPr 模板，检查和排版直接使用编译结果
+
+DEFAULT_LIBRARY_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'caches', 'template_library.sqlite3')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    template_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    name TEXT,
+    config TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    rule_plan TEXT NOT NULL,
+    format_templates TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    PRIMARY KEY (template_id, version)
+)
+"""
+
+
+class TemplateNotFoundError(KeyError):
+    """模板或版本不存在"""
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def compile_format_templates(config: Dict[str, Any]) -> Dict[str, Any]:
+    """在草稿文档上预先生成配置对应的全部格式模板"""
+    # 延迟导入，只有写入模板时才需要 python-docx
+    from backend.editors.format_editor import FormattingEngine
+    engine = FormattingEngine(config)
+    engine.precompile()
+    return engine.export_templates()
+
+
+def diff_configs(old: Any, new: Any, path: str = '') -> List[Dict[str, Any]]:
+    """
+    比较两份配置，按字段路径列出差异
+
+    Args:
+        old: 旧配置
+        new: 新配置
+        path: 当前字段路径
+
+    Returns:
+        List[Dict[str, Any]]: 差异列表，每项包含 path、change（added / removed / changed）、old、new
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in list(old.keys()) + [key for key in new.keys() if key not in old]:
+            child = f"{path}.{key}" if path else key
+            if key not in new:
+                changes.append({'path': child, 'change': 'removed', 'old': old[key], 'new': None})
+            elif key not in old:
+                changes.append({'path': child, 'change': 'added', 'old': None, 'new': new[key]})
+            else:
+                changes.extend(diff_configs(old[key], new[key], child))
+        return changes
+    if old != new:
+        return [{'path': path, 'change': 'changed', 'old': old, 'new': new}]
+    return []
+
+
+@dataclass
+class CompiledTemplate:
+    """模板库中一个版本的配置及其编译结果"""
+    template_id: str
+    version: int
+    name: Optional[str]
+    config: Dict[str, Any]
+    rule_plan: RulePlan
+    format_templates: Dict[str, Any]
+    created_at: str
+    _engine: Any = field(default=None, repr=False, compare=False)
+
+    @property
+    def formatting_engine(self):
+        """加载了预生成模板的格式化引擎，每个版本只解析一次"""
+        if self._engine is None:
+            from backend.editors.format_editor import FormattingEngine
+            self._engine = FormattingEngine.from_templates(self.config, self.format_templates)
+        return self._engine
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'template_id': self.template_id,
+            'version': self.version,
+            'name': self.name,
+            'created_at': self.created_at,
+        }
+
+
+class TemplateLibrary:
+    """
+    格式模板库
+
+    同一模板 id 的配置内容变化时保存为新版本，内容不变时返回已有版本；
+    读取过的版本缓存在内存中，检查时不再解析配置或重新编译
+    """
+
+    def __init__(self, db_path: str = DEFAULT_LIBRARY_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._compiled: Dict[Tuple[str, int], CompiledTemplate] = {}
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，可在多个请求线程中使用
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _latest_version(self, conn: sqlite3.Connection, template_id: str) -> Optional[sqlite3.Row]:
+        return conn.execute(
+            "SELECT version, name, config_hash FROM templates WHERE template_id = ? ORDER BY version DESC LIMIT 1",
+            (template_id,)).fetchone()
+
+    @staticmethod
+    def _load_rule_plan(row: sqlite3.Row) -> RulePlan:
+        # 旧版本保存的规则计划格式不同，按保存的配置重新生成
+        data = json.loads(row['rule_plan'])
+        if data.get('version') != RULE_PLAN_VERSION:
+            return compile_rule_plan(json.loads(row['config']))
+        return RulePlan.from_dict(data)
+
+    def add(self, template_id: str, config: Dict[str, Any], name: Optional[str] = None) -> int:
+        """
+        保存模板配置，同时编译检查规则计划和格式模板
+
+        Args:
+            template_id: 模板 id
+            config: 格式配置字典
+            name: 模板名称（可选），默认沿用上一版本的名称
+
+        Returns:
+            int: 版本号，配置与最新版本相同时返回最新版本号
+        """
+        digest = config_hash(config)
+        with self._lock, self._connect() as conn:
+            latest = self._latest_version(conn, template_id)
+            if latest is not None and latest['config_hash'] == digest:
+                return latest['version']
+            version = latest['version'] + 1 if latest is not None else 1
+            if name is None and latest is not None:
+                name = latest['name']
+            rule_plan = compile_rule_plan(config)
+            format_templates = compile_format_templates(config)
+            conn.execute(
+                "INSERT INTO templates (template_id, version, name, config, config_hash, rule_plan, format_templates, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (template_id, version, name, json.dumps(config, ensure_ascii=False), digest,
+                 json.dumps(rule_plan.to_dict(), ensure_ascii=False), json.dumps(format_templates, ensure_ascii=False),
+                 datetime.now().isoformat(timespec='seconds')))
+        print(f"模板 {template_id} 已保存为版本 {version}")
+        return version
+
+    def list_templates(self) -> List[Dict[str, Any]]:
+        """列出所有模板的最新版本及版本数量"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT t.template_id, t.version, t.name, t.created_at, c.versions FROM templates t "
+                "JOIN (SELECT template_id, MAX(version) AS latest, COUNT(*) AS versions FROM templates GROUP BY template_id) c "
+                "ON t.template_id = c.template_id AND t.version = c.latest ORDER BY t.template_id").fetchall()
+        return [dict(row) for row in rows]
+
+    def versions(self, template_id: str) -> List[Dict[str, Any]]:
+        """列出模板的所有版本"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT template_id, version, name, created_at FROM templates WHERE template_id = ? ORDER BY version",
+                (template_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, template_id: str, version: Optional[int] = None) -> CompiledTemplate:
+        """
+        读取模板及其编译结果
+
+        Args:
+            template_id: 模板 id
+            version: 版本号，默认为最新版本
+
+        Returns:
+            CompiledTemplate: 模板配置和编译结果
+
+        Raises:
+            TemplateNotFoundError: 模板或版本不存在
+        """
+        if version is None:
+            # 只查询最新版本号，已编译的版本直接从内存返回
+            with self._connect() as conn:
+                latest = self._latest_version(conn, template_id)
+            if latest is None:
+                raise TemplateNotFoundError(f"模板不存在: {template_id}")
+            version = latest['version']
+
+        cached = self._compiled.get((template_id, version))
+        if cached is not None:
+            return cached
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM templates WHERE template_id = ? AND version = ?",
+                (template_id, version)).fetchone()
+        if row is None:
+            raise TemplateNotFoundError(f"模板不存在: {template_id} 版本 {version}")
+
+        key = (row['template_id'], row['version'])
+        with self._lock:
+            cached = self._compiled.get(key)
+            if cached is None:
+                cached = CompiledTemplate(
+                    template_id=row['template_id'],
+                    version=row['version'],
+                    name=row['name'],
+                    config=json.loads(row['config']),
+                    rule_plan=self._load_rule_plan(row),
+                    format_templates=json.loads(row['format_templates']),
+                    created_at=row['created_at'],
+                )
+                self._compiled[key] = cached
+        return cached
+
+    def diff(self, template_id: str, from_version: int, to_version: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        比较模板两个版本的配置
+
+        Args:
+            template_id: 模板 id
+            from_version: 旧版本号
+            to_version: 新版本号，默认为最新版本
+
+        Returns:
+            List[Dict[str, Any]]: 差异列表
+        """
+        old = self.get(template_id, from_version)
+        new = self.get(template_id, to_version)
+        return diff_configs(old.config, new.config)
+
+
+_LIBRARY: Optional[TemplateLibrary] = None
+_LIBRARY_LOCK = threading.Lock()
+
+
+def get_template_library() -> TemplateLibrary:
+    """获取进程共享的模板库"""
+    global _LIBRARY
+    with _LIBRARY_LOCK:
+        if _LIBRARY is None:
+            _LIBRARY = TemplateLibrary()
+        return _LIBRARY
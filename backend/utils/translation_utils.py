@@ -146,6 +146,10 @@ def translate_error_message(error: Dict[str, Any]) -> Dict[str, Any]:
     返回:
     翻译后的错误信息字典
     """
+    # 结构化错误记录在这里才渲染消息
+    if hasattr(error, 'to_dict'):
+        error = error.to_dict()
+
     if not isinstance(error, dict):
         return error
 
@@ -0,0 +1,37 @@
+import pytest
+from backend.agents.intent_classifier import IntentClassifier, INTENT_EXAMPLES
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    return IntentClassifier()
+
+
+def _intent(result):
+    return (result['agent'], result['function']) if result else None
+
+
+@pytest.mark.parametrize('intent, message', [
+    (intent, message) for intent, messages in INTENT_EXAMPLES.items() for message in messages
+])
+def test_examples_classify_to_own_intent(classifier, intent, message):
+    assert _intent(classifier.classify(message)) == intent
+
+
+@pytest.mark.parametrize('message, intent', [
+    ("提点修改建议", ("advice", "provide_advice")),
+    ("给我一些论文修改建议", ("advice", "provide_advice")),
+    ("怎么修改这段内容", ("editor", "enhance_content")),
+    ("这些格式错误怎么改", ("format", "provide_format_fix_suggestions")),
+])
+def test_rule_order(classifier, message, intent):
+    assert _intent(classifier.classify(message)) == intent
+
+
+@pytest.mark.parametrize('message', ["如何修改论文结构", "把标题改成黑体"])
+def test_uncertain_messages_go_to_llm(classifier, message):
+    assert classifier.classify(message) is None
+
+
+def test_long_messages_go_to_llm(classifier):
+    assert classifier.classify("检查格式" * 20) is None
@@ -0,0 +1,44 @@
+import os
+import sys
+import pytest
+
+pytest.importorskip('docx')
+# checker 模块按 backend 目录下的包名导入依赖
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from backend.checkers.checker import _recursive_check
+from backend.checkers.rule_plan import RulePlan, compile_rule_plan
+
+CONFIG = {
+    'body': {
+        'fonts': {'size': 'Unknown', 'zh_family': '宋体', 'en_family': 'Unknown', 'color': 'Unknown'},
+        'paragraph_format': {'alignment': 'Unknown', 'first_line_indent': 2},
+    },
+}
+
+
+def _keys(errors):
+    return sorted((err.kind, err.field) for err in errors)
+
+
+@pytest.mark.parametrize('fonts', [
+    {'size': {12, 14}, 'zh_family': {'宋体'}, 'en_family': {'Times New Roman'}, 'color': {'000000'}},
+    {'size': [12, 14], 'zh_family': ['宋体', '黑体'], 'en_family': ['Arial', 'Times New Roman'], 'color': ['000000', 'FF0000']},
+    {'size': {12}, 'zh_family': {'黑体'}, 'en_family': {'Arial'}, 'color': {'000000'}},
+])
+def test_compiled_plan_matches_raw_config(fonts):
+    meta = {'fonts': fonts, 'paragraph_format': {'alignment': 'center', 'first_line_indent': 2}}
+    raw = _recursive_check(meta, CONFIG['body'], '这是一段正文内容', 'p1')
+    compiled = _recursive_check(meta, compile_rule_plan(CONFIG).rules_for('body'), '这是一段正文内容', 'p1')
+    assert _keys(compiled) == _keys(raw)
+
+
+def test_unknown_size_still_reports_inconsistent_sizes():
+    meta = {'fonts': {'size': {12, 14}, 'zh_family': {'宋体'}}, 'paragraph_format': {'first_line_indent': 2}}
+    errors = _recursive_check(meta, compile_rule_plan(CONFIG).rules_for('body'), '这是一段正文内容', 'p1')
+    assert errors and {(err.kind, err.field) for err in errors} == {('inconsistent', 'fonts.size')}
+
+
+def test_plan_round_trip():
+    plan = compile_rule_plan(CONFIG)
+    assert RulePlan.from_dict(plan.to_dict()).rules_for('body') == CONFIG['body']